@@ -4,23 +4,45 @@ to run and test the app, run the console module
 in active or interactive mode
 """
 import cmd
+from collections.abc import Mapping
+from importlib import import_module
 import models
-from models.engine.file_storage import FileStorage
-from models.base_model import BaseModel
-from models.user import User
-from models.state import State
-from models.city import City
-from models.place import Place
-from models.amenity import Amenity
-from models.review import Review
-import json
-
-my_classes = {
-    "BaseModel": BaseModel, "User": User, "State": State, "City": City,
-    "Place": Place, "Amenity": Amenity, "Review": Review
+from models.engine.file_storage import ConflictError
+
+# the module of each model class, imported the first time it is used
+model_modules = {
+    "BaseModel": "models.base_model", "User": "models.user",
+    "State": "models.state", "City": "models.city", "Place": "models.place",
+    "Amenity": "models.amenity", "Review": "models.review"
 }
 
 
+class ModelClasses(Mapping):
+    """This class maps the class names to the model classes, importing
+    the module of a class the first time the class is looked up, so that
+    commands like help and quit do not import the models"""
+
+    def __getitem__(self, name):
+        """This method returns the model class called name"""
+        return getattr(import_module(model_modules[name]), name)
+
+    def __contains__(self, name):
+        """This method tells whether there is a model class called name,
+        without importing it"""
+        return name in model_modules
+
+    def __iter__(self):
+        """This method returns an iterator over the class names"""
+        return iter(model_modules)
+
+    def __len__(self):
+        """This method returns the number of model classes"""
+        return len(model_modules)
+
+
+my_classes = ModelClasses()
+
+
 class HBNBCommand(cmd.Cmd):
     """This class is the command interpreter for the airBnB clone app
 
@@ -41,6 +63,22 @@ class HBNBCommand(cmd.Cmd):
         """This method does nothing when the user hits enter"""
         return False
 
+    def __save(self, save):
+        """This method runs a save, printing the keys another process
+        changed too instead of failing if the save meets them
+
+        Args:
+            save (callable): the save to run
+        Returns:
+            bool: whether the changes were written
+        """
+        try:
+            save()
+        except ConflictError as error:
+            print(f"** {error} **")
+            return False
+        return True
+
     def do_create(self, args):
         """This method creates a new instance of a model
 
@@ -56,8 +94,8 @@ class HBNBCommand(cmd.Cmd):
             print("** class doesn't exist **")
             return
         new_instance = my_classes[args]()
-        new_instance.save()
-        print(new_instance.id)
+        if self.__save(new_instance.save):
+            print(new_instance.id)
 
     def do_show(self, args):
         """This method prints the string representation of an instance
@@ -105,9 +143,8 @@ class HBNBCommand(cmd.Cmd):
         if key not in models.storage.all():
             print("** no instance found **")
             return
-        # del not pop to make sure never trust garbage collector
-        del models.storage.all()[key]
-        models.storage.save()
+        models.storage.delete(models.storage.all()[key])
+        self.__save(models.storage.save)
 
     def do_all(self, args):
         """This method prints the string representation of all instances
@@ -122,8 +159,7 @@ class HBNBCommand(cmd.Cmd):
             print("** class doesn't exist **")
             return
         else:
-            print([str(obj) for obj in models.storage.all().values()
-                   if type(obj).__name__ == args])
+            print([str(obj) for obj in models.storage.query(args)])
 
     def do_update(self, args: str):
         """This method updates an instance
@@ -161,7 +197,7 @@ class HBNBCommand(cmd.Cmd):
         else:
             value = str(value)
         setattr(models.storage.all()[key], attr, value)
-        models.storage.save()
+        self.__save(models.storage.save)
 
     def do_count(self, args: str) -> int:
         """This method counts the number of instances of a class
@@ -172,14 +208,30 @@ class HBNBCommand(cmd.Cmd):
             int: the number of instances of the class
         """
         if not args or args == "":
-            print(len(models.storage.all()))
+            print(models.storage.count())
             return
         if args not in my_classes:
             print("** class doesn't exist **")
             return
         else:
-            print(len([obj for obj in models.storage.all().values()
-                       if type(obj).__name__ == args]))
+            print(models.storage.count(args))
+
+    def do_convert(self, args: str):
+        """This method rewrites the storage file in another format
+
+        Args:
+            args (str): the name of the format, json or binary
+        """
+        if not args:
+            print("** format name missing **")
+            return
+        if not hasattr(models.storage, "convert"):
+            print("** storage can't be converted **")
+            return
+        try:
+            models.storage.convert(args)
+        except ValueError:
+            print("** format doesn't exist **")
 
     def default(self, arg: str):
         """method handles the default behavior of the command interpreter"""
@@ -231,7 +283,7 @@ class HBNBCommand(cmd.Cmd):
                         return
                     for k, v in eval_dict.items():
                         setattr(models.storage.all()[key], k, v)
-                    models.storage.save()
+                    self.__save(models.storage.save)
                     return
                 # how to count how many " in a string
                 if arg.count('"') == 2:
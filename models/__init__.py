@@ -1,9 +1,28 @@
 #!/usr/bin/python3
-"""This is to make a singletos instance of the FileStorage
-class and reload the objects from the file to storage automatically
-when the module is imported"""
-from models.engine.file_storage import FileStorage
+"""This is to make a singletos instance of the storage engine
+and reload the objects to storage automatically when the module is
+imported
 
+HBNB_TYPE_STORAGE selects the engine: db for MySQL, sqlite for SQLite,
+kv for a dbm key-value database, FileStorage otherwise. FileStorage loads
+the objects the first time they are used, or on a background thread
+started now when HBNB_FILE_PRELOAD is on."""
+from os import getenv
 
-storage = FileStorage()
-storage.reload()
+
+if getenv("HBNB_TYPE_STORAGE") == "db":
+    from models.engine.db_storage import DBStorage
+    storage = DBStorage()
+    storage.reload()
+elif getenv("HBNB_TYPE_STORAGE") == "sqlite":
+    from models.engine.sqlite_storage import SQLiteStorage
+    storage = SQLiteStorage()
+    storage.reload()
+elif getenv("HBNB_TYPE_STORAGE") == "kv":
+    from models.engine.kv_storage import KVStorage
+    storage = KVStorage()
+    storage.reload()
+else:
+    from models.engine.file_storage import FileStorage
+    storage = FileStorage()
+    storage.defer_reload()
@@ -1,13 +1,18 @@
 #!/usr/bin/python3
 """This module contains the base model
 the parent for all models in airBnB clone app"""
+from os import getenv
 from uuid import uuid4
 from datetime import datetime
-from models import storage
-from sqlalchemy import Column, Integer, String, DateTime
-from sqlalchemy.ext.declarative import declarative_base
+import models
+
+if getenv("HBNB_TYPE_STORAGE") == "db":
+    # only the database engine needs SQLAlchemy, which is slow to import
+    from sqlalchemy.orm import declarative_base
+    Base = declarative_base()
+else:
+    Base = object
 
-Base = declarative_base()
 
 class BaseModel:
     """This class is the parent class for all models in the airBnB clone app"""
@@ -23,15 +28,32 @@ class BaseModel:
         """
         if kwargs:
             for key, value in kwargs.items():
-                if key in ["created_at", "updated_at"]:
-                    value = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+                if key in ["created_at", "updated_at"] and \
+                        not isinstance(value, datetime):
+                    value = datetime.fromisoformat(value)
                 if key != "__class__":
                     setattr(self, key, value)
         else:
             self.id = str(uuid4())
             self.created_at = datetime.now()
             self.updated_at = datetime.now()
-            storage.new(self)
+            models.storage.new(self)
+
+    def __setattr__(self, name: str, value) -> None:
+        """This method tells the storage engine that the model is about to
+        change, so the next save writes it, then sets the attribute
+
+        Mutating an attribute in place (appending to a list) is not seen,
+        assign the attribute again or call save() instead.
+        """
+        models.storage.touch(self)
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str) -> None:
+        """This method tells the storage engine that the model is about to
+        change, then deletes the attribute"""
+        models.storage.touch(self)
+        super().__delattr__(name)
 
     def __str__(self) -> str:
         """This method returns the string representation of the model"""
@@ -41,7 +63,7 @@ class BaseModel:
         """This method updates the updated_at attribute to the current time
         """
         self.updated_at = datetime.now()
-        storage.save()
+        models.storage.save()
 
     def to_dict(self) -> dict:
         """This method returns a dictionary representation of the model"""
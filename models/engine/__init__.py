@@ -1 +1,22 @@
 #!/usr/bin/python3
+"""This package contains the storage engines of the airBnB clone app
+and the helpers they share"""
+
+
+def _class_name(cls):
+    """This function returns the name of cls, which may be a class or
+    a class name"""
+    return cls if type(cls) is str else cls.__name__
+
+
+def _model_classes():
+    """This function returns the model classes by class name"""
+    from models.base_model import BaseModel
+    from models.user import User
+    from models.state import State
+    from models.city import City
+    from models.place import Place
+    from models.amenity import Amenity
+    from models.review import Review
+    return {cls.__name__: cls for cls in
+            (BaseModel, User, State, City, Place, Amenity, Review)}
@@ -1,10 +1,14 @@
 #!/usr/bin/python3
 """ new class for sqlAlchemy """
+import math
+from contextlib import contextmanager
 from os import getenv
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy import (create_engine)
+from sqlalchemy import (create_engine, or_)
 from sqlalchemy.ext.declarative import declarative_base
 from models.base_model import Base
+from models.engine.indexes import EARTH_RADIUS, bbox_around, haversine
+from models.engine.query import Query, to_sql
 from models.state import State
 from models.city import City
 from models.user import User
@@ -17,6 +21,7 @@ class DBStorage:
     """ create tables in environmental"""
     __engine = None
     __session = None
+    __batch = None
 
     def __init__(self):
         user = getenv("HBNB_MYSQL_USER")
@@ -54,21 +59,139 @@ class DBStorage:
                     dic[key] = elem
         return (dic)
 
+    def count(self, cls=None):
+        """returns the number of objects, of cls only if it is given
+        """
+        if cls:
+            if type(cls) is str:
+                cls = eval(cls)
+            return self.__session.query(cls).count()
+        lista = [State, City, User, Place, Review, Amenity]
+        return sum(self.__session.query(clase).count() for clase in lista)
+
+    def find(self, cls, **criteria):
+        """returns the objects of cls whose columns equal the criteria,
+        like find(City, state_id=state.id)
+        """
+        if type(cls) is str:
+            cls = eval(cls)
+        return self.__session.query(cls).filter_by(**criteria).all()
+
+    def range(self, cls, attr, low=None, high=None, limit=None,
+              reverse=False):
+        """returns the objects of cls whose column attr is between low
+        and high included, ordered by it
+        """
+        if type(cls) is str:
+            cls = eval(cls)
+        column = getattr(cls, attr)
+        query = self.__session.query(cls)
+        if low is not None:
+            query = query.filter(column >= low)
+        if high is not None:
+            query = query.filter(column <= high)
+        query = query.order_by(column.desc() if reverse else column)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    def within(self, bbox, cls="Place"):
+        """returns the objects of cls inside the (south, west, north, east)
+        box in degrees, which crosses the antimeridian if west > east
+        """
+        if type(cls) is str:
+            cls = eval(cls)
+        south, west, north, east = bbox
+        query = self.__session.query(cls).filter(
+            cls.latitude >= south, cls.latitude <= north)
+        if west <= east:
+            query = query.filter(cls.longitude >= west,
+                                 cls.longitude <= east)
+        else:
+            query = query.filter(or_(cls.longitude >= west,
+                                     cls.longitude <= east))
+        return query.all()
+
+    def nearest(self, lat, lon, k=1, radius=None, cls="Place"):
+        """returns the objects of cls nearest to (lat, lon), nearest first,
+        at most k of them and within radius km if they are given
+
+        the box around the point grows until it holds k objects, so that
+        the latitude and longitude indexes of the table do the filtering
+        """
+        limit = math.pi * EARTH_RADIUS if radius is None else radius
+        search = limit if k is None else min(limit, 10.0)
+        while True:
+            found = []
+            for obj in self.within(bbox_around(lat, lon, search), cls):
+                distance = haversine(lat, lon, obj.latitude, obj.longitude)
+                if distance <= search:
+                    found.append((distance, obj))
+            if search >= limit or len(found) >= k:
+                found.sort(key=lambda pair: pair[0])
+                return [obj for _, obj in found[:k]]
+            search = min(search * 4, limit)
+
+    def query(self, cls):
+        """returns a query over the objects of cls, compiled to SQL when
+        it is iterated or explained
+        """
+        if type(cls) is str:
+            cls = eval(cls)
+        return Query(cls, self.__run_query)
+
+    def __run_query(self, query):
+        """returns the SQL of a query and a lazy iterator over its rows
+        """
+        sql = to_sql(self.__session.query(query.cls), query)
+
+        def results():
+            """fetches the rows in batches as they are consumed"""
+            yield from sql.yield_per(100)
+        return str(sql), results()
+
     def new(self, obj):
         """add a new element in the table
         """
         self.__session.add(obj)
 
+    def touch(self, obj):
+        """models call it when an attribute changes, the session
+        already tracks changes itself
+        """
+
     def save(self):
-        """save changes
+        """save changes, once at the end of a batch inside one
         """
+        if self.__batch is not None:
+            self.__batch = True
+            return
         self.__session.commit()
 
+    @contextmanager
+    def batch(self):
+        """defers the save() calls made inside the block to one commit
+        when it exits, the session is rolled back if an exception escapes
+        """
+        if self.__batch is not None:
+            yield self
+            return
+        self.__batch = False
+        try:
+            yield self
+        except BaseException:
+            self.__session.rollback()
+            raise
+        finally:
+            saved, self.__batch = self.__batch, None
+        if saved:
+            self.__session.commit()
+
     def delete(self, obj=None):
         """delete an element in the table
         """
         if obj:
-            self.session.delete(obj)
+            self.__session.delete(obj)
 
     def reload(self):
         """configuration
@@ -78,6 +201,13 @@ class DBStorage:
         Session = scoped_session(sec)
         self.__session = Session()
 
+    def refresh(self):
+        """expires the loaded objects so that they are read again from
+        the database, which other processes may have changed
+        """
+        self.__session.expire_all()
+        return True
+
     def close(self):
         """ calls remove()
         """
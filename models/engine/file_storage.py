@@ -1,52 +1,1947 @@
 #!/usr/bin/python3
 """This module contains the file storage class for the airBnB clone app"""
-from json import dump, load, dumps, loads
+import atexit
+import hashlib
+import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from itertools import islice
+from time import monotonic
+from models.engine import _class_name, _model_classes
+from models.engine.indexes import (FOREIGN_KEYS, GEO_FIELDS, NUMERIC_FIELDS,
+                                   index_kinds)
+from models.engine.load_cache import LoadCache, LoadState
+from models.engine.locks import RWLock, Sequencer
+from models.engine.query import Query, describe, sort_key
+from models.engine.serializers import detect, serializers
+from models.engine.snapshot import SnapshotFile, write_snapshot
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks on Windows, the processes are not kept apart
+    fcntl = None
+
+
+def _env_flag(name):
+    """This function tells whether the environment variable name is on"""
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "on")
+
+
+class _LazyObjects(dict):
+    """This class is the dict of stored objects
+
+    A key may hold the decoded record of its object instead of the object
+    itself. The object is built from the record the first time the key is
+    looked up, or when the values are iterated, and replaces the record.
+
+    Iterating the dict, its keys, values or items goes over a list of
+    them taken under the read lock of the storage, so other threads may
+    change the storage meanwhile.
+
+    Setting or deleting a key goes through new() or delete() of the
+    storage, so that its buckets, indexes and changes to save follow.
+    The storage itself stores and removes keys with put() and drop().
+
+    Attributes:
+        pending (set): the keys still holding a record
+        build (callable): turns a key and its record into its object
+        lock (RWLock): the lock of the storage
+        mutex (RLock): serializes the builds, which readers run together
+        storage (FileStorage): the storage of the objects
+    """
+
+    def __init__(self, build, lock, storage):
+        """This method creates an empty dict building objects with build,
+        lock being the lock of storage"""
+        super().__init__()
+        self.pending = set()
+        self.build = build
+        self.lock = lock
+        self.mutex = threading.RLock()
+        self.storage = storage
+
+    def put_record(self, key, record):
+        """This method stores record under key without building it"""
+        dict.__setitem__(self, key, record)
+        self.pending.add(key)
+
+    def peek(self, key):
+        """This method returns the object or record of key, or None,
+        without building anything"""
+        return dict.get(self, key)
+
+    def __getitem__(self, key):
+        """This method returns the object of key, building it if needed"""
+        value = dict.__getitem__(self, key)
+        if key in self.pending:
+            with self.mutex:
+                value = dict.__getitem__(self, key)
+                if key in self.pending:
+                    value = self.build(key, value)
+                    dict.__setitem__(self, key, value)
+                    self.pending.discard(key)
+        return value
+
+    def put(self, key, value):
+        """This method stores the object value under key"""
+        dict.__setitem__(self, key, value)
+        self.pending.discard(key)
+
+    def drop(self, key):
+        """This method removes key"""
+        dict.__delitem__(self, key)
+        self.pending.discard(key)
+
+    def reset(self):
+        """This method removes every key"""
+        dict.clear(self)
+        self.pending.clear()
+
+    def __setitem__(self, key, value):
+        """This method adds the object value to the storage, key being
+        its key"""
+        if key != f"{value.__class__.__name__}.{value.id}":
+            raise ValueError(f"{key} is not the key of {value!r}")
+        self.storage.new(value)
+
+    def __delitem__(self, key):
+        """This method deletes the object of key from the storage"""
+        self.storage.delete(self[key])
+
+    def get(self, key, default=None):
+        """This method returns the object of key or default"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        """This method removes key and returns its object"""
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None):
+        """This method returns the object of key, storing default first
+        if key is missing"""
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """This method stores every object of the given mappings"""
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def popitem(self):
+        """This method removes and returns the last (key, object) pair"""
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        """This method deletes every object from the storage"""
+        for key in self.keys():
+            self.pop(key, None)
+
+    def build_all(self):
+        """This method builds the objects of every pending key"""
+        with self.mutex:
+            keys = list(self.pending)
+        for key in keys:
+            self.get(key)
+
+    def __iter__(self):
+        """This method returns an iterator over a list of the keys"""
+        return iter(self.keys())
+
+    def keys(self):
+        """This method returns a list of the keys"""
+        with self.lock.reading():
+            return list(dict.keys(self))
+
+    def values(self):
+        """This method returns a list of the objects, building them all"""
+        with self.lock.reading():
+            self.build_all()
+            return list(dict.values(self))
+
+    def items(self):
+        """This method returns a list of the (key, object) pairs, building
+        them all"""
+        with self.lock.reading():
+            self.build_all()
+            return list(dict.items(self))
+
+    def copy(self):
+        """This method returns a plain dict of the objects"""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        """This method compares the objects with another mapping"""
+        with self.lock.reading():
+            self.build_all()
+            return dict.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        """This method returns the representation of the objects"""
+        self.build_all()
+        return dict.__repr__(self)
+
+
+def _fsync_dir(path):
+    """This function syncs the directory of path, making a rename or a
+    creation of the file durable"""
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _stat(path):
+    """This function returns the (size, mtime, inode) fingerprint of the
+    file at path, or None if there is no such file"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def _digest(fd):
+    """This function returns a hash of the content of the open file fd,
+    leaving its position alone"""
+    digest = hashlib.blake2b(digest_size=16)
+    offset = 0
+    while True:
+        chunk = os.pread(fd, 1 << 20, offset)
+        if not chunk:
+            return digest.digest()
+        digest.update(chunk)
+        offset += len(chunk)
+
+
+def _version(value):
+    """This function returns the version of an object given its
+    updated_at, which save() and the first change since the last write
+    bump, as ISO text"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _mutable(obj):
+    """This function tells whether obj holds lists, dicts or sets, which
+    may change in place without touch() hearing of it"""
+    return any(isinstance(value, (list, dict, set))
+               for value in obj.__dict__.values())
+
+
+def _bump(obj):
+    """This function moves the updated_at of obj forward, giving it a
+    version no file holds yet"""
+    now = datetime.now()
+    updated_at = obj.__dict__.get("updated_at")
+    if isinstance(updated_at, datetime) and now <= updated_at:
+        now = updated_at + timedelta(microseconds=1)
+    obj.__dict__["updated_at"] = now
+
+
+class ConflictError(Exception):
+    """This class is the error of a save meeting objects it changed that
+    another process changed or deleted too since they were loaded
+
+    Attributes:
+        keys (list): the keys of those objects
+    """
+
+    def __init__(self, keys):
+        """This method creates the error of the conflicting keys"""
+        super().__init__("changed by another process: " + ", ".join(keys))
+        self.keys = keys
+
+
+# whether parallel saves can fork their workers, which then inherit the
+# objects to encode
+_can_fork = hasattr(os, "fork")
+# the encoding function and keys of the running parallel save
+_fork_job = None
+
+
+def _fork_pool(workers):
+    """This function returns a pool of workers forked from this process,
+    importing multiprocessing only once a big save or reload needs it"""
+    import multiprocessing
+    return multiprocessing.get_context("fork").Pool(workers)
+
+
+def _encode_chunk(bounds):
+    """This function encodes the keys between the bounds of the running
+    parallel save, in a forked worker"""
+    encode, keys = _fork_job
+    return [encode(key) for key in keys[bounds[0]:bounds[1]]]
+
+
+def _encode_parallel(encode, keys, workers):
+    """This function returns the encoded records of keys, encoded in
+    chunks by a pool of forked processes
+
+    The workers are forked once the keys are known, so they inherit the
+    objects instead of receiving them, and only send the encoded records
+    back, chunk after chunk in order.
+
+    Args:
+        encode (callable): returns the encoded record of a key
+        keys (list): the keys to encode
+        workers (int): the number of processes
+    """
+    global _fork_job
+    size = -(-len(keys) // (workers * 4))
+    chunks = [(start, start + size) for start in range(0, len(keys), size)]
+    _fork_job = (encode, keys)
+    try:
+        with _fork_pool(workers) as pool:
+            return [data for encoded in pool.imap(_encode_chunk, chunks)
+                    for data in encoded]
+    finally:
+        _fork_job = None
+
+
+def _parse_dates(record):
+    """This function turns the ISO dates of a decoded record into
+    datetimes, leaving the ones that do not parse to the model"""
+    for attr in ("created_at", "updated_at"):
+        value = record.get(attr)
+        if type(value) is str:
+            try:
+                record[attr] = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+
+
+def _read_shard(task):
+    """This function decodes a shard file in a forked worker
+
+    Args:
+        task (tuple): the name of the serializer and the path of the shard
+    Returns:
+        list: the (key, record) pairs of the shard, their dates parsed
+    """
+    name, path = task
+    serializer = serializers[name]
+    with open(path, "rb" if serializer.binary else "r") as file:
+        pairs = list(serializer.read_snapshot(file))
+    for _, record in pairs:
+        _parse_dates(record)
+    return pairs
 
 
 class FileStorage:
     """This class is the storage engine for the airBnB clone app
 
+    The store is a JSON snapshot (file.json) rewritten on save. When the
+    HBNB_FILE_JOURNAL environment variable is on, save() only appends the
+    changed records to a journal next to the snapshot (file.json.log) and
+    the snapshot is rewritten once the journal grows past the store size.
+    When HBNB_FILE_LAZY is on, reload() keeps the decoded records and an
+    object is only built when its key is looked up or iterated.
+
+    When HBNB_FILE_SHARDED is on, the snapshot is a directory next to the
+    file (file.json.d) holding one <class name>.json file per class, and a
+    save only rewrites the files of the classes that changed. Only one
+    layout is kept on disk: a storage loads the other one when its own is
+    missing, and its first snapshot removes it, file.json once the shards
+    are written or the shards once file.json is. convert() switches the
+    layout of a running storage.
+
+    Models report their attribute changes through touch(), so a save only
+    serializes the new, changed and deleted objects: the journal gets
+    those records alone, and a snapshot rewrite reuses the encoded records
+    kept from the previous save for every other object, except the built
+    objects holding lists or dicts, which may change in place.
+
+    When HBNB_FILE_WRITE_BEHIND is set to a number of milliseconds, save()
+    only schedules the write and returns. A background thread writes at
+    most that long after the first unsaved change, or as soon as there are
+    HBNB_FILE_WRITE_BEHIND_CHANGES of them (1000 by default), and pending
+    changes are written by flush(), close() and at interpreter exit.
+
+    Files are rewritten through a temporary file renamed over the old one,
+    so a crash never leaves a truncated store. HBNB_FILE_FSYNC sets when
+    the written data is forced to the disk: never (the default),
+    every_save, on_close (by close() or at interpreter exit) or interval
+    (by the first save coming HBNB_FILE_FSYNC_INTERVAL seconds, 1 by
+    default, after the last sync, and by close()).
+
+    Inside a batch() block save() calls are deferred to a single save at
+    the end of the block, and the changes made in the block are undone if
+    an exception escapes it.
+
+    When HBNB_FILE_SNAPSHOT names an indexed snapshot written by
+    dump_snapshot(), reload() maps it read-only instead of loading the
+    files, and an object is decoded from its bytes on first access. Such a
+    storage can not be saved.
+
+    The files are JSON unless HBNB_FILE_FORMAT names another serializer
+    (binary). The format of existing files is detected on reload, and
+    saves keep it when HBNB_FILE_FORMAT is not set. convert() rewrites
+    the storage in another format.
+
+    find() looks objects up by attribute values, answering from the hash
+    indexes of the foreign keys (FOREIGN_KEYS) and of the attributes given
+    to create_index(). range() returns objects in the order of a numeric
+    attribute, answering from its sorted index (NUMERIC_FIELDS), and
+    nearest() and within() look places up by position from a grid index
+    (GEO_FIELDS). Changed objects are indexed again on the next lookup.
+    query() plans declarative queries over those indexes.
+
+    The storage keeps the size, mtime and inode of the files it loaded or
+    wrote, and a hash of the ones it loaded. reload() does nothing while
+    they are unchanged, and refresh() is the cheap polling version of it.
+
+    The storage may be shared by threads. Lookups hold the read side of
+    its lock and run together, changes hold the write side and run alone.
+    A save encodes the changes under the write lock, so it writes a
+    consistent state, and writes the files after releasing it: other
+    threads look objects up and change them during the I/O, and the
+    writes land in the order of the saves.
+
+    Processes sharing the files take turns through an advisory lock on a
+    file next to them (file.json.lock): a save holds it exclusively, a
+    reload shared. Before writing, a save picks up what other processes
+    wrote since this storage last loaded or wrote the files, reading
+    only the new end of the journal when nothing else changed. An object
+    the save would write that another process changed or deleted too,
+    told by its updated_at, fails the save with a ConflictError; saving
+    again overwrites their version. touch() bumps the updated_at of an
+    object on its first change since it was last loaded or written, so
+    that a change saved without save() on the model is a new version
+    too. A storage that was never reloaded
+    owns the files and overwrites them.
+
+    A save having at least HBNB_FILE_PARALLEL_MIN records to encode
+    (10000 by default) encodes them in chunks on HBNB_FILE_WORKERS forked
+    processes (one per core by default, 1 to never fork), then writes
+    them in order as usual. Without fork the records are encoded in this
+    process, as threads would only take turns encoding them.
+
+    Likewise a reload of a sharded snapshot of at least
+    HBNB_FILE_PARALLEL_LOAD_MIN bytes (16 MiB by default) has the shard
+    files decoded by forked workers, one shard each, which also parse the
+    dates of the records. This process builds the models from the shards
+    in order, then replays the journal.
+
+    When HBNB_FILE_CACHE is on, a reload keeps a pickle of the records it
+    decoded next to the files (file.json.cache), keyed by their size,
+    mtime and hash. The next reload of the same files loads the pickle
+    instead of decoding them, and a reload finding the cache stale writes
+    it again from a background thread.
+
+    models loads its storage with defer_reload(): the objects are only
+    loaded by the first call using them, so commands like help start at
+    once. When HBNB_FILE_PRELOAD is on, a background thread starts loading
+    them right away, and the first call waits for it if it is not done.
+
     Attributes:
         __file_path (str): the path to the file where the objects are stored
         __objects (dict): the objects stored in the storage
+        __journal (bool): whether save() appends to the journal
+        __lazy (bool): whether reload() defers building the objects
+        __snapshot (SnapshotFile): the mapped snapshot, if read-only
+        __sharded (bool): whether the snapshot is split by class
+        __stale (set): the class names whose shard must be rewritten
+        __dirty (set): keys created, changed or deleted since the last save
+        __encoded (dict): key -> encoded record last written, for the keys
+            that did not change since
+        __serializer: the serializer of the files written by save()
+        __log_serializer: the serializer of the existing journal, if any
+        __classes (dict): class name -> keys of that class, in insertion
+            order (dicts double as ordered key sets)
+        __log_entries (int): the number of records in the journal
+        __batches (threading.local): the running batch of each thread,
+            its undo (dict: key -> state before the batch) and saved
+            (bool: save() was called in it) attributes being unset
+            outside batches
+        __saves (int): the number of saves prepared, telling a rollback
+            whether the changes it undoes may have been written
+        __lock (RWLock): shared by the lookups, held alone by the changes
+        __io (Sequencer): runs the file writes in the order of the saves,
+            and guards the fingerprints and the files to sync
+        __flush_cond (Condition): guards the flusher thread state
+        __flush_due (float): when the scheduled write is due, or None
+        __flushing (bool): whether the flusher thread is writing
+        __index_lock (RLock): serializes the index updates of the lookups
+        __fsync (str): the durability policy
+        __unsynced (set): the paths written and not synced yet
+        __fingerprint (dict): path -> (size, mtime, inode) of the files
+            the objects were loaded from or written to, None before the
+            first reload
+        __digests (dict): path -> hash of the files as they were loaded
+        __indexes (dict): class name -> (kind, attribute...) -> index
+        __unindexed (dict): class name -> keys changed since the indexes
+            of the class were last updated, in the order of the changes
+        __versions (dict): key -> updated_at of the objects as the files
+            held them when this storage last loaded or wrote them
+        __workers (int): the number of processes encoding a big save
+        __parallel_min (int): the number of records to encode from which
+            a save encodes them in parallel
+        __parallel_load_min (int): the size of the shard files from which
+            a reload decodes them in parallel
+        __cache (LoadCache): the fast-load cache, None if it is off
+        __cache_writer (Thread): the thread writing the cache, if any
+        __deferred (bool): whether the reload waits for the first use of
+            the objects
     """
+    __fsync_policies = ("never", "every_save", "on_close", "interval")
     __file_path = "file.json"
-    __objects = {}
+    __compact_min = 1000
+
+    def __init__(self):
+        """This method sets up the storage from the environment"""
+        self.__file_path = os.getenv("HBNB_FILE_PATH", FileStorage.__file_path)
+        self.__lock = RWLock()
+        self.__io = Sequencer()
+        self.__index_lock = threading.RLock()
+        self.__objects = _LazyObjects(self.__build, self.__lock, self)
+        self.__classes = {}
+        self.__journal = _env_flag("HBNB_FILE_JOURNAL")
+        self.__lazy = _env_flag("HBNB_FILE_LAZY")
+        self.__snapshot_path = os.getenv("HBNB_FILE_SNAPSHOT")
+        self.__snapshot = None
+        self.__sharded = _env_flag("HBNB_FILE_SHARDED")
+        self.__shard_dir = self.__file_path + ".d"
+        self.__stale = set()
+        self.__classes_by_name = None
+        self.__log_path = self.__file_path + ".log"
+        self.__lock_path = self.__file_path + ".lock"
+        self.__versions = {}
+        self.__dirty = set()
+        self.__encoded = {}
+        self.__log_entries = 0
+        self.__fixed_format = bool(os.getenv("HBNB_FILE_FORMAT"))
+        self.__serializer = None
+        self.__set_format(os.getenv("HBNB_FILE_FORMAT") or "json")
+        self.__log_serializer = None
+        self.__batches = threading.local()
+        self.__saves = 0
+        self.__flush_cond = threading.Condition()
+        self.__flush_delay = int(os.getenv("HBNB_FILE_WRITE_BEHIND", "0"))
+        self.__flush_changes = int(
+            os.getenv("HBNB_FILE_WRITE_BEHIND_CHANGES", "1000"))
+        self.__flush_due = None
+        self.__flushing = False
+        self.__flush_error = None
+        self.__flusher = None
+        self.__fsync = os.getenv("HBNB_FILE_FSYNC") or "never"
+        if self.__fsync not in FileStorage.__fsync_policies:
+            raise ValueError(f"unknown fsync policy: {self.__fsync}")
+        self.__fsync_interval = float(
+            os.getenv("HBNB_FILE_FSYNC_INTERVAL", "1"))
+        self.__workers = int(os.getenv("HBNB_FILE_WORKERS") or
+                             os.cpu_count() or 1)
+        self.__parallel_min = int(
+            os.getenv("HBNB_FILE_PARALLEL_MIN", "10000"))
+        self.__parallel_load_min = int(
+            os.getenv("HBNB_FILE_PARALLEL_LOAD_MIN", str(16 << 20)))
+        self.__cache = (LoadCache(self.__file_path + ".cache")
+                        if _env_flag("HBNB_FILE_CACHE") else None)
+        self.__cache_writer = None
+        self.__deferred = False
+        self.__synced_at = monotonic()
+        self.__unsynced = set()
+        self.__exit_hook = False
+        self.__fingerprint = None
+        self.__digests = {}
+        self.__indexes = {}
+        self.__unindexed = {}
+        for cls_name, attrs in FOREIGN_KEYS.items():
+            for attr in attrs:
+                self.create_index(cls_name, attr)
+        for cls_name, attrs in NUMERIC_FIELDS.items():
+            for attr in attrs:
+                self.create_index(cls_name, attr, kind="sorted")
+        for cls_name, attrs in GEO_FIELDS.items():
+            self.create_index(cls_name, *attrs, kind="geo")
+
+    def all(self, cls=None):
+        """This method returns all objects in storage
+
+        Args:
+            cls (type or str): only return the objects of this class
+        Returns:
+            dict: the stored objects by "<class name>.<id>" key, setting
+                or deleting a key of the dict of every object calling
+                new() or delete()
+        """
+        self.__ensure_loaded()
+        if cls is None:
+            return self.__objects
+        with self.__lock.reading():
+            bucket = self.__classes.get(_class_name(cls), {})
+            return {key: self.__objects[key] for key in bucket}
+
+    def count(self, cls=None):
+        """This method returns the number of objects in storage
+
+        Args:
+            cls (type or str): only count the objects of this class
+        """
+        self.__ensure_loaded()
+        if cls is None:
+            return len(self.__objects)
+        return len(self.__classes.get(_class_name(cls), ()))
+
+    def create_index(self, cls, *attrs, kind="hash"):
+        """This method indexes attributes of the objects of cls
+
+        Args:
+            cls (type or str): the class of the indexed objects
+            attrs (str): the indexed attributes
+            kind (str): hash for find(), sorted for range(), geo for
+                nearest() and within() given latitude and longitude
+        Raises:
+            ValueError: if there is no index of that kind
+        """
+        if kind not in index_kinds:
+            raise ValueError(f"unknown index kind: {kind}")
+        cls_name = _class_name(cls)
+        with self.__lock.writing():
+            indexes = self.__indexes.setdefault(cls_name, {})
+            if (kind,) + attrs in indexes:
+                return
+            indexes[(kind,) + attrs] = index_kinds[kind](*attrs)
+            self.__unindexed.setdefault(cls_name, {}).update(
+                dict.fromkeys(self.__classes.get(cls_name, ())))
+
+    def find(self, cls, **criteria):
+        """This method returns the objects of cls whose attributes equal
+        the criteria, like find(City, state_id=state.id)
+
+        The smallest set of keys an index gives for the criteria is
+        checked, or every object of cls if no criterion is indexed.
+        """
+        self.__ensure_loaded()
+        cls_name = _class_name(cls)
+        with self.__lock.reading():
+            self.__update_indexes(cls_name)
+            indexes = self.__indexes.get(cls_name, {})
+            keys = self.__classes.get(cls_name, {}).keys()
+            for attr, value in criteria.items():
+                if ("hash", attr) in indexes:
+                    matches = indexes[("hash", attr)].lookup(value)
+                    if len(matches) < len(keys):
+                        keys = matches
+            return [self.__objects[key] for key in list(keys)
+                    if all(self.__value(key, attr) == value
+                           for attr, value in criteria.items())]
+
+    def range(self, cls, attr, low=None, high=None, limit=None,
+              reverse=False):
+        """This method returns the objects of cls whose numeric attribute
+        attr is between low and high included, ordered by it
+
+        Args:
+            cls (type or str): the class of the objects
+            attr (str): the attribute to compare and order by
+            low (float): the lowest value, None for no lower bound
+            high (float): the highest value, None for no upper bound
+            limit (int): the most objects to return, None for all
+            reverse (bool): return the highest values first
+        """
+        self.__ensure_loaded()
+        cls_name = _class_name(cls)
+        with self.__lock.reading():
+            self.__update_indexes(cls_name)
+            index = self.__indexes.get(cls_name, {}).get(("sorted", attr))
+            if index is None:
+                index = index_kinds["sorted"](attr)
+                for key in self.__classes.get(cls_name, ()):
+                    index.add(key, self.__value(key, attr))
+            keys = islice(index.range(low, high, reverse), limit)
+            return [self.__objects[key] for key in keys]
 
-    def all(self):
-        """This method returns all objects in storage"""
-        return FileStorage.__objects
+    def nearest(self, lat, lon, k=1, radius=None, cls="Place"):
+        """This method returns the objects of cls nearest to a point,
+        nearest first
+
+        Args:
+            lat (float): the latitude of the point in degrees
+            lon (float): the longitude of the point in degrees
+            k (int): the most objects to return, None for all
+            radius (float): only return objects within radius km
+            cls (type or str): the class of the objects
+        """
+        self.__ensure_loaded()
+        with self.__lock.reading():
+            index = self.__geo_index(_class_name(cls))
+            return [self.__objects[key] for _, key in
+                    index.nearest(lat, lon, k, radius)]
+
+    def within(self, bbox, cls="Place"):
+        """This method returns the objects of cls inside a box
+
+        Args:
+            bbox (tuple): (south, west, north, east) in degrees, crossing
+                the antimeridian if west > east
+            cls (type or str): the class of the objects
+        """
+        self.__ensure_loaded()
+        with self.__lock.reading():
+            index = self.__geo_index(_class_name(cls))
+            return [self.__objects[key] for key in index.within(bbox)]
+
+    def query(self, cls):
+        """This method returns a query over the objects of cls
+
+        The query starts from the index matching the fewest keys for its
+        filters, or scans the class, walks a sorted index when it is
+        ordered by an indexed attribute, and builds the objects only as
+        it is iterated. explain() tells the plan.
+        """
+        return Query(cls, self.__run_query)
+
+    def __run_query(self, query):
+        """This method plans a query and returns the plan as text and a
+        lazy iterator over the results"""
+        self.__ensure_loaded()
+        cls_name = _class_name(query.cls)
+        with self.__lock.reading():
+            self.__update_indexes(cls_name)
+            steps, keys = self.__plan(cls_name, query)
+        if query.filters:
+            steps.append("check " + " and ".join(
+                describe(*condition) for condition in query.filters))
+        if query.max_results is not None:
+            steps.append(f"limit {query.max_results}")
+        return ", then ".join(steps), self.__results(query, keys)
+
+    def __plan(self, cls_name, query):
+        """This method returns the steps of the plan of a query and the
+        keys it has to check, in order"""
+        indexes = self.__indexes.get(cls_name, {})
+        bucket = self.__classes.get(cls_name, {})
+        steps = [f"scan {cls_name} ({len(bucket)} objects)"]
+        keys, ordered_by, scan = bucket.keys(), None, True
+        best = len(bucket)
+        for attr, op, value in query.filters:
+            hash_index = indexes.get(("hash", attr))
+            sorted_index = indexes.get(("sorted", attr))
+            if op == "eq" and hash_index is not None:
+                matches = hash_index.lookup(value)
+                if len(matches) < best:
+                    best, keys, ordered_by = len(matches), matches, None
+                    scan = False
+                    steps = [f"hash index {cls_name}.{attr} "
+                             f"({len(matches)} keys)"]
+            elif op in ("eq", "lt", "le", "gt", "ge") and \
+                    sorted_index is not None and \
+                    type(value) in (int, float) and value == value:
+                low = value if op in ("eq", "gt", "ge") else None
+                high = value if op in ("eq", "lt", "le") else None
+                count = sorted_index.count(low, high)
+                if count < best:
+                    best, ordered_by = count, (attr, low, high)
+                    keys, scan = None, False
+                    steps = [f"sorted index {cls_name}.{attr} "
+                             f"[{low}, {high}] ({count} keys)"]
+        if query.ordering is None:
+            if keys is None:
+                attr, low, high = ordered_by
+                keys = indexes[("sorted", attr)].range(low, high)
+            return steps, list(keys)
+        attr, reverse = query.ordering
+        sorted_index = indexes.get(("sorted", attr))
+        if ordered_by is not None and ordered_by[0] == attr:
+            _, low, high = ordered_by
+            steps.append("in index order")
+            return steps, list(sorted_index.range(low, high, reverse))
+        if keys is None:
+            _, low, high = ordered_by
+            keys = indexes[("sorted", ordered_by[0])].range(low, high)
+        elif scan and sorted_index is not None:
+            steps = [f"sorted index {cls_name}.{attr} "
+                     f"({len(bucket)} objects)"]
+            indexed = list(sorted_index.range(reverse=reverse))
+            others = sorted((key for key in bucket if key not in
+                             sorted_index),
+                            key=lambda key: sort_key(self.__value(key, attr)),
+                            reverse=reverse)
+            return steps, others + indexed if reverse else indexed + others
+        steps.append(f"sort by {attr}")
+        return steps, sorted(keys, reverse=reverse, key=lambda key:
+                             sort_key(self.__value(key, attr)))
+
+    def __results(self, query, keys):
+        """This method yields the objects of keys passing the filters of
+        query, building them one at a time"""
+        if query.max_results is not None and query.max_results <= 0:
+            return
+        count = 0
+        for key in keys:
+            with self.__lock.reading():
+                if key not in self.__objects or not query.matches(
+                        lambda attr: self.__value(key, attr)):
+                    continue
+                obj = self.__objects[key]
+            yield obj
+            count += 1
+            if count == query.max_results:
+                return
+
+    def __geo_index(self, cls_name):
+        """This method returns the up to date position index of cls_name,
+        or a new one if the class has none"""
+        self.__update_indexes(cls_name)
+        for index in self.__indexes.get(cls_name, {}).values():
+            if index.kind == "geo":
+                return index
+        index = index_kinds["geo"]()
+        for key in self.__classes.get(cls_name, ()):
+            index.add(key, *(self.__value(key, attr)
+                             for attr in index.attrs))
+        return index
+
+    def __reindex(self, key):
+        """This method records that the indexes must read key again"""
+        cls_name = key.partition(".")[0]
+        if cls_name in self.__indexes:
+            self.__unindexed[cls_name][key] = None
+
+    def __update_indexes(self, cls_name):
+        """This method indexes again the keys of cls_name that changed
+
+        Lookups run it together under the read lock, the first one doing
+        the work while the others wait for it.
+        """
+        with self.__index_lock:
+            keys = self.__unindexed.get(cls_name)
+            if not keys:
+                return
+            indexes = self.__indexes[cls_name].values()
+            for key in keys:
+                for index in indexes:
+                    index.discard(key)
+                if key in self.__objects:
+                    for index in indexes:
+                        index.add(key, *(self.__value(key, attr)
+                                         for attr in index.attrs))
+            keys.clear()
+
+    def __value(self, key, attr):
+        """This method returns the attribute attr of the object of key,
+        reading it from the record if the object is not built yet"""
+        value = self.__objects.peek(key)
+        if key not in self.__objects.pending:
+            return getattr(value, attr, None)
+        record = self.__record(key, value)
+        if attr in record:
+            value = record[attr]
+            if attr in ("created_at", "updated_at") and type(value) is str:
+                # as the model decodes them, for comparing with built ones
+                value = datetime.fromisoformat(value)
+            return value
+        if self.__classes_by_name is None:
+            self.__classes_by_name = _model_classes()
+        return getattr(self.__classes_by_name[record["__class__"]], attr,
+                       None)
 
     def new(self, obj):
         """This method adds a new object to storage"""
+        self.__ensure_loaded()
+        key = f"{obj.__class__.__name__}.{obj.id}"
+        with self.__lock.writing():
+            self.__remember(key)
+            if key in self.__versions and self.__versions[key] == \
+                    _version(obj.__dict__.get("updated_at")):
+                # the version of the files would hide the coming changes
+                _bump(obj)
+            self.__put(key, obj)
+            self.__mark(key)
+
+    def touch(self, obj):
+        """This method marks obj as changed if it is the stored object
+        of its key, models call it right before one of their attributes
+        is set or deleted
+
+        Objects marked already since the last save, and kept already by
+        the running batch of the thread, return without taking the lock.
+        """
+        key = f"{obj.__class__.__name__}.{obj.__dict__.get('id')}"
+        if self.__objects.peek(key) is not obj:
+            # objects being built or not stored do not take the lock
+            return
+        undo = getattr(self.__batches, "undo", None)
+        if (undo is None or key in undo) and self.__marked(key):
+            return
+        with self.__lock.writing():
+            if self.__objects.peek(key) is obj:
+                self.__remember(key)
+                if key not in self.__dirty:
+                    # a new version, so that the other processes see it
+                    _bump(obj)
+                self.__mark(key)
+
+    def delete(self, obj=None):
+        """This method removes obj from storage if it is stored"""
+        self.__ensure_loaded()
+        if obj is None:
+            return
         key = f"{obj.__class__.__name__}.{obj.id}"
-        FileStorage.__objects[key] = obj
+        with self.__lock.writing():
+            self.__remember(key)
+            if self.__pop(key):
+                self.__mark(key)
+
+    @contextmanager
+    def batch(self):
+        """This method returns a context manager deferring the save()
+        calls made inside it to one save when it exits
+
+        If an exception escapes the block, the objects created, changed
+        or deleted in it are restored as they were and nothing is saved.
+        Nested blocks join the outermost one. A batch is the thread's
+        own: the changes and saves of the other threads are neither
+        deferred nor undone by it.
+        """
+        self.__ensure_loaded()
+        batch = self.__batches
+        if getattr(batch, "undo", None) is not None:
+            yield self
+            return
+        with self.__lock.writing():
+            batch.undo, batch.saved = {}, False
+            dirty, saves = set(self.__dirty), self.__saves
+        try:
+            yield self
+        except BaseException:
+            with self.__lock.writing():
+                self.__rollback(batch.undo, dirty, saves)
+            raise
+        finally:
+            batch.undo = None
+        if batch.saved:
+            self.save()
+
+    def __remember(self, key):
+        """This method keeps the state of key before its first change in
+        the running batch of the thread"""
+        undo = getattr(self.__batches, "undo", None)
+        if undo is None or key in undo:
+            return
+        if key not in self.__objects:
+            undo[key] = None
+            return
+        value = self.__objects.peek(key)
+        if key in self.__objects.pending:
+            undo[key] = (value, None)
+        else:
+            undo[key] = (value, value.__dict__.copy())
+
+    def __rollback(self, undo, dirty, saves):
+        """This method restores the states kept in undo by a batch
+
+        The restored keys stay to write if they were before the batch,
+        or if a save of another thread may have written their changes.
+
+        Args:
+            undo (dict): key -> state before the batch
+            dirty (set): the keys to write when the batch began
+            saves (int): the number of saves prepared when it began
+        """
+        for key, saved in undo.items():
+            self.__pop(key)
+            if saved is None:
+                continue
+            value, state = saved
+            if state is None:
+                self.__objects.put_record(key, value)
+                cls_name = key.partition(".")[0]
+                self.__classes.setdefault(cls_name, {})[key] = None
+                self.__reindex(key)
+            else:
+                value.__dict__.clear()
+                value.__dict__.update(state)
+                self.__put(key, value)
+            if key in dirty or self.__saves != saves:
+                self.__mark(key)
+            else:
+                self.__dirty.discard(key)
+
+    def __marked(self, key):
+        """This method tells whether key is to write and to index again
+        already, so that marking it would change nothing"""
+        unindexed = self.__unindexed.get(key.partition(".")[0])
+        return key in self.__dirty and (unindexed is None or
+                                        key in unindexed)
+
+    def __mark(self, key):
+        """This method records that key must be written by the next save"""
+        self.__dirty.add(key)
+        self.__encoded.pop(key, None)
+        self.__stale.add(key.partition(".")[0])
+        self.__reindex(key)
+
+    def __put(self, key, obj):
+        """This method stores obj under key and in its class bucket"""
+        self.__objects.put(key, obj)
+        self.__encoded.pop(key, None)
+        self.__classes.setdefault(key.partition(".")[0], {})[key] = None
+        self.__reindex(key)
+
+    def __put_record(self, key, record):
+        """This method stores the decoded record of key, building its
+        object now unless the storage is lazy"""
+        if self.__lazy:
+            self.__objects.put_record(key, record)
+            self.__encoded.pop(key, None)
+            self.__classes.setdefault(key.partition(".")[0], {})[key] = None
+            self.__reindex(key)
+        else:
+            self.__put(key, self.__build(key, record))
+
+    def __update_record(self, key, record):
+        """This method stores the decoded record of key, updating the
+        object of key in place if it is built already, so that the
+        references to it keep reporting their changes"""
+        obj = self.__objects.peek(key)
+        if obj is None or key in self.__objects.pending:
+            self.__put_record(key, record)
+            return
+        fresh = self.__build(key, record)
+        obj.__dict__.clear()
+        obj.__dict__.update(fresh.__dict__)
+        self.__encoded.pop(key, None)
+        self.__reindex(key)
+
+    def __pop(self, key):
+        """This method removes key from storage and tells if it was there"""
+        if key not in self.__objects:
+            return False
+        self.__objects.drop(key)
+        self.__encoded.pop(key, None)
+        self.__reindex(key)
+        bucket = self.__classes[key.partition(".")[0]]
+        del bucket[key]
+        if not bucket:
+            del self.__classes[key.partition(".")[0]]
+        return True
+
+    def __record(self, key, record):
+        """This method returns the record of a key not built yet, decoding
+        it from the snapshot if the storage is read-only"""
+        if self.__snapshot is not None and record is None:
+            return self.__snapshot.record(key)
+        return record
+
+    def __build(self, key, record):
+        """This method builds the model object of a decoded record"""
+        if self.__classes_by_name is None:
+            self.__classes_by_name = _model_classes()
+        record = self.__record(key, record)
+        return self.__classes_by_name[record["__class__"]](**record)
+
+    def __set_format(self, name):
+        """This method makes save() write the files in the format name
+
+        Raises:
+            ValueError: if there is no serializer called name
+        """
+        if name not in serializers:
+            raise ValueError(f"unknown storage format: {name}")
+        if self.__serializer is not serializers[name]:
+            self.__serializer = serializers[name]
+            self.__encoded.clear()
+
+    def convert(self, name=None, sharded=None):
+        """This method rewrites the whole storage in the format name and
+        the layout sharded, and keeps saving in them
+
+        Args:
+            name (str): the name of a serializer, json or binary, None to
+                keep the format
+            sharded (bool): whether to split the snapshot by class, None
+                to keep the layout
+        Raises:
+            ValueError: if there is no serializer called name
+        """
+        self.__ensure_loaded()
+        with self.__lock.writing():
+            if name is not None:
+                self.__set_format(name)
+                self.__fixed_format = True
+            if sharded is not None:
+                self.__sharded = bool(sharded)
+            self.__stale.update(self.__classes)
+        with self.__flush_cond:
+            self.__flush_due = None
+        self.__save(rewrite=True)
 
     def save(self):
-        """This method saves the objects in storage to a file"""
-        with open(FileStorage.__file_path, "w") as file:
-            obj_dict = {key: obj.to_dict() for key, obj in
-                        FileStorage.__objects.items()}
-            dump(obj_dict, file)
+        """This method saves the objects in storage to a file
 
-    def reload(self):
-        """This method reloads the objects from the file to storage"""
+        In journal mode only the records changed since the last save are
+        appended, until the journal is worth compacting into the snapshot.
+        In write-behind mode the write is only scheduled.
+        """
+        self.__ensure_loaded()
+        if self.__snapshot is not None:
+            raise PermissionError("the storage is a read-only snapshot")
+        with self.__lock.writing():
+            if getattr(self.__batches, "undo", None) is not None:
+                self.__batches.saved = True
+                return
+            if self.__flush_delay > 0:
+                self.__schedule()
+                return
+        self.__save()
+
+    def __schedule(self):
+        """This method schedules a write by the flusher thread"""
+        with self.__flush_cond:
+            if self.__flusher is None:
+                self.__flusher = threading.Thread(
+                    target=self.__flush_loop, name="FileStorage flusher",
+                    daemon=True)
+                self.__flusher.start()
+                self.__hook_exit()
+            if self.__flush_due is None:
+                self.__flush_due = monotonic() + self.__flush_delay / 1000
+            if len(self.__dirty) >= self.__flush_changes:
+                self.__flush_due = 0
+            self.__flush_cond.notify()
+
+    def __flush_loop(self):
+        """This method is the flusher thread, writing the scheduled saves
+        until close() sets the flusher to None"""
+        me = threading.current_thread()
+        while True:
+            with self.__flush_cond:
+                while self.__flusher is me:
+                    if self.__flush_due is None:
+                        self.__flush_cond.wait()
+                        continue
+                    delay = self.__flush_due - monotonic()
+                    if delay <= 0:
+                        break
+                    self.__flush_cond.wait(delay)
+                if self.__flusher is not me:
+                    return
+                self.__flush_due, self.__flushing = None, True
+            error = None
+            try:
+                self.__save()
+            except Exception as exc:
+                error = exc
+            with self.__flush_cond:
+                self.__flushing = False
+                if error is not None:
+                    self.__flush_error = error
+                self.__flush_cond.notify_all()
+
+    def __hook_exit(self):
+        """This method makes the interpreter write and sync the pending
+        changes when it exits"""
+        with self.__flush_cond:
+            if not self.__exit_hook:
+                self.__exit_hook = True
+                atexit.register(self.__at_exit)
+
+    def __at_exit(self):
+        """This method writes the scheduled save and syncs the files"""
+        self.flush()
+        with self.__io.turn(self.__io.ticket()):
+            self.__sync()
+
+    @contextmanager
+    def __exclusive(self, lock_files=False):
+        """This method returns a context manager holding the turn of the
+        file I/O, once the writes of the previous saves are done, and the
+        write lock
+
+        The turn is always taken before the write lock: a thread holding
+        the write lock must not wait for a turn.
+
+        Args:
+            lock_files (bool): hold the lock of the files shared too
+        """
+        with self.__io.turn(self.__io.ticket()):
+            with self.__file_lock(shared=True) if lock_files else \
+                    nullcontext(), self.__lock.writing():
+                yield
+
+    @contextmanager
+    def __file_lock(self, shared=False):
+        """This method returns a context manager holding the advisory lock
+        of the files, kept apart from the other processes
+
+        The shared lock of a reload opens the lock file read-only, and is
+        skipped if the file is missing and can not be created, so that a
+        process which can not write next to the files still reads them.
+        """
+        if fcntl is None or self.__snapshot_path:
+            yield
+            return
+        fd = self.__open_lock(shared)
+        if fd is None:
+            yield
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+
+    def __open_lock(self, shared):
+        """This method opens the lock file, returning None if a shared
+        lock can not open it"""
+        if not shared:
+            return os.open(self.__lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            return os.open(self.__lock_path, os.O_RDONLY)
+        except FileNotFoundError:
+            pass
+        except PermissionError:
+            return None
+        try:
+            return os.open(self.__lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return None
+
+    def __written(self, path, file=None):
+        """This method applies the durability policy to a file just
+        written, file being still open for an append"""
+        if self.__fsync == "never":
+            return
+        if self.__fsync == "every_save":
+            if file is not None:
+                file.flush()
+                os.fsync(file.fileno())
+            _fsync_dir(path)
+            return
+        self.__unsynced.add(path)
+        self.__hook_exit()
+        if self.__fsync == "interval" and \
+                monotonic() - self.__synced_at >= self.__fsync_interval:
+            if file is not None:
+                file.flush()
+            self.__sync()
+
+    def __sync(self):
+        """This method syncs the files written since the last sync"""
+        for path in self.__unsynced:
+            try:
+                with open(path, "rb") as file:
+                    os.fsync(file.fileno())
+            except FileNotFoundError:
+                pass
+            _fsync_dir(path)
+        self.__unsynced.clear()
+        self.__synced_at = monotonic()
+
+    @contextmanager
+    def __replace(self, path, serializer=None):
+        """This method returns a context manager writing the file at path
+        through a temporary file renamed over it on success"""
+        serializer = serializer or self.__serializer
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path) or ".",
+            prefix=os.path.basename(path) + ".", suffix=".tmp")
         try:
-            from models.base_model import BaseModel
-            from models.user import User
-            from models.state import State
-            from models.city import City
-            from models.place import Place
-            from models.amenity import Amenity
-            from models.review import Review
-            try:
-                with open(FileStorage.__file_path, "r") as file:
-                    obj_dict = load(file)
-                    for key, obj in obj_dict.items():
-                        cls_name = obj["__class__"]
-                        cls_obj = eval(cls_name)(**obj)
-                        FileStorage.__objects[key] = cls_obj
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(tmp_path, mode)
+            with os.fdopen(fd, "wb" if serializer.binary else "w") as file:
+                yield file
+                if self.__fsync == "every_save":
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
             except FileNotFoundError:
                 pass
-        except ImportError:
+            raise
+        self.__written(path)
+
+    def flush(self, wait=True):
+        """This method writes the save scheduled in write-behind mode
+
+        Args:
+            wait (bool): write now and return once the data is written,
+                or only ask the flusher thread to write as soon as it can
+        Raises:
+            Exception: the last error met by the flusher thread, if any
+        """
+        due = False
+        with self.__flush_cond:
+            if wait:
+                while self.__flushing:
+                    self.__flush_cond.wait()
+                due = self.__flush_due is not None
+                self.__flush_due = None
+            elif self.__flush_due is not None:
+                self.__flush_due = 0
+                self.__flush_cond.notify()
+        if due:
+            self.__save()
+        with self.__flush_cond:
+            error, self.__flush_error = self.__flush_error, None
+        if error is not None:
+            raise error
+
+    def __save(self, rewrite=False):
+        """This method writes the changes to the files
+
+        The saves of the threads take turns, holding the lock of the
+        files. The changes of the other processes are picked up and the
+        records encoded under the write lock, then the files are written
+        once it is released. If the write fails, the changes are left to
+        the next save.
+
+        Args:
+            rewrite (bool): rewrite the snapshot even in journal mode
+        Raises:
+            ConflictError: if objects to write were changed by another
+                process too, nothing being written
+        """
+        with self.__io.turn(self.__io.ticket()), self.__file_lock():
+            with self.__lock.writing():
+                conflicts = self.__merge()
+                if conflicts:
+                    raise ConflictError(conflicts)
+                pending = self.__log_entries + len(self.__dirty)
+                same_format = self.__log_serializer in (None,
+                                                        self.__serializer)
+                if not rewrite and self.__journal and same_format and \
+                        pending <= max(len(self.__objects),
+                                       FileStorage.__compact_min):
+                    write, undo = self.__prepare_journal()
+                else:
+                    write, undo = self.__prepare_snapshot()
+                self.__saves += 1
+            try:
+                write()
+            except BaseException:
+                with self.__lock.writing():
+                    undo()
+                raise
+
+    def __merge(self):
+        """This method picks up the changes other processes wrote to the
+        files since this storage last loaded or wrote them
+
+        Returns:
+            list: the keys changed both here and by another process, whose
+                version becomes theirs so that saving again keeps ours
+        """
+        if self.__fingerprint is None or self.__unchanged(check_hash=True):
+            return []
+        changes = self.__read_journal_end()
+        if changes is None:
+            changes = self.__read_files()
+        conflicts = []
+        for key, record in changes.items():
+            version = None if record is None else \
+                _version(record.get("updated_at"))
+            if record is not None and key in self.__versions and \
+                    self.__versions[key] == version:
+                continue
+            if record is None:
+                if key not in self.__versions:
+                    continue
+                del self.__versions[key]
+            else:
+                self.__versions[key] = version
+            if key in self.__dirty:
+                conflicts.append(key)
+            elif record is None:
+                self.__pop(key)
+            else:
+                self.__update_record(key, record)
+        return conflicts
+
+    def __read_journal_end(self):
+        """This method reads the journal entries appended by other
+        processes when nothing else changed in the files
+
+        Returns:
+            dict: key -> last record, None for a delete, or None if more
+                than the end of the journal changed
+        """
+        old = self.__fingerprint.get(self.__log_path)
+        new = _stat(self.__log_path)
+        if new is None or old is not None and (
+                new[2] != old[2] or new[0] < old[0]):
+            return None
+        paths = set(self.__data_paths()).union(self.__fingerprint)
+        paths.discard(self.__log_path)
+        for path in paths:
+            if _stat(path) != self.__fingerprint.get(path):
+                return None
+        serializer = detect(self.__log_path)
+        if self.__log_serializer not in (None, serializer):
+            return None
+        changes = {}
+        with self.__open(self.__log_path, "r", serializer) as file:
+            file.seek(0 if old is None else old[0])
+            for key, record in serializer.read_entries(file):
+                changes[key] = record
+                self.__log_entries += 1
+                self.__stale.add(key.partition(".")[0])
+        self.__log_serializer = serializer
+        self.__track(self.__log_path)
+        return changes
+
+    def __read_files(self):
+        """This method reads the snapshot and the journal again
+
+        Returns:
+            dict: key -> record of every key in the files, None for the
+                keys this storage knew that are gone
+        """
+        records = dict.fromkeys(self.__versions)
+        self.__fingerprint, self.__digests = {}, {}
+        for path in self.__data_paths():
+            serializer = detect(path)
+            if serializer is None:
+                self.__track(path)
+                continue
+            with self.__open(path, "r", serializer) as file:
+                self.__track(path, file)
+                records.update(serializer.read_snapshot(file))
+        self.__log_entries = 0
+        self.__log_serializer = detect(self.__log_path)
+        if self.__log_serializer is None:
+            self.__track(self.__log_path)
+            return records
+        with self.__open(self.__log_path, "r", self.__log_serializer) as file:
+            self.__track(self.__log_path, file)
+            for key, record in self.__log_serializer.read_entries(file):
+                records[key] = record
+                self.__log_entries += 1
+                self.__stale.add(key.partition(".")[0])
+        return records
+
+    def __encode(self, key):
+        """This method returns the encoded record of key, serializing the
+        object only if it changed since the last save"""
+        if not self.__reusable(key):
+            self.__encoded[key] = self.__serialize(key)
+        return self.__encoded[key]
+
+    def __reusable(self, key):
+        """This method tells whether the encoded record kept for key still
+        matches its object, which is unsure for the objects holding lists
+        or dicts as those change in place"""
+        if key not in self.__encoded:
+            return False
+        return key in self.__objects.pending or \
+            not _mutable(self.__objects.peek(key))
+
+    def __serialize(self, key):
+        """This method returns the encoded record of the stored key"""
+        value = self.__objects.peek(key)
+        if key in self.__objects.pending:
+            return self.__serializer.encode(self.__record(key, value))
+        return self.__serializer.encode_object(value)
+
+    def __encode_all(self, keys):
+        """This method encodes the records of keys that are not encoded
+        yet, in parallel when they are at least HBNB_FILE_PARALLEL_MIN"""
+        if self.__workers < 2 or not _can_fork:
+            return
+        todo = [key for key in keys
+                if key in self.__objects and not self.__reusable(key)]
+        if len(todo) < self.__parallel_min:
+            return
+        encoded = _encode_parallel(self.__serialize, todo, self.__workers)
+        self.__encoded.update(zip(todo, encoded))
+
+    def __open(self, path, mode, serializer=None):
+        """This method opens one of the storage files in the text or
+        binary mode of its serializer"""
+        serializer = serializer or self.__serializer
+        return open(path, mode + ("b" if serializer.binary else ""))
+
+    def __write_records(self, path, items, serializer):
+        """This method writes the (key, encoded record) items as a
+        snapshot"""
+        with self.__replace(path, serializer) as file:
+            serializer.write_snapshot(file, items)
+        self.__track(path)
+
+    def __track(self, path, file=None):
+        """This method records the fingerprint of the file at path as the
+        one of the data in memory, hashing it as well when it is given
+        open"""
+        if self.__fingerprint is None:
+            return
+        self.__digests.pop(path, None)
+        if file is not None:
+            st = os.fstat(file.fileno())
+            self.__fingerprint[path] = (st.st_size, st.st_mtime_ns,
+                                        st.st_ino)
+            self.__digests[path] = _digest(file.fileno())
+        elif _stat(path) is None:
+            self.__fingerprint.pop(path, None)
+        else:
+            self.__fingerprint[path] = _stat(path)
+
+    def __files(self):
+        """This method returns the paths of the files reload() reads"""
+        if self.__snapshot_path:
+            return [self.__snapshot_path]
+        return self.__data_paths() + [self.__log_path]
+
+    def __data_paths(self):
+        """This method returns the paths of the snapshot files, the ones
+        of the other layout if the storage's own is missing"""
+        if os.path.isdir(self.__shard_dir) and (
+                self.__sharded or not os.path.exists(self.__file_path)):
+            extensions = tuple(ser.extension for ser in serializers.values())
+            return [os.path.join(self.__shard_dir, name) for name in
+                    sorted(os.listdir(self.__shard_dir))
+                    if name.endswith(extensions)]
+        return [self.__file_path]
+
+    def __unchanged(self, check_hash):
+        """This method tells whether the files are still the ones the
+        objects were loaded from or written to
+
+        Args:
+            check_hash (bool): hash the files whose size or mtime changed
+                and take them as unchanged if their content is the same
+        """
+        if self.__fingerprint is None:
+            return False
+        current = {}
+        for path in self.__files():
+            fingerprint = _stat(path)
+            if fingerprint is not None:
+                current[path] = fingerprint
+        if current == self.__fingerprint:
+            return True
+        if not check_hash or current.keys() != self.__fingerprint.keys():
+            return False
+        for path, fingerprint in current.items():
+            if fingerprint == self.__fingerprint[path]:
+                continue
+            if path not in self.__digests:
+                return False
+            try:
+                with open(path, "rb") as file:
+                    if _digest(file.fileno()) != self.__digests[path]:
+                        return False
+            except FileNotFoundError:
+                return False
+        self.__fingerprint = current
+        return True
+
+    def __prepare_snapshot(self):
+        """This method encodes the snapshot and returns the function
+        rewriting it and dropping the journal, and the function giving the
+        changes back to the next save if that fails
+
+        A sharded snapshot only gets the files of the stale classes
+        rewritten, and loses the files of the classes left empty. The
+        files of the other layout are removed once it is written.
+        """
+        serializer, sharded = self.__serializer, self.__sharded
+        files = {}
+        if sharded:
+            self.__encode_all([key for cls_name in self.__stale
+                               for key in self.__classes.get(cls_name, ())])
+            for cls_name in self.__stale:
+                for other in serializers.values():
+                    path = os.path.join(self.__shard_dir,
+                                        cls_name + other.extension)
+                    files[path] = None
+                    if other is serializer and cls_name in self.__classes:
+                        files[path] = [(key, self.__encode(key)) for key
+                                       in self.__classes[cls_name]]
+        else:
+            keys = self.__objects.keys()
+            self.__encode_all(keys)
+            files[self.__file_path] = [(key, self.__encode(key))
+                                       for key in keys]
+        versions = self.__versions_of(self.__dirty)
+        saved = (self.__dirty, self.__stale, self.__log_entries,
+                 self.__log_serializer)
+        self.__dirty, self.__stale = set(), set()
+        self.__log_entries, self.__log_serializer = 0, None
+
+        def write():
+            """This function writes the files of the snapshot"""
+            if sharded:
+                os.makedirs(self.__shard_dir, exist_ok=True)
+            for path, items in files.items():
+                if items is not None:
+                    self.__write_records(path, items, serializer)
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.__track(path)
+            self.__remove_layout(not sharded)
+            try:
+                os.remove(self.__log_path)
+            except FileNotFoundError:
+                pass
+            self.__track(self.__log_path)
+            self.__set_versions(versions)
+
+        def undo():
+            """This function gives the changes back to the next save"""
+            dirty, stale, log_entries, log_serializer = saved
+            self.__dirty |= dirty
+            self.__stale |= stale
+            self.__log_entries += log_entries
+            if self.__log_serializer is None:
+                self.__log_serializer = log_serializer
+        return write, undo
+
+    def __remove_layout(self, sharded):
+        """This method removes the snapshot files of a layout, the shards
+        if sharded else file.json, once the other one is written"""
+        if not sharded:
+            paths = [self.__file_path]
+        elif os.path.isdir(self.__shard_dir):
+            paths = [os.path.join(self.__shard_dir, name)
+                     for name in os.listdir(self.__shard_dir)]
+        else:
+            return
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if self.__fingerprint is not None:
+                self.__fingerprint.pop(path, None)
+            self.__digests.pop(path, None)
+        if sharded:
+            try:
+                os.rmdir(self.__shard_dir)
+            except OSError:
+                pass
+
+    def __prepare_journal(self):
+        """This method encodes a put or a tombstone per changed key and
+        returns the function appending them to the journal, and the
+        function giving the changes back to the next save if that fails"""
+        serializer = self.__serializer
+        self.__encode_all(self.__dirty)
+        entries = [(key, self.__encode(key) if key in self.__objects
+                    else None) for key in self.__dirty]
+        versions = self.__versions_of(self.__dirty)
+        dirty, self.__dirty = self.__dirty, set()
+        if entries:
+            self.__log_serializer = serializer
+        self.__log_entries += len(entries)
+
+        def write():
+            """This function appends the entries to the journal"""
+            if not entries:
+                return
+            in_sync = self.__fingerprint is not None and _stat(
+                self.__log_path) == self.__fingerprint.get(self.__log_path)
+            with self.__open(self.__log_path, "a", serializer) as file:
+                serializer.begin(file)
+                for key, data in entries:
+                    if data is None:
+                        serializer.write_entry(file, key)
+                    else:
+                        serializer.write_entry(file, key, data)
+                self.__written(self.__log_path, file)
+            if in_sync:
+                # no other process appended since, memory matches the
+                # journal
+                self.__track(self.__log_path)
+            self.__set_versions(versions)
+
+        def undo():
+            """This function gives the changes back to the next save"""
+            self.__dirty |= dirty
+            self.__log_entries -= len(entries)
+        return write, undo
+
+    def __versions_of(self, keys):
+        """This method returns key -> version of keys as a save writes
+        them, None for the deleted ones"""
+        return {key: _version(self.__value(key, "updated_at"))
+                if key in self.__objects else None for key in keys}
+
+    def __set_versions(self, versions):
+        """This method records the versions of the keys just written"""
+        for key, version in versions.items():
+            if version is None:
+                self.__versions.pop(key, None)
+            else:
+                self.__versions[key] = version
+
+    def dump_snapshot(self, path):
+        """This method writes every object to an indexed snapshot that
+        read-only storages can map with HBNB_FILE_SNAPSHOT
+
+        Args:
+            path (str): the path of the snapshot file
+        """
+        self.__ensure_loaded()
+        binary = serializers["binary"]
+
+        def payloads():
+            """This function yields the binary payload of every key"""
+            for key in self.__objects:
+                value = self.__objects.peek(key)
+                if binary is self.__serializer:
+                    yield key, self.__encode(key)
+                elif key in self.__objects.pending:
+                    yield key, binary.encode(self.__record(key, value))
+                else:
+                    yield key, binary.encode_object(value)
+        with self.__lock.writing():
+            items = list(payloads())
+        with self.__io.turn(self.__io.ticket()), \
+                self.__replace(path, binary) as file:
+            write_snapshot(file, items)
+
+    def close(self):
+        """This method writes the scheduled save, stops the flusher thread,
+        syncs the files as the durability policy says and releases the
+        snapshot mapped by a read-only storage"""
+        with self.__flush_cond:
+            flusher, self.__flusher = self.__flusher, None
+            self.__flush_cond.notify_all()
+        if flusher is not None:
+            flusher.join()
+        if self.__cache_writer is not None:
+            self.__cache_writer.join()
+        self.flush()
+        with self.__exclusive():
+            self.__sync()
+            with self.__flush_cond:
+                if self.__exit_hook:
+                    self.__exit_hook = False
+                    atexit.unregister(self.__at_exit)
+            self.__unmap()
+
+    def reload(self):
+        """This method reloads the objects from the file to storage
+
+        The snapshot is streamed one record at a time, each record being
+        turned into a model before the next one is parsed, then the
+        journal is replayed on top of it in order, big sharded snapshots
+        being decoded by forked workers, unless the fast-load cache holds
+        the records of the same files. A torn last line left
+        by a crash is ignored. A sharded storage without its directory yet
+        loads file.json, and its next snapshot writes every shard. A
+        storage that is not sharded loads the shards if there is no
+        file.json.
+
+        A read-only storage maps its snapshot and only reads its index.
+
+        Nothing is read if the files are the ones last loaded or written
+        by this storage: same size, mtime and inode, or same hash.
+        """
+        with self.__exclusive(lock_files=True):
+            if not self.__unchanged(check_hash=True):
+                try:
+                    if self.__snapshot_path:
+                        self.__map_snapshot()
+                    else:
+                        self.__load()
+                except BaseException:
+                    # read the files again next time
+                    self.__fingerprint = None
+                    raise
+            self.__deferred = False
+
+    def defer_reload(self):
+        """This method makes the first call using the objects reload them,
+        instead of reloading now
+
+        When HBNB_FILE_PRELOAD is on, a background thread starts the reload
+        at once. A reload failing there fails again on the first use.
+        """
+        self.__deferred = True
+        if _env_flag("HBNB_FILE_PRELOAD"):
+            threading.Thread(target=self.__preload, name="hbnb-preload",
+                             daemon=True).start()
+
+    def __preload(self):
+        """This method runs the deferred reload on the preload thread"""
+        try:
+            self.reload()
+        except Exception:
             pass
+
+    def __ensure_loaded(self):
+        """This method runs the deferred reload, if any, before the first
+        use of the objects"""
+        if self.__deferred:
+            self.reload()
+
+    def refresh(self):
+        """This method picks up the changes another process wrote to the
+        files since they were last loaded or written by this storage
+
+        Only the files are stat'ed when nothing changed. Otherwise they
+        are reloaded, and the saved objects missing from them now, which
+        another process deleted, are removed.
+
+        Returns:
+            bool: whether the files were read again
+        """
+        self.__ensure_loaded()
+        with self.__exclusive(lock_files=True):
+            if self.__unchanged(check_hash=False):
+                return False
+            if self.__snapshot_path:
+                self.__map_snapshot()
+                return True
+            clean = [key for key in self.__objects
+                     if key not in self.__dirty]
+            loaded = self.__load(keep=set(self.__dirty))
+            for key in clean:
+                if key not in loaded:
+                    self.__pop(key)
+            return True
+
+    def __map_snapshot(self):
+        """This method maps the snapshot of a read-only storage"""
+        self.__unmap()
+        self.__fingerprint, self.__digests = {}, {}
+        with open(self.__snapshot_path, "rb") as file:
+            self.__track(self.__snapshot_path, file)
+        self.__snapshot = SnapshotFile(self.__snapshot_path)
+        for key in self.__snapshot.index:
+            self.__objects.put_record(key, None)
+            cls_name = key.partition(".")[0]
+            self.__classes.setdefault(cls_name, {})[key] = None
+            self.__reindex(key)
+
+    def __unmap(self):
+        """This method releases the snapshot of a read-only storage"""
+        if self.__snapshot is not None:
+            self.__snapshot.close()
+            self.__snapshot = None
+            self.__objects.reset()
+            self.__classes.clear()
+            self.__fingerprint = None
+            for cls_name, indexes in self.__indexes.items():
+                for index in indexes.values():
+                    index.clear()
+                self.__unindexed[cls_name].clear()
+
+    def __load(self, keep=()):
+        """This method loads the snapshot and replays the journal, updating
+        the objects already built in place
+
+        Args:
+            keep (set): the keys whose object is left alone, as the unsaved
+                changes of refresh()
+        Returns:
+            set: the keys of the objects in the files
+        """
+        loaded = set()
+        self.__fingerprint, self.__digests = {}, {}
+        self.__versions = {}
+        files = []
+        for path in self.__data_paths():
+            serializer = detect(path)
+            if serializer is None:
+                self.__track(path)
+                continue
+            if not self.__fixed_format:
+                self.__set_format(serializer.name)
+            files.append((path, serializer))
+        self.__log_entries = 0
+        self.__log_serializer = detect(self.__log_path)
+        if self.__log_serializer is None:
+            self.__track(self.__log_path)
+        else:
+            files.append((self.__log_path, self.__log_serializer))
+        for path, serializer in files:
+            with self.__open(path, "r", serializer) as file:
+                self.__track(path, file)
+        state = None
+        if self.__cache is None:
+            triples = self.__read_records(files)
+        else:
+            cache_key = {path: fingerprint[:2] + (self.__digests.get(path),)
+                         for path, fingerprint in self.__fingerprint.items()}
+            state = self.__cache.read(cache_key)
+            if state is None:
+                fresh = LoadState()
+                triples = fresh.collect(self.__read_records(files))
+            else:
+                triples = state.replay()
+        for key, record, journaled in triples:
+            if journaled:
+                self.__log_entries += 1
+                # the snapshot lags behind the journaled classes
+                self.__stale.add(key.partition(".")[0])
+            if key in keep:
+                # the next save finds whether the files changed it too
+                continue
+            if record is None:
+                self.__pop(key)
+                self.__versions.pop(key, None)
+                loaded.discard(key)
+            else:
+                self.__update_record(key, record)
+                self.__versions[key] = _version(record.get("updated_at"))
+                loaded.add(key)
+        if state is not None:
+            self.__log_entries = state.log_entries
+            self.__stale.update(state.journaled)
+        elif self.__cache is not None:
+            self.__cache_writer = threading.Thread(
+                target=self.__cache.write, args=(cache_key, fresh),
+                name="hbnb-cache", daemon=False)
+            self.__cache_writer.start()
+        if self.__sharded and not os.path.isdir(self.__shard_dir):
+            self.__stale.update(self.__classes)
+        return loaded
+
+    def __read_records(self, files):
+        """This method yields the (key, record, journaled) triples of the
+        files, the snapshot files then the journal
+
+        Args:
+            files (list): the (path, serializer) pairs of the files
+        """
+        shards = [(serializer.name, path) for path, serializer in files
+                  if path != self.__log_path]
+        if len(shards) > 1 and self.__workers >= 2 and _can_fork and \
+                sum(os.path.getsize(path) for _, path in shards) >= \
+                self.__parallel_load_min:
+            with _fork_pool(min(self.__workers, len(shards))) as pool:
+                for pairs in pool.imap(_read_shard, shards):
+                    for key, record in pairs:
+                        yield key, record, False
+            files = [(path, serializer) for path, serializer in files
+                     if path == self.__log_path]
+        for path, serializer in files:
+            journaled = path == self.__log_path
+            with self.__open(path, "r", serializer) as file:
+                read = (serializer.read_entries if journaled
+                        else serializer.read_snapshot)
+                for key, record in read(file):
+                    yield key, record, journaled
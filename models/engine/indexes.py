@@ -0,0 +1,374 @@
+#!/usr/bin/python3
+"""This module contains the secondary indexes of the file storage
+
+An index maps the values of an attribute of the objects of one class to
+the keys of the objects holding them. The storage keeps track of the keys
+created, changed or deleted since the last lookup, and indexes them again
+before answering the next one.
+"""
+import heapq
+import math
+from bisect import bisect_left, bisect_right, insort
+
+
+# the attributes indexed by every file storage, by class name
+FOREIGN_KEYS = {
+    "City": ("state_id",),
+    "Place": ("city_id", "user_id"),
+    "Review": ("place_id", "user_id"),
+}
+
+# the numeric attributes kept in order by every file storage
+NUMERIC_FIELDS = {
+    "Place": ("price_by_night", "number_rooms", "max_guest",
+              "number_bathrooms"),
+}
+
+# the latitude and longitude attributes of the classes with a position
+GEO_FIELDS = {
+    "Place": ("latitude", "longitude"),
+}
+
+
+class HashIndex:
+    """This class is an index answering equality lookups
+
+    Attributes:
+        attr (str): the indexed attribute
+        attrs (tuple): the attributes whose values add() takes
+    """
+    kind = "hash"
+
+    def __init__(self, attr):
+        """This method creates an empty index of attr"""
+        self.attr = attr
+        self.attrs = (attr,)
+        self.__keys = {}
+        self.__values = {}
+
+    def add(self, key, value):
+        """This method indexes key under value, values that can not be
+        hashed are left out as no lookup can match them"""
+        try:
+            self.__keys.setdefault(value, {})[key] = None
+        except TypeError:
+            return
+        self.__values[key] = value
+
+    def discard(self, key):
+        """This method removes key from the index if it is there"""
+        if key not in self.__values:
+            return
+        value = self.__values.pop(key)
+        bucket = self.__keys[value]
+        del bucket[key]
+        if not bucket:
+            del self.__keys[value]
+
+    def clear(self):
+        """This method removes every key from the index"""
+        self.__keys.clear()
+        self.__values.clear()
+
+    def lookup(self, value):
+        """This method returns the keys whose attribute equals value"""
+        try:
+            return self.__keys.get(value, {}).keys()
+        except TypeError:
+            return {}.keys()
+
+
+class _Last:
+    """This class is greater than any key, bounding the keys of a value"""
+
+    def __gt__(self, other):
+        """This method tells that the bound follows other"""
+        return True
+
+    def __lt__(self, other):
+        """This method tells that the bound does not precede other"""
+        return False
+
+
+_LAST = _Last()
+
+
+class SortedIndex:
+    """This class is an index keeping the keys in the order of a numeric
+    attribute, answering range lookups
+
+    The (value, key) pairs are kept in a sorted list searched by bisection.
+    Values that are not numbers are left out.
+
+    Attributes:
+        attr (str): the indexed attribute
+        attrs (tuple): the attributes whose values add() takes
+    """
+    kind = "sorted"
+
+    def __init__(self, attr):
+        """This method creates an empty index of attr"""
+        self.attr = attr
+        self.attrs = (attr,)
+        self.__entries = []
+        self.__values = {}
+
+    def __len__(self):
+        """This method returns the number of indexed keys"""
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        """This method tells whether key is indexed"""
+        return key in self.__values
+
+    def add(self, key, value):
+        """This method indexes key under value if it is a number"""
+        if type(value) not in (int, float) or value != value:
+            return
+        insort(self.__entries, (value, key))
+        self.__values[key] = value
+
+    def discard(self, key):
+        """This method removes key from the index if it is there"""
+        if key not in self.__values:
+            return
+        entry = (self.__values.pop(key), key)
+        del self.__entries[bisect_left(self.__entries, entry)]
+
+    def clear(self):
+        """This method removes every key from the index"""
+        self.__entries.clear()
+        self.__values.clear()
+
+    def range(self, low=None, high=None, reverse=False):
+        """This method yields the keys whose value is between low and high
+        included, in the order of the values
+
+        Args:
+            low (float): the lowest value, None for no lower bound
+            high (float): the highest value, None for no upper bound
+            reverse (bool): yield the highest values first
+        """
+        positions = range(*self.__span(low, high))
+        if reverse:
+            positions = reversed(positions)
+        for position in positions:
+            yield self.__entries[position][1]
+
+    def count(self, low=None, high=None):
+        """This method returns the number of keys whose value is between
+        low and high included"""
+        start, stop = self.__span(low, high)
+        return stop - start
+
+    def __span(self, low, high):
+        """This method returns the start and stop positions of the
+        entries between low and high"""
+        entries = self.__entries
+        start = 0 if low is None else bisect_left(entries, (low,))
+        stop = len(entries) if high is None else \
+            bisect_right(entries, (high, _LAST))
+        return start, max(start, stop)
+
+
+# the mean radius of the Earth, in km
+EARTH_RADIUS = 6371.0088
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """This function returns the great-circle distance in km between two
+    points given in degrees"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(h)))
+
+
+def bbox_around(lat, lon, radius):
+    """This function returns the (south, west, north, east) box in
+    degrees holding every point within radius km of (lat, lon), west being
+    greater than east when the box crosses the antimeridian"""
+    angle = radius / EARTH_RADIUS
+    south = lat - math.degrees(angle)
+    north = lat + math.degrees(angle)
+    if south <= -90 or north >= 90 or angle >= math.pi / 2:
+        return (max(south, -90.0), -180.0, min(north, 90.0), 180.0)
+    dlon = math.degrees(math.asin(math.sin(angle) /
+                                  math.cos(math.radians(lat))))
+    west = (lon - dlon + 180) % 360 - 180
+    east = (lon + dlon + 180) % 360 - 180
+    return (south, west, north, east)
+
+
+def in_bbox(lat, lon, bbox):
+    """This function tells whether (lat, lon) is in the bbox (south, west,
+    north, east), which crosses the antimeridian if west > east"""
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lon <= east
+    return lon >= west or lon <= east
+
+
+class GeoIndex:
+    """This class is an index of the positions of the objects answering
+    nearest neighbour and bounding box lookups
+
+    The points are kept in buckets of a grid of about cell x cell degrees,
+    the cells being adjusted to divide the latitudes and longitudes. A
+    nearest lookup visits the rings of cells around the point until the
+    k-th best distance is below a lower bound of the distance to any cell
+    not visited yet. Positions that are not valid coordinates are left out.
+
+    Attributes:
+        attrs (tuple): the latitude and longitude attributes
+    """
+    kind = "geo"
+
+    def __init__(self, lat_attr="latitude", lon_attr="longitude", cell=0.1):
+        """This method creates an empty index of the lat_attr, lon_attr
+        position with cells of cell degrees"""
+        self.attrs = (lat_attr, lon_attr)
+        self.__rows = math.ceil(180 / cell)
+        self.__cols = math.ceil(360 / cell)
+        self.__height = 180 / self.__rows
+        self.__width = 360 / self.__cols
+        self.__cells = {}
+        self.__points = {}
+
+    def __len__(self):
+        """This method returns the number of indexed keys"""
+        return len(self.__points)
+
+    def __cell(self, lat, lon):
+        """This method returns the (row, column) of the cell of a point"""
+        row = min(int((lat + 90) // self.__height), self.__rows - 1)
+        return row, int((lon + 180) // self.__width) % self.__cols
+
+    def add(self, key, lat, lon):
+        """This method indexes key at (lat, lon) if they are coordinates"""
+        if type(lat) not in (int, float) or type(lon) not in (int, float) \
+                or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+            return
+        cell = self.__cell(lat, lon)
+        self.__cells.setdefault(cell, {})[key] = (lat, lon)
+        self.__points[key] = cell
+
+    def discard(self, key):
+        """This method removes key from the index if it is there"""
+        if key not in self.__points:
+            return
+        cell = self.__points.pop(key)
+        bucket = self.__cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.__cells[cell]
+
+    def clear(self):
+        """This method removes every key from the index"""
+        self.__cells.clear()
+        self.__points.clear()
+
+    def __ring(self, row, col, r):
+        """This method returns the cells at r cells from (row, col)"""
+        cells = set()
+        for i in range(max(row - r, 0), min(row + r, self.__rows - 1) + 1):
+            if abs(i - row) == r:
+                cols = range(col - r, col + r + 1)
+            else:
+                cols = (col - r, col + r)
+            cells.update((i, j % self.__cols) for j in cols)
+        return cells
+
+    def __distance(self, cell, row, col):
+        """This method returns the number of rings between two cells"""
+        cols = abs(cell[1] - col)
+        return max(abs(cell[0] - row), min(cols, self.__cols - cols))
+
+    def __bound(self, lat, lon, row, col, r):
+        """This method returns a lower bound in km of the distance from
+        (lat, lon) to the points beyond the first r rings of cells"""
+        bound = math.inf
+        south = (row - r) * self.__height - 90
+        north = (row + r + 1) * self.__height - 90
+        if south > -90:
+            bound = min(bound, lat - south)
+        if north < 90:
+            bound = min(bound, north - lat)
+        bound = math.radians(bound)
+        if 2 * r + 1 < self.__cols:
+            west = (col - r) * self.__width - 180
+            east = (col + r + 1) * self.__width - 180
+            dlon = math.radians(min(lon - west, east - lon))
+            if dlon < math.pi / 2:
+                # distance to the meridians bounding the visited columns
+                bound = min(bound, math.asin(
+                    math.cos(math.radians(lat)) * math.sin(dlon)))
+            else:
+                bound = 0.0
+        return EARTH_RADIUS * bound
+
+    def nearest(self, lat, lon, k=1, radius=None):
+        """This method returns the (distance in km, key) pairs of the k
+        keys nearest to (lat, lon), nearest first
+
+        Args:
+            lat (float): the latitude of the point
+            lon (float): the longitude of the point
+            k (int): the most keys to return, None for all
+            radius (float): only return keys within radius km
+        """
+        row, col = self.__cell(lat, lon)
+        limit = math.inf if radius is None else radius
+        best = []
+        r = 0
+        while True:
+            ring = self.__ring(row, col, r)
+            if len(ring) > len(self.__cells):
+                # the populated cells are fewer, look at all the others
+                ring = [cell for cell in self.__cells
+                        if self.__distance(cell, row, col) >= r]
+                bound = math.inf
+            else:
+                bound = self.__bound(lat, lon, row, col, r)
+            for cell in ring:
+                for key, (plat, plon) in self.__cells.get(cell, {}).items():
+                    distance = haversine(lat, lon, plat, plon)
+                    if distance > limit:
+                        continue
+                    if k is None or len(best) < k:
+                        heapq.heappush(best, (-distance, key))
+                    elif -best[0][0] > distance:
+                        heapq.heapreplace(best, (-distance, key))
+            if k is not None and len(best) == k:
+                limit = min(limit, -best[0][0])
+            if bound >= limit or bound == math.inf:
+                break
+            r += 1
+        return sorted((-distance, key) for distance, key in best)
+
+    def within(self, bbox):
+        """This method returns the keys in the bbox (south, west, north,
+        east) in degrees, which crosses the antimeridian if west > east"""
+        south, west, north, east = bbox
+        south, north = max(south, -90), min(north, 90)
+        if south > north:
+            return []
+        first, left = self.__cell(south, west)
+        last, right = self.__cell(north, east)
+        cols = (right - left) % self.__cols + 1
+        if west <= east and east - west >= 360 - self.__width:
+            cols = self.__cols
+        if (last - first + 1) * cols > len(self.__cells):
+            cells = list(self.__cells)
+        else:
+            cells = [(i, (left + j) % self.__cols)
+                     for i in range(first, last + 1) for j in range(cols)]
+        return [key for cell in cells
+                for key, (lat, lon) in self.__cells.get(cell, {}).items()
+                if in_bbox(lat, lon, bbox)]
+
+
+index_kinds = {index.kind: index for index in
+               (HashIndex, SortedIndex, GeoIndex)}
@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+"""This module contains the key-value storage engine for the airBnB clone
+app"""
+import dbm
+import json
+import sqlite3
+import zlib
+from importlib import import_module
+from os import getenv
+from models.engine import _class_name, _model_classes
+from models.engine.query import Query, sort_key
+from models.engine.serializers import serializers
+
+INDEX_BUCKETS = 256
+
+
+class _SQLiteDB:
+    """This class is a dbm database kept in SQLite, in the layout of the
+    dbm.sqlite3 module of Python 3.13, so that those versions open it too
+
+    The writes are made in a transaction committed by sync() and close().
+    """
+
+    def __init__(self, path):
+        """This method opens the database at path, creating it if needed"""
+        self.__connection = sqlite3.connect(path)
+        self.__connection.execute("PRAGMA journal_mode = wal")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS Dict "
+            "(key BLOB UNIQUE NOT NULL, value BLOB NOT NULL)")
+        self.__connection.commit()
+
+    @staticmethod
+    def __bytes(value):
+        """This method returns value as bytes, str being UTF-8 encoded"""
+        return value.encode() if isinstance(value, str) else bytes(value)
+
+    def __getitem__(self, key):
+        """This method returns the value of key"""
+        row = self.__connection.execute(
+            "SELECT value FROM Dict WHERE key = ?",
+            (self.__bytes(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __setitem__(self, key, value):
+        """This method sets the value of key"""
+        self.__connection.execute(
+            "REPLACE INTO Dict (key, value) VALUES (?, ?)",
+            (self.__bytes(key), self.__bytes(value)))
+
+    def __delitem__(self, key):
+        """This method removes key"""
+        if not self.__connection.execute(
+                "DELETE FROM Dict WHERE key = ?",
+                (self.__bytes(key),)).rowcount:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        """This method tells whether key is in the database"""
+        return self.__connection.execute(
+            "SELECT 1 FROM Dict WHERE key = ?",
+            (self.__bytes(key),)).fetchone() is not None
+
+    def keys(self):
+        """This method returns the keys of the database"""
+        return [row[0] for row in self.__connection.execute(
+            "SELECT key FROM Dict")]
+
+    def sync(self):
+        """This method commits the writes"""
+        self.__connection.commit()
+
+    def close(self):
+        """This method commits the writes and closes the database"""
+        self.__connection.commit()
+        self.__connection.close()
+
+    def __enter__(self):
+        """This method returns the database"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """This method closes the database"""
+        self.close()
+
+
+def _open_db(path):
+    """This function opens the database at path with dbm, or in SQLite
+    when a new database would get dbm.dumb, whose sync() and deletes
+    rewrite the whole key directory"""
+    kind = dbm.whichdb(path)
+    if kind == "" or kind is None and not _fast_dbm():
+        return _SQLiteDB(path)
+    return dbm.open(path, "c")
+
+
+def _fast_dbm():
+    """This function tells whether dbm has a module other than
+    dbm.dumb"""
+    for name in ("dbm.sqlite3", "dbm.gnu", "dbm.ndbm"):
+        try:
+            import_module(name)
+        except ImportError:
+            continue
+        return True
+    return False
+
+
+def _bucket(obj_id):
+    """This function returns the index bucket of an id, a CRC being
+    used as hash() changes from one process to the next"""
+    return zlib.crc32(obj_id.encode()) % INDEX_BUCKETS
+
+
+class KVStorage:
+    """This class is the key-value storage engine for the airBnB clone app
+
+    The objects live in a dbm database (HBNB_KV_PATH, file.kv by default),
+    the to_dict() of each one as JSON under its "<class name>.<id>" key.
+    Where the only dbm module is dbm.dumb, whose sync() rewrites its whole
+    key directory, a new database is kept in SQLite instead, one row per
+    key, so that a save costs the same in a big store as in a small one.
+
+    dbm can not list the keys of a class, so the ids of every class are
+    kept in INDEX_BUCKETS buckets, under "index:<class name>:<bucket>"
+    keys. Creating or deleting an object rewrites the small bucket of its
+    id only, not the ids of the whole class. The single "index:<class
+    name>" key of older databases is read and split into buckets.
+
+    Nothing is read by reload(): an object is read the first time its
+    class is asked for, and count() only reads the index of the class.
+    Models report their changes through touch(), and save() only writes
+    the keys of the objects created, changed or deleted since the last
+    save, plus the index buckets of the objects created or deleted.
+
+    Attributes:
+        __path (str): the path of the database
+        __db: the open database, None until it is first used and after
+            close()
+        __objects (dict): the objects read or created, by key
+        __ids (dict): class name -> ids of that class, for the classes
+            whose index was read
+        __buckets (dict): class name -> bucket -> ids in that bucket, for
+            the same classes
+        __dirty (set): keys created, changed or deleted since the last
+            save
+        __dirty_buckets (set): (class name, bucket) pairs whose ids
+            changed since the last save
+        __legacy (set): class names whose unbucketed index is to delete
+        __complete (bool): whether every class was read
+    """
+
+    def __init__(self):
+        """This method sets up the storage from the environment"""
+        self.__path = getenv("HBNB_KV_PATH", "file.kv")
+        self.__db = None
+        self.__objects = {}
+        self.__ids = {}
+        self.__buckets = {}
+        self.__dirty = set()
+        self.__dirty_buckets = set()
+        self.__legacy = set()
+        self.__complete = False
+        self.__classes_by_name = None
+
+    def all(self, cls=None):
+        """This method returns all objects in storage, reading the ones
+        of the classes not read yet
+
+        Args:
+            cls (type or str): only return the objects of this class
+        Returns:
+            dict: the stored objects by "<class name>.<id>" key
+        """
+        if cls is not None:
+            cls_name = _class_name(cls)
+            return {f"{cls_name}.{obj_id}": self.__get(cls_name, obj_id)
+                    for obj_id in list(self.__class_ids(cls_name))}
+        if not self.__complete:
+            for cls_name in self.__model_classes():
+                self.all(cls_name)
+            self.__complete = True
+        return self.__objects
+
+    def count(self, cls=None):
+        """This method returns the number of objects in storage, only
+        reading the indexes
+
+        Args:
+            cls (type or str): only count the objects of this class
+        """
+        if cls is None:
+            return sum(len(self.__class_ids(cls_name))
+                       for cls_name in self.__model_classes())
+        return len(self.__class_ids(_class_name(cls)))
+
+    def new(self, obj):
+        """This method adds a new object to storage"""
+        cls_name = obj.__class__.__name__
+        key = f"{cls_name}.{obj.id}"
+        ids = self.__class_ids(cls_name)
+        if obj.id not in ids:
+            ids[obj.id] = None
+            bucket = _bucket(obj.id)
+            self.__buckets[cls_name].setdefault(bucket, {})[obj.id] = None
+            self.__dirty_buckets.add((cls_name, bucket))
+        self.__objects[key] = obj
+        self.__dirty.add(key)
+
+    def touch(self, obj):
+        """This method marks obj as changed if it is the stored object
+        of its key, models call it right before one of their attributes
+        is set or deleted"""
+        key = f"{obj.__class__.__name__}.{obj.__dict__.get('id')}"
+        if self.__objects.get(key) is obj:
+            self.__dirty.add(key)
+
+    def delete(self, obj=None):
+        """This method removes obj from storage if it is stored"""
+        if obj is None:
+            return
+        cls_name = obj.__class__.__name__
+        ids = self.__class_ids(cls_name)
+        if obj.id in ids:
+            del ids[obj.id]
+            bucket = _bucket(obj.id)
+            del self.__buckets[cls_name][bucket][obj.id]
+            self.__objects.pop(f"{cls_name}.{obj.id}", None)
+            self.__dirty.add(f"{cls_name}.{obj.id}")
+            self.__dirty_buckets.add((cls_name, bucket))
+
+    def save(self):
+        """This method writes the keys of the changed objects and the
+        changed index buckets"""
+        encode = serializers["json"].encode_object
+        db = self.__open()
+        for key in self.__dirty:
+            if key in self.__objects:
+                db[key] = encode(self.__objects[key])
+            elif key in db:
+                del db[key]
+        for cls_name, bucket in self.__dirty_buckets:
+            ids = self.__buckets[cls_name].get(bucket)
+            key = f"index:{cls_name}:{bucket}"
+            if ids:
+                db[key] = "\n".join(ids)
+            elif key in db:
+                del db[key]
+        for cls_name in self.__legacy:
+            del db[f"index:{cls_name}"]
+        self.__dirty.clear()
+        self.__dirty_buckets.clear()
+        self.__legacy.clear()
+        if hasattr(db, "sync"):
+            db.sync()
+
+    def find(self, cls, **criteria):
+        """This method returns the objects of cls whose attributes equal
+        the criteria, like find(City, state_id=state.id)"""
+        return list(self.query(cls).filter(**criteria))
+
+    def query(self, cls):
+        """This method returns a query over the objects of cls, which
+        reads the objects of the class one at a time as it is iterated"""
+        return Query(cls, self.__run_query)
+
+    def reload(self):
+        """This method opens the database and forgets the objects read
+        without changes since, so that they are read again"""
+        self.__open()
+        dirty_classes = {cls_name for cls_name, _ in self.__dirty_buckets}
+        for cls_name in list(self.__ids):
+            if cls_name not in dirty_classes:
+                del self.__ids[cls_name]
+                del self.__buckets[cls_name]
+        self.__objects = {key: obj for key, obj in self.__objects.items()
+                          if key in self.__dirty}
+        self.__complete = False
+
+    def close(self):
+        """This method closes the database, the next use opening it
+        again"""
+        if self.__db is not None:
+            self.__db.close()
+            self.__db = None
+
+    def __open(self):
+        """This method returns the database, opening it if needed"""
+        if self.__db is None:
+            self.__db = _open_db(self.__path)
+        return self.__db
+
+    def __model_classes(self):
+        """This method returns the model classes by class name"""
+        if self.__classes_by_name is None:
+            self.__classes_by_name = _model_classes()
+        return self.__classes_by_name
+
+    def __class_ids(self, cls_name):
+        """This method returns the ids of cls_name, reading its index
+        buckets the first time"""
+        if cls_name not in self.__ids:
+            db = self.__open()
+            buckets = {}
+            for bucket in range(INDEX_BUCKETS):
+                key = f"index:{cls_name}:{bucket}"
+                if key in db:
+                    ids = db[key].decode().split("\n")
+                    buckets[bucket] = dict.fromkeys(ids)
+            if f"index:{cls_name}" in db:
+                text = db[f"index:{cls_name}"].decode()
+                for obj_id in text.split("\n") if text else ():
+                    bucket = _bucket(obj_id)
+                    buckets.setdefault(bucket, {})[obj_id] = None
+                    self.__dirty_buckets.add((cls_name, bucket))
+                self.__legacy.add(cls_name)
+            self.__buckets[cls_name] = buckets
+            self.__ids[cls_name] = {obj_id: None for ids in buckets.values()
+                                    for obj_id in ids}
+        return self.__ids[cls_name]
+
+    def __get(self, cls_name, obj_id):
+        """This method returns the object of a key, reading it the first
+        time"""
+        key = f"{cls_name}.{obj_id}"
+        if key not in self.__objects:
+            record = json.loads(self.__open()[key])
+            self.__objects[key] = \
+                self.__model_classes()[record["__class__"]](**record)
+        return self.__objects[key]
+
+    def __run_query(self, query):
+        """This method returns the plan of a query and a lazy iterator
+        over its results"""
+        cls_name = _class_name(query.cls)
+        ids = list(self.__class_ids(cls_name))
+        plan = f"scan index:{cls_name} ({len(ids)} keys)"
+        if query.ordering is not None:
+            plan += f", then sort by {query.ordering[0]}"
+        return plan, self.__results(query, cls_name, ids)
+
+    def __results(self, query, cls_name, ids):
+        """This method yields the objects passing the filters of query"""
+        objects = (self.__get(cls_name, obj_id) for obj_id in ids)
+        objects = (obj for obj in objects if query.matches(
+            lambda attr: getattr(obj, attr, None)))
+        if query.ordering is not None:
+            attr, descending = query.ordering
+            objects = iter(sorted(objects, reverse=descending, key=lambda
+                                  obj: sort_key(getattr(obj, attr, None))))
+        for count, obj in enumerate(objects):
+            if count == query.max_results:
+                return
+            yield obj
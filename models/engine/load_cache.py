@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+"""This module contains the fast-load cache of the file storage
+
+Decoding the JSON files is most of the cost of a reload. The cache is a
+pickle of the records the files decode to, written next to them
+(file.json.cache) with the size, mtime and hash of every file it was
+decoded from. A reload finding the same files loads the pickle instead
+of decoding them.
+
+The cache is a stream of pickles: a header holding the version and the
+key of the files, chunks of (key, record) pairs, then a trailer holding
+the keys the journal deleted, the number of journal entries and the
+classes they touched. Writing it in chunks lets the other threads run
+while a background thread pickles a big store.
+"""
+import os
+import pickle
+import tempfile
+from itertools import islice
+
+
+class LoadState:
+    """This class is what a reload decodes from the files: the last
+    record of every key, after the journal is replayed
+
+    Attributes:
+        records (dict): key -> record, in the order reload() stores them
+        deleted (set): the keys the journal deleted last
+        log_entries (int): the number of entries in the journal
+        journaled (set): the class names of the journaled keys
+    """
+
+    def __init__(self):
+        """This method creates the state of empty files"""
+        self.records = {}
+        self.deleted = set()
+        self.log_entries = 0
+        self.journaled = set()
+
+    def collect(self, triples):
+        """This method records the (key, record, journaled) triples of a
+        reload, a None record being a delete, and yields them on"""
+        for key, record, journaled in triples:
+            if journaled:
+                self.log_entries += 1
+                self.journaled.add(key.partition(".")[0])
+            if record is None:
+                self.records.pop(key, None)
+                self.deleted.add(key)
+            else:
+                self.records[key] = record
+                self.deleted.discard(key)
+            yield key, record, journaled
+
+    def replay(self):
+        """This method yields the (key, record, journaled) triples giving
+        the same objects as the reload the state was collected from"""
+        for key in self.deleted:
+            yield key, None, True
+        for key, record in self.records.items():
+            yield key, record, False
+
+
+class LoadCache:
+    """This class reads and writes the fast-load cache of a storage
+
+    The cache is trusted like the files it is decoded from: it is only
+    read when its key is the key of the files, and is written through a
+    temporary file renamed over the old one.
+
+    Attributes:
+        path (str): the path of the cache
+        version (int): the version of the layout, a cache of another
+            version being stale
+        chunk (int): the number of records pickled at once
+    """
+    version = 1
+    chunk = 1000
+
+    def __init__(self, path):
+        """This method creates the cache at path"""
+        self.path = path
+
+    def read(self, key):
+        """This method returns the LoadState cached for the files of key,
+        or None if the cache is missing, stale or unreadable"""
+        try:
+            with open(self.path, "rb") as file:
+                if pickle.load(file) != (LoadCache.version, key):
+                    return None
+                state = LoadState()
+                while True:
+                    chunk = pickle.load(file)
+                    if type(chunk) is tuple:
+                        break
+                    state.records.update(chunk)
+                deleted, state.log_entries, journaled = chunk
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        state.deleted, state.journaled = set(deleted), set(journaled)
+        return state
+
+    def write(self, key, state):
+        """This method caches state as decoded from the files of key,
+        giving up silently if the cache can not be written"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path) or ".",
+                prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump((LoadCache.version, key), file)
+                items = iter(state.records.items())
+                while True:
+                    chunk = list(islice(items, LoadCache.chunk))
+                    if not chunk:
+                        break
+                    pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+                pickle.dump((list(state.deleted), state.log_entries,
+                             list(state.journaled)), file)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
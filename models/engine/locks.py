@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+"""This module contains the locks of the file storage
+
+The storage is shared by the threads of a web server: lookups hold the
+read side of an RWLock and run together, changes hold its write side and
+run alone. A save encodes the changes under the write lock and writes the
+files after releasing it, the writes being kept in the order of the saves
+by a Sequencer.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class _Held:
+    """This class is a context manager holding one side of an RWLock,
+    cheaper to enter than a generator one as models take the write side
+    on every new object"""
+
+    __slots__ = ("acquire", "release")
+
+    def __init__(self, acquire, release):
+        """This method creates a context manager calling acquire on
+        entry and release on exit"""
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        """This method takes the side"""
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        """This method releases the side"""
+        self.release()
+
+
+class RWLock:
+    """This class is a readers-writer lock
+
+    Any number of threads may hold the read side at once, and one thread
+    the write side while no other thread holds either. Both sides are
+    reentrant, and the thread holding the write side may take the read
+    side too. A waiting writer keeps new readers out, so that a stream of
+    lookups can not starve the changes.
+    """
+
+    def __init__(self):
+        """This method creates a lock held by nobody"""
+        self.__cond = threading.Condition(threading.Lock())
+        self.__readers = {}
+        self.__writer = None
+        self.__depth = 0
+        self.__waiting = 0
+        self.__sleeping = 0
+        self.__reading = _Held(self.acquire_read, self.release_read)
+        self.__writing = _Held(self.acquire_write, self.release_write)
+
+    def __wait(self):
+        """This method waits for a release, counting the sleeping threads
+        so that releases only wake them when there are some"""
+        self.__sleeping += 1
+        try:
+            self.__cond.wait()
+        finally:
+            self.__sleeping -= 1
+
+    def __wake(self):
+        """This method wakes the sleeping threads, if any"""
+        if self.__sleeping:
+            self.__cond.notify_all()
+
+    def acquire_read(self):
+        """This method takes the read side, waiting for the writer"""
+        me = threading.get_ident()
+        with self.__cond:
+            if self.__writer != me and me not in self.__readers:
+                while self.__writer is not None or self.__waiting:
+                    self.__wait()
+            self.__readers[me] = self.__readers.get(me, 0) + 1
+
+    def release_read(self):
+        """This method releases the read side
+
+        Raises:
+            RuntimeError: if the thread does not hold the read side
+        """
+        me = threading.get_ident()
+        with self.__cond:
+            if me not in self.__readers:
+                raise RuntimeError("the read lock is not held")
+            self.__readers[me] -= 1
+            if not self.__readers[me]:
+                del self.__readers[me]
+                self.__wake()
+
+    def acquire_write(self):
+        """This method takes the write side, waiting for the readers and
+        the writer
+
+        Raises:
+            RuntimeError: if the thread only holds the read side, which
+                would wait for itself
+        """
+        me = threading.get_ident()
+        with self.__cond:
+            if self.__writer == me:
+                self.__depth += 1
+                return
+            if me in self.__readers:
+                raise RuntimeError("a read lock can not be upgraded")
+            self.__waiting += 1
+            try:
+                while self.__writer is not None or self.__readers:
+                    self.__wait()
+            finally:
+                self.__waiting -= 1
+                if self.__writer is not None or self.__readers:
+                    self.__wake()
+            self.__writer, self.__depth = me, 1
+
+    def release_write(self):
+        """This method releases the write side
+
+        Raises:
+            RuntimeError: if the thread does not hold the write side
+        """
+        with self.__cond:
+            if self.__writer != threading.get_ident():
+                raise RuntimeError("the write lock is not held")
+            self.__depth -= 1
+            if not self.__depth:
+                self.__writer = None
+                self.__wake()
+
+    def reading(self):
+        """This method returns a context manager holding the read side"""
+        return self.__reading
+
+    def writing(self):
+        """This method returns a context manager holding the write side"""
+        return self.__writing
+
+
+class Sequencer:
+    """This class runs sections one at a time in the order of the tickets
+    taken for them
+
+    A thread takes a ticket while it holds the lock ordering its work,
+    and waits for its turn after releasing that lock. A thread must not
+    wait for a ticket while its turn is running, it would wait for itself.
+    """
+
+    def __init__(self):
+        """This method creates a sequencer with no ticket taken"""
+        self.__cond = threading.Condition(threading.Lock())
+        self.__next = 0
+        self.__serving = 0
+
+    def ticket(self):
+        """This method returns the next ticket"""
+        with self.__cond:
+            ticket, self.__next = self.__next, self.__next + 1
+            return ticket
+
+    @contextmanager
+    def turn(self, ticket):
+        """This method returns a context manager waiting for the turn of
+        ticket, and giving the turn to the next ticket when it exits,
+        whether the section succeeded or not"""
+        with self.__cond:
+            while self.__serving != ticket:
+                self.__cond.wait()
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__serving += 1
+                self.__cond.notify_all()
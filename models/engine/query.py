@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+"""This module contains the declarative queries of the storage engines
+
+storage.query(cls) returns a Query, refined by chaining filter(),
+order_by() and limit(). Each call returns a new query, and nothing is
+read until the query is iterated. The storage gives the query the
+function running it: the file storage plans it over its indexes, the
+database storage compiles it to SQL.
+"""
+import operator
+from datetime import datetime
+
+
+def _contains(container, value):
+    """This function tells whether container holds value"""
+    return value in container
+
+
+def _is_in(value, container):
+    """This function tells whether value is one of container"""
+    return value in container
+
+
+_tests = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "in": _is_in,
+    "contains": _contains,
+}
+
+_symbols = {"eq": "==", "ne": "!=", "lt": "<", "le": "<=", "gt": ">",
+            "ge": ">=", "in": "in", "contains": "contains"}
+
+
+def describe(attr, op, value):
+    """This function returns a filter as text, for the plans"""
+    return f"{attr} {_symbols[op]} {value!r}"
+
+
+def sort_key(value):
+    """This function returns the key ordering values of mixed types:
+    numbers first, then strings, then dates, then anything else by
+    representation"""
+    if type(value) in (int, float) and value == value:
+        return (0, value)
+    if type(value) is str:
+        return (1, value)
+    if type(value) is datetime:
+        return (2, value)
+    return (3, repr(value))
+
+
+class Query:
+    """This class is a query over the objects of one class
+
+    Attributes:
+        cls (type or str): the class of the objects
+        filters (tuple): the (attribute, operator, value) conditions
+        ordering (tuple): (attribute, descending), or None
+        max_results (int): the limit, or None
+    """
+
+    def __init__(self, cls, run):
+        """This method creates a query of every object of cls
+
+        Args:
+            cls (type or str): the class of the objects
+            run (callable): takes the query and returns its plan and a
+                lazy iterator over its results
+        """
+        self.cls = cls
+        self.filters = ()
+        self.ordering = None
+        self.max_results = None
+        self.__run = run
+
+    def __copy(self, **changes):
+        """This method returns a copy of the query with changes applied"""
+        query = Query(self.cls, self.__run)
+        query.filters = self.filters
+        query.ordering = self.ordering
+        query.max_results = self.max_results
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def filter(self, **criteria):
+        """This method returns the query restricted by criteria
+
+        A criterion is attr=value, or attr__op=value where op is one of
+        eq, ne, lt, le, gt, ge, in and contains.
+
+        Raises:
+            ValueError: if an operator is unknown
+        """
+        filters = list(self.filters)
+        for name, value in criteria.items():
+            attr, _, op = name.partition("__")
+            op = op or "eq"
+            if op not in _tests:
+                raise ValueError(f"unknown operator: {op}")
+            filters.append((attr, op, value))
+        return self.__copy(filters=tuple(filters))
+
+    def order_by(self, attr):
+        """This method returns the query ordered by attr, descending if
+        attr starts with -"""
+        if attr.startswith("-"):
+            return self.__copy(ordering=(attr[1:], True))
+        return self.__copy(ordering=(attr, False))
+
+    def limit(self, count):
+        """This method returns the query stopping after count objects"""
+        return self.__copy(max_results=count)
+
+    def matches(self, value_of):
+        """This method tells whether an object passes the filters
+
+        Args:
+            value_of (callable): returns the value of an attribute of the
+                object
+        """
+        for attr, op, value in self.filters:
+            try:
+                if not _tests[op](value_of(attr), value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def __iter__(self):
+        """This method runs the query and returns a lazy iterator over
+        its results"""
+        return self.__run(self)[1]
+
+    def all(self):
+        """This method returns the results as a list"""
+        return list(self)
+
+    def first(self):
+        """This method returns the first result, or None"""
+        return next(iter(self.limit(1)), None)
+
+    def count(self):
+        """This method returns the number of results"""
+        return sum(1 for _ in self)
+
+    def explain(self):
+        """This method returns the plan of the query as text"""
+        return self.__run(self)[0]
+
+
+_sql_ops = dict(_tests, **{
+    "in": lambda column, value: column.in_(value),
+    "contains": lambda column, value: column.contains(value),
+})
+
+
+def to_sql(sql, query):
+    """This function applies a query to a SQLAlchemy query over its
+    class and returns the result"""
+    for attr, op, value in query.filters:
+        sql = sql.filter(_sql_ops[op](getattr(query.cls, attr), value))
+    if query.ordering is not None:
+        attr, descending = query.ordering
+        column = getattr(query.cls, attr)
+        sql = sql.order_by(column.desc() if descending else column)
+    if query.max_results is not None:
+        sql = sql.limit(query.max_results)
+    return sql
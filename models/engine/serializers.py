@@ -0,0 +1,303 @@
+#!/usr/bin/python3
+"""This module contains the serializers of the file storage engine
+
+A serializer turns records, the to_dict() form of the models, into the
+bytes of the storage files and back. Every serializer writes two kinds of
+files: a snapshot holding one record per key, and a journal of put and
+delete entries appended in order.
+"""
+import marshal
+import struct
+from datetime import datetime, timedelta
+from json import JSONDecoder, dumps, loads
+
+
+def _iter_json_object(file, chunk_size=1 << 16):
+    """This function yields the (key, value) pairs of the JSON object
+    stored in file one at a time
+
+    Only the record being decoded and one read chunk are held in memory,
+    so the whole document is never materialized.
+
+    Args:
+        file (file): a text file holding a JSON object
+        chunk_size (int): the number of characters read at a time
+    Raises:
+        ValueError: if the file does not hold a JSON object
+    """
+    decode = JSONDecoder().raw_decode
+    buf, pos, eof = "", 0, False
+
+    def fill(need_more):
+        """This function reads the next chunk, growing it for big items"""
+        nonlocal buf, pos, eof
+        chunk = file.read(max(chunk_size, len(buf) - pos) if need_more
+                          else chunk_size)
+        if not chunk:
+            eof = True
+        buf, pos = buf[pos:] + chunk, 0
+
+    def skip_space():
+        """This function moves pos to the next character that is not
+        white space and returns it, or "" at the end of the file"""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos:pos + 1]
+            fill(False)
+
+    def item():
+        """This function decodes the JSON value starting at pos"""
+        nonlocal pos
+        while True:
+            try:
+                value, end = decode(buf, pos)
+                # a value touching the end of the buffer may be cut short
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except ValueError:
+                if eof:
+                    raise
+            fill(True)
+
+    if skip_space() == "":
+        return
+    if skip_space() != "{":
+        raise ValueError("the storage file does not hold a JSON object")
+    pos += 1
+    if skip_space() == "}":
+        return
+    while True:
+        if skip_space() != '"':
+            raise ValueError("expected a key in the storage file")
+        key = item()
+        if skip_space() != ":":
+            raise ValueError("expected ':' in the storage file")
+        pos += 1
+        skip_space()
+        yield key, item()
+        sep = skip_space()
+        pos += 1
+        if sep == "}":
+            return
+        if sep != ",":
+            raise ValueError("expected ',' or '}' in the storage file")
+
+
+def _isoformat(value):
+    """This function is the JSON fallback encoder of datetimes, which
+    records decoded by the binary serializer may hold"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class JSONSerializer:
+    """This class reads and writes the JSON storage files
+
+    The snapshot is a JSON object of records by key, as json.dump writes
+    it, and the journal holds one JSON entry per line.
+
+    Attributes:
+        name (str): the name of the format
+        binary (bool): whether the files are opened in binary mode
+        extension (str): the extension of the shard files
+    """
+    name = "json"
+    binary = False
+    extension = ".json"
+
+    def encode(self, record):
+        """This method returns the text of a record"""
+        return dumps(record, default=_isoformat)
+
+    def encode_object(self, obj):
+        """This method returns the text of the record of a model"""
+        return dumps(obj.to_dict())
+
+    def begin(self, file):
+        """This method starts a file opened for writing"""
+
+    def write_snapshot(self, file, items):
+        """This method writes the (key, text) pairs of items as a JSON
+        object"""
+        file.write("{")
+        sep = ""
+        for key, text in items:
+            file.write(f"{sep}{dumps(key)}: {text}")
+            sep = ", "
+        file.write("}")
+
+    def read_snapshot(self, file):
+        """This method yields the (key, record) pairs of a snapshot"""
+        return _iter_json_object(file)
+
+    def write_entry(self, file, key, text=None):
+        """This method appends a put of text, or a delete when text is
+        None, to a journal"""
+        if text is None:
+            file.write(f'{{"op": "del", "key": {dumps(key)}}}\n')
+        else:
+            file.write(f'{{"op": "put", "key": {dumps(key)}, '
+                       f'"value": {text}}}\n')
+
+    def read_entries(self, file):
+        """This method yields the (key, record) pairs of a journal, the
+        record being None for a delete, and stops at a torn last line"""
+        for line in file:
+            try:
+                entry = loads(line)
+            except ValueError:
+                return
+            yield entry["key"], entry.get("value")
+
+
+class BinarySerializer:
+    """This class reads and writes the binary storage files
+
+    Every file starts with a header made of a magic string, the format
+    version and the marshal version of its records. It is followed by
+    entries made of an op byte (P for put, D for delete) and the UTF-8
+    key, then for a put the marshal encoded record, both prefixed by
+    their length as a little-endian 32 bits integer. A snapshot is a file
+    of puts. Datetimes are stored as integer microseconds since the
+    epoch, wrapped in a 1-tuple to tell them apart from plain integers,
+    so no ISO text is formatted nor parsed.
+
+    The records are written in marshal version 4, which every Python 3
+    since 3.4 reads, so the files do not depend on the Python writing
+    them. A file of any marshal version up to the one of the running
+    Python is read, marshal loading its older versions.
+
+    Attributes:
+        name (str): the name of the format
+        binary (bool): whether the files are opened in binary mode
+        extension (str): the extension of the shard files
+        magic (bytes): the first bytes of every binary file
+        marshal_version (int): the marshal version the records are
+            written in
+    """
+    name = "binary"
+    binary = True
+    extension = ".bin"
+    magic = b"HBNB"
+    marshal_version = 4
+    header = magic + bytes([1, marshal_version])
+    __length = struct.Struct("<I")
+    __epoch = datetime(1970, 1, 1)
+    __microsecond = timedelta(microseconds=1)
+
+    def encode(self, record):
+        """This method returns the payload of a record"""
+        epoch, microsecond = self.__epoch, self.__microsecond
+        encoded = {}
+        for key, value in record.items():
+            if isinstance(value, datetime):
+                value = ((value - epoch) // microsecond,)
+            elif type(value) is tuple:
+                # tuples mark datetimes, JSON would make it a list too
+                value = list(value)
+            encoded[key] = value
+        return marshal.dumps(encoded, self.marshal_version)
+
+    def encode_object(self, obj):
+        """This method returns the payload of the record of a model,
+        without going through the ISO text of to_dict()"""
+        record = obj.__dict__.copy()
+        record["__class__"] = type(obj).__name__
+        return self.encode(record)
+
+    def decode(self, payload):
+        """This method returns the record of a payload"""
+        record = marshal.loads(payload)
+        epoch = self.__epoch
+        for key, value in record.items():
+            if type(value) is tuple:
+                record[key] = epoch + timedelta(0, 0, value[0])
+        return record
+
+    def begin(self, file):
+        """This method writes the header at the start of a new file"""
+        if file.tell() == 0:
+            file.write(self.header)
+
+    def write_snapshot(self, file, items):
+        """This method writes the (key, payload) pairs of items"""
+        self.begin(file)
+        for key, payload in items:
+            self.write_entry(file, key, payload)
+
+    def read_snapshot(self, file):
+        """This method yields the (key, record) pairs of a snapshot"""
+        return self.read_entries(file)
+
+    def write_entry(self, file, key, payload=None):
+        """This method appends a put of payload, or a delete when payload
+        is None"""
+        pack = self.__length.pack
+        data = key.encode()
+        if payload is None:
+            file.write(b"D" + pack(len(data)) + data)
+        else:
+            file.write(b"P" + pack(len(data)) + data +
+                       pack(len(payload)) + payload)
+
+    def __read_block(self, file):
+        """This method reads a length-prefixed block, or returns None if
+        the file ends before it does"""
+        head = file.read(self.__length.size)
+        if len(head) < self.__length.size:
+            return None
+        length, = self.__length.unpack(head)
+        data = file.read(length)
+        return data if len(data) == length else None
+
+    def read_entries(self, file):
+        """This method yields the (key, record) pairs of a file, the
+        record being None for a delete, and stops at a torn last entry
+
+        A file positioned past its start, at the end of the entries
+        already read, is read from there on.
+
+        Raises:
+            ValueError: if the file was written by another format version
+                or a newer marshal version
+        """
+        if file.tell() == 0:
+            header = file.read(len(self.header))
+            if not header:
+                return
+            if header[:-1] != self.header[:-1] or \
+                    header[-1] > marshal.version:
+                raise ValueError("unsupported binary storage file version")
+        while True:
+            op = file.read(1)
+            key = self.__read_block(file)
+            if key is None:
+                return
+            if op == b"D":
+                yield key.decode(), None
+                continue
+            payload = self.__read_block(file)
+            if op != b"P" or payload is None:
+                return
+            yield key.decode(), self.decode(payload)
+
+
+serializers = {cls.name: cls() for cls in (JSONSerializer, BinarySerializer)}
+
+
+def detect(path):
+    """This function returns the serializer of an existing file, or None
+    if the file does not exist"""
+    try:
+        with open(path, "rb") as file:
+            start = file.read(len(BinarySerializer.magic))
+    except FileNotFoundError:
+        return None
+    if start == BinarySerializer.magic:
+        return serializers["binary"]
+    return serializers["json"]
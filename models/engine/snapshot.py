@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""This module contains the indexed snapshot files of the file storage
+
+An indexed snapshot is a read-only image of the storage. It holds the
+binary payloads of the records one after the other, followed by an index
+of key -> (offset, length) and a trailer pointing at the index. It is
+opened with mmap, so looking a key up only decodes the bytes of its
+record, and every process opening the same snapshot shares the same
+pages of the OS page cache.
+"""
+import marshal
+import mmap
+import struct
+from models.engine.serializers import serializers
+
+
+MAGIC = b"HBNBSNAP"
+_trailer = struct.Struct("<Q")
+
+
+def write_snapshot(file, items):
+    """This function writes an indexed snapshot
+
+    Args:
+        file (file): the new snapshot file, opened in binary mode
+        items (iterable): (key, binary payload) pairs, the payloads being
+            encoded by the binary serializer
+    """
+    index = {}
+    file.write(MAGIC)
+    for key, payload in items:
+        index[key] = (file.tell(), len(payload))
+        file.write(payload)
+    index_offset = file.tell()
+    file.write(marshal.dumps(index))
+    file.write(_trailer.pack(index_offset) + MAGIC)
+
+
+class SnapshotFile:
+    """This class is an indexed snapshot opened read-only
+
+    Attributes:
+        index (dict): key -> (offset, length) of the record payloads
+    """
+
+    def __init__(self, path):
+        """This method maps the snapshot at path and reads its index
+
+        Raises:
+            ValueError: if the file is not an indexed snapshot
+        """
+        with open(path, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        end = len(self.__map) - len(MAGIC)
+        if len(self.__map) < 2 * len(MAGIC) + _trailer.size or \
+                self.__map[:len(MAGIC)] != MAGIC or \
+                self.__map[end:] != MAGIC:
+            self.__map.close()
+            raise ValueError(f"{path} is not an indexed snapshot")
+        index_offset, = _trailer.unpack_from(self.__map, end - _trailer.size)
+        self.index = marshal.loads(
+            self.__map[index_offset:end - _trailer.size])
+        self.__decode = serializers["binary"].decode
+
+    def record(self, key):
+        """This method decodes the record of key
+
+        Raises:
+            KeyError: if key is not in the snapshot
+        """
+        offset, length = self.index[key]
+        return self.__decode(self.__map[offset:offset + length])
+
+    def close(self):
+        """This method unmaps the snapshot"""
+        self.__map.close()
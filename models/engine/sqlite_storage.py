@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+"""This module contains the SQLite storage engine for the airBnB clone app"""
+import json
+import sqlite3
+from datetime import datetime
+from os import getenv
+from models.engine import _class_name, _model_classes
+from models.engine.indexes import FOREIGN_KEYS, NUMERIC_FIELDS
+from models.engine.query import Query
+from models.engine.serializers import serializers
+
+
+_symbols = {"eq": "=", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+
+
+def _param(value):
+    """This function returns value as it is stored in the JSON records"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class SQLiteStorage:
+    """This class is the SQLite storage engine for the airBnB clone app
+
+    Every object is a row of the objects table holding its key, its class
+    name and its to_dict() as JSON. The database (HBNB_SQLITE_PATH,
+    file.db by default) runs in WAL mode, so readers never wait for the
+    writer. The table is indexed on the class and, for the foreign keys
+    and numeric fields, on the class and the JSON attribute, which find()
+    and query() use.
+
+    The objects are kept in memory by key like in the file storage, and
+    models report their changes through touch(). save() only writes the
+    objects created, changed or deleted since the last save, and commits.
+    find() and query() first write the pending changes in a savepoint so
+    that the SQL sees them, as SQLAlchemy autoflushes, and roll it back
+    once the rows are read: a read neither holds the write lock of the
+    database nor takes the changes away from the next save().
+
+    Attributes:
+        __path (str): the path of the database
+        __connection (Connection): the database connection, None until
+            it is first used and after close()
+        __objects (dict): the objects stored in the storage
+        __classes (dict): class name -> keys of that class
+        __dirty (set): keys created, changed or deleted since the last
+            write
+        __indexed (list): the (class name, attribute) pairs indexed
+    """
+
+    def __init__(self):
+        """This method sets up the storage from the environment"""
+        self.__path = getenv("HBNB_SQLITE_PATH", "file.db")
+        self.__connection = None
+        self.__objects = {}
+        self.__classes = {}
+        self.__dirty = set()
+        self.__classes_by_name = None
+        self.__indexed = [(cls_name, attr)
+                          for fields in (FOREIGN_KEYS, NUMERIC_FIELDS)
+                          for cls_name, attrs in fields.items()
+                          for attr in attrs]
+
+    def all(self, cls=None):
+        """This method returns all objects in storage
+
+        Args:
+            cls (type or str): only return the objects of this class
+        Returns:
+            dict: the stored objects by "<class name>.<id>" key
+        """
+        if cls is None:
+            return self.__objects
+        bucket = self.__classes.get(_class_name(cls), {})
+        return {key: self.__objects[key] for key in bucket}
+
+    def count(self, cls=None):
+        """This method returns the number of objects in storage
+
+        Args:
+            cls (type or str): only count the objects of this class
+        """
+        if cls is None:
+            return len(self.__objects)
+        return len(self.__classes.get(_class_name(cls), ()))
+
+    def new(self, obj):
+        """This method adds a new object to storage"""
+        key = f"{obj.__class__.__name__}.{obj.id}"
+        self.__put(key, obj)
+        self.__dirty.add(key)
+
+    def touch(self, obj):
+        """This method marks obj as changed if it is the stored object
+        of its key, models call it right before one of their attributes
+        is set or deleted"""
+        key = f"{obj.__class__.__name__}.{obj.__dict__.get('id')}"
+        if self.__objects.get(key) is obj:
+            self.__dirty.add(key)
+
+    def delete(self, obj=None):
+        """This method removes obj from storage if it is stored"""
+        if obj is None:
+            return
+        key = f"{obj.__class__.__name__}.{obj.id}"
+        if key in self.__objects:
+            del self.__objects[key]
+            del self.__classes[key.partition(".")[0]][key]
+            self.__dirty.add(key)
+
+    def save(self):
+        """This method writes the changed objects and commits"""
+        self.__flush()
+        self.__connect().commit()
+
+    def find(self, cls, **criteria):
+        """This method returns the objects of cls whose attributes equal
+        the criteria, like find(City, state_id=state.id)"""
+        return list(self.query(cls).filter(**criteria))
+
+    def query(self, cls):
+        """This method returns a query over the objects of cls, compiled
+        to SQL over the JSON attributes, explain() giving SQLite's plan
+
+        The contains operator is checked on the objects, the others in
+        SQL, all of them on the objects too.
+        """
+        return Query(cls, self.__run_query)
+
+    def create_index(self, cls, attr):
+        """This method indexes the attribute attr of the objects of cls
+
+        Raises:
+            ValueError: if attr is not an identifier
+        """
+        self.__indexed.append((_class_name(cls), attr))
+        if self.__connection is not None:
+            self.__create_index(attr)
+            self.__connection.commit()
+
+    def reload(self):
+        """This method opens the database, creates the table and indexes
+        if needed, and loads the objects"""
+        for key, data in self.__connect().execute(
+                "SELECT key, data FROM objects"):
+            self.__put(key, self.__build(data))
+
+    def close(self):
+        """This method closes the database, dropping the changes that
+        were not saved, the next use opening it again"""
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __connect(self):
+        """This method returns the connection, opening the database and
+        creating the table and indexes if needed the first time"""
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.__path)
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute("PRAGMA synchronous=NORMAL")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS objects (key TEXT PRIMARY KEY, "
+                "class TEXT NOT NULL, data TEXT NOT NULL)")
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS objects_class ON objects (class)")
+            for _, attr in self.__indexed:
+                self.__create_index(attr)
+            self.__connection.commit()
+        return self.__connection
+
+    def __put(self, key, obj):
+        """This method stores obj under key and in its class bucket"""
+        self.__objects[key] = obj
+        self.__classes.setdefault(key.partition(".")[0], {})[key] = None
+
+    def __build(self, data):
+        """This method builds the model object of a JSON record"""
+        if self.__classes_by_name is None:
+            self.__classes_by_name = _model_classes()
+        record = json.loads(data)
+        return self.__classes_by_name[record["__class__"]](**record)
+
+    def __flush(self):
+        """This method writes the changed objects in the transaction and
+        forgets they changed"""
+        self.__write()
+        self.__dirty.clear()
+
+    def __write(self):
+        """This method writes the changed objects in the transaction"""
+        if not self.__dirty:
+            return
+        rows, gone = [], []
+        encode = serializers["json"].encode_object
+        for key in self.__dirty:
+            if key in self.__objects:
+                rows.append((key, key.partition(".")[0],
+                             encode(self.__objects[key])))
+            else:
+                gone.append((key,))
+        connection = self.__connect()
+        connection.executemany(
+            "DELETE FROM objects WHERE key = ?", gone)
+        connection.executemany(
+            "INSERT OR REPLACE INTO objects (key, class, data) "
+            "VALUES (?, ?, ?)", rows)
+
+    @staticmethod
+    def __column(attr):
+        """This method returns the SQL of the JSON attribute attr
+
+        Raises:
+            ValueError: if attr is not an identifier
+        """
+        if not attr.isidentifier():
+            raise ValueError(f"invalid attribute name: {attr}")
+        return f"json_extract(data, '$.{attr}')"
+
+    def __create_index(self, attr):
+        """This method creates the index of the JSON attribute attr"""
+        self.__connection.execute(
+            f"CREATE INDEX IF NOT EXISTS objects_{attr} "
+            f"ON objects (class, {self.__column(attr)})")
+
+    def __condition(self, attr, op, value):
+        """This method returns the SQL and the parameters of a filter, or
+        None if it can only be checked on the objects"""
+        column = self.__column(attr)
+        if op in ("eq", "ne") and value is None:
+            return f"{column} IS {'NOT ' if op == 'ne' else ''}NULL", []
+        if op == "ne":
+            return f"({column} IS NULL OR {column} != ?)", [_param(value)]
+        if op == "in":
+            values = [_param(item) for item in value]
+            marks = ", ".join("?" * len(values))
+            return f"{column} IN ({marks})", values
+        if op not in _symbols:
+            return None
+        value = _param(value)
+        sql = f"{column} {_symbols[op]} ?"
+        if op != "eq" and type(value) in (int, float):
+            sql += f" AND typeof({column}) IN ('integer', 'real')"
+        elif op != "eq" and type(value) is str:
+            sql += f" AND typeof({column}) = 'text'"
+        return sql, [value]
+
+    def __run_query(self, query):
+        """This method compiles a query and returns SQLite's plan and a
+        lazy iterator over the results, whose rows are read at once if
+        changes are pending"""
+        where, params, exact = ["class = ?"], [_class_name(query.cls)], True
+        for attr, op, value in query.filters:
+            condition = self.__condition(attr, op, value)
+            if condition is None:
+                exact = False
+                continue
+            where.append(condition[0])
+            params.extend(condition[1])
+        sql = "SELECT key, data FROM objects WHERE " + " AND ".join(where)
+        if query.ordering is not None:
+            attr, descending = query.ordering
+            sql += f" ORDER BY {self.__column(attr)}"
+            sql += " DESC" if descending else ""
+        if exact and query.max_results is not None:
+            sql += f" LIMIT {int(query.max_results)}"
+        connection = self.__connect()
+        if not self.__dirty:
+            plan = self.__plan(sql, params)
+            return plan, self.__results(query, connection.execute(sql,
+                                                                  params))
+        connection.execute("SAVEPOINT query")
+        try:
+            self.__write()
+            plan = self.__plan(sql, params)
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.execute("ROLLBACK TO query")
+            connection.execute("RELEASE query")
+        return plan, self.__results(query, rows)
+
+    def __plan(self, sql, params):
+        """This method returns SQLite's plan of a query"""
+        return "; ".join(row[-1] for row in self.__connect().execute(
+            "EXPLAIN QUERY PLAN " + sql, params))
+
+    def __results(self, query, rows):
+        """This method yields the objects of the (key, data) rows of a
+        query passing its filters, from memory when they are loaded
+        already"""
+        if query.max_results is not None and query.max_results <= 0:
+            return
+        count = 0
+        for key, data in rows:
+            obj = self.__objects.get(key)
+            if obj is None:
+                obj = self.__build(data)
+                self.__put(key, obj)
+            if not query.matches(lambda attr: getattr(obj, attr, None)):
+                continue
+            yield obj
+            count += 1
+            if count == query.max_results:
+                return
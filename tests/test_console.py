@@ -2,12 +2,15 @@
 """This module contains all the test cases for the console.py file."""
 import unittest
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
 from io import StringIO
 from console import HBNBCommand
 from unittest.mock import patch
-from models import storage
-from models.engine.file_storage import FileStorage
+import models
+from models.engine.file_storage import ConflictError, FileStorage
 from models.base_model import BaseModel
 from models.user import User
 from models.state import State
@@ -20,6 +23,23 @@ from models.review import Review
 class TestConsole(unittest.TestCase):
     """Test cases for the console module."""
 
+    @classmethod
+    def setUpClass(cls):
+        """Make the console use a storage in a temporary directory."""
+        cls.tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(cls.tmp_dir, "file.json")
+        with patch.dict(os.environ, {"HBNB_FILE_PATH": path}):
+            cls.storage = FileStorage()
+        cls.storage_patch = patch.object(models, "storage", cls.storage)
+        cls.storage_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Restore the storage and remove the temporary directory."""
+        cls.storage_patch.stop()
+        cls.storage.close()
+        shutil.rmtree(cls.tmp_dir)
+
     def setUp(self):
         """Set up the test environment."""
         self.console = HBNBCommand()
@@ -721,6 +741,74 @@ class TestConsole(unittest.TestCase):
             self.console.onecmd(f'BaseModel.update("123456", "name", "Betty")')
             self.assertEqual(f.getvalue(), "** no instance found **\n")
 
+    def test_conflict(self):
+        """Test the commands whose save meets a change of another
+        process."""
+        user = User()
+        user.save()
+        error = "** changed by another process: User.1 **\n"
+        commands = ["create User", f"update User {user.id} name Betty",
+                    f'User.update("{user.id}", {{"name": "Holberton"}})',
+                    f"destroy User {user.id}"]
+        with patch.object(FileStorage, "save", autospec=True,
+                          side_effect=ConflictError(["User.1"])):
+            for command in commands:
+                with patch('sys.stdout', new=StringIO()) as f:
+                    self.console.onecmd(command)
+                    self.assertEqual(f.getvalue(), error)
+        for obj in list(models.storage.all(User).values()):
+            models.storage.delete(obj)
+        models.storage.save()
+
+
+class TestConsoleStartup(unittest.TestCase):
+    """Test cases for the startup time of the console."""
+
+    # seconds allowed to import the console over an empty store, several
+    # times what it takes without SQLAlchemy and the models
+    budget = 0.25
+
+    def test_import_budget(self):
+        """Test that importing the console with the file storage loads
+        neither SQLAlchemy nor the models, and stays within budget."""
+        script = (
+            "import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import console\n"
+            "print(time.perf_counter() - start)\n"
+            "print(' '.join(sorted(sys.modules)))\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        env.pop("HBNB_TYPE_STORAGE", None)
+        env.pop("HBNB_FILE_PATH", None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = subprocess.run(
+                [sys.executable, "-c", script], cwd=tmp_dir, env=env,
+                capture_output=True, text=True, check=True).stdout
+        elapsed, modules = output.splitlines()
+        modules = modules.split()
+        for module in ("sqlalchemy", "multiprocessing", "models.base_model",
+                       "models.user"):
+            self.assertNotIn(module, modules)
+        self.assertLess(float(elapsed), self.budget)
+
+    def test_quit_does_not_load(self):
+        """Test that commands not using the objects do not read the
+        store."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env.pop("HBNB_TYPE_STORAGE", None)
+        env.pop("HBNB_FILE_PATH", None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "file.json"), "w") as file:
+                file.write("{not json")
+            result = subprocess.run(
+                [sys.executable, os.path.join(root, "console.py")],
+                cwd=tmp_dir, env=env, input="help quit\nquit\n",
+                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stderr, "")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,1807 @@
+#!/usr/bin/python3
+"""This module is for testing the file storage class"""
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import models
+from models.engine import file_storage
+from models.engine.file_storage import ConflictError, FileStorage
+from models.engine.serializers import serializers
+from models.base_model import BaseModel
+from models.user import User
+from models.city import City
+from models.place import Place
+from models.state import State
+
+
+class TestFileStorageBase(unittest.TestCase):
+    """This class runs each test against a fresh store in a temp dir"""
+
+    env = {}
+
+    def setUp(self) -> None:
+        """This method points the storage at a temporary file"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "file.json")
+        self.env_patch = patch.dict(os.environ, dict(
+            self.env, HBNB_FILE_PATH=self.path))
+        self.env_patch.start()
+
+    def tearDown(self) -> None:
+        """This method removes the temporary files"""
+        self.env_patch.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def reopen(self):
+        """This method returns a new storage reloaded from the files"""
+        storage = FileStorage()
+        storage.reload()
+        return storage
+
+
+class TestFileStorage(TestFileStorageBase):
+    """This class is for testing the default snapshot mode"""
+
+    def test_save_reload(self):
+        """This method tests a save followed by a reload"""
+        storage = FileStorage()
+        user = User()
+        user.email = "a@b.c"
+        storage.new(user)
+        storage.save()
+        with open(self.path, "r") as file:
+            self.assertEqual(json.load(file)[f"User.{user.id}"],
+                             user.to_dict())
+        self.assertFalse(os.path.exists(self.path + ".log"))
+        reloaded = self.reopen().all()[f"User.{user.id}"]
+        self.assertEqual(reloaded.to_dict(), user.to_dict())
+
+    def test_delete(self):
+        """This method tests that deleted objects are not saved"""
+        storage = FileStorage()
+        model = BaseModel()
+        storage.new(model)
+        storage.save()
+        storage.delete(model)
+        storage.delete(None)
+        storage.save()
+        self.assertNotIn(f"BaseModel.{model.id}", self.reopen().all())
+
+    def test_all_and_count_by_class(self):
+        """This method tests the per-class buckets"""
+        storage = FileStorage()
+        users = [User() for _ in range(2)]
+        model = BaseModel()
+        for obj in users + [model]:
+            storage.new(obj)
+        self.assertEqual(storage.count(), 3)
+        self.assertEqual(storage.count(User), 2)
+        self.assertEqual(storage.count("BaseModel"), 1)
+        self.assertEqual(storage.count("City"), 0)
+        self.assertEqual(list(storage.all(User).values()), users)
+        self.assertEqual(storage.all("BaseModel"),
+                         {f"BaseModel.{model.id}": model})
+        self.assertEqual(storage.all("City"), {})
+        storage.delete(users[0])
+        self.assertEqual(list(storage.all("User").values()), users[1:])
+        storage.save()
+        reloaded = self.reopen()
+        self.assertEqual(reloaded.count(User), 1)
+        self.assertEqual(list(reloaded.all(User)), [f"User.{users[1].id}"])
+
+    def test_write_all(self):
+        """This method tests that writing to the dict of all() is the
+        same as calling new() or delete()"""
+        storage = FileStorage()
+        with patch.object(models, "storage", storage):
+            user = User()
+            user.first_name = "Betty"
+            storage.save()
+            del storage.all()[f"User.{user.id}"]
+            self.assertEqual(storage.count(User), 0)
+            self.assertEqual(storage.all(User), {})
+            self.assertEqual(storage.find(User, first_name="Betty"), [])
+            storage.all()[f"User.{user.id}"] = user
+            self.assertEqual(storage.all(User), {f"User.{user.id}": user})
+            self.assertEqual(storage.find(User, first_name="Betty"), [user])
+            self.assertIs(storage.all().pop(f"User.{user.id}"), user)
+            with self.assertRaises(KeyError):
+                del storage.all()[f"User.{user.id}"]
+            with self.assertRaises(ValueError):
+                storage.all()["User.other"] = user
+            storage.save()
+        self.assertEqual(self.reopen().count(User), 0)
+
+
+class TestFileStorageDirty(TestFileStorageBase):
+    """This class is for testing that saves only serialize changes"""
+
+    def setUp(self) -> None:
+        """This method makes the models report to a fresh storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        self.storage_patch = patch.object(models, "storage", self.storage)
+        self.storage_patch.start()
+        self.users = [User() for _ in range(5)]
+        self.storage.save()
+
+    def tearDown(self) -> None:
+        """This method restores the models storage"""
+        self.storage_patch.stop()
+        super().tearDown()
+
+    def count_to_dict(self):
+        """This method returns a patch counting to_dict calls"""
+        return patch.object(BaseModel, "to_dict", autospec=True,
+                            side_effect=BaseModel.to_dict)
+
+    def test_snapshot_serializes_changed_only(self):
+        """This method tests a full rewrite after one change"""
+        with self.count_to_dict() as to_dict:
+            self.storage.save()
+            self.assertEqual(to_dict.call_count, 0)
+            self.users[0].first_name = "Betty"
+            self.users[1].last_name = "Holberton"
+            self.assertEqual(to_dict.call_count, 0)
+            self.users[2].save()
+            self.assertEqual(to_dict.call_count, 3)
+        with open(self.path, "r") as file:
+            saved = json.load(file)
+        self.assertEqual(len(saved), 5)
+        for user in self.users:
+            self.assertEqual(saved[f"User.{user.id}"], user.to_dict())
+
+    def test_lists_changed_in_place(self):
+        """This method tests that a snapshot rewrite writes the lists
+        changed in place, touch() not hearing of those changes"""
+        place = Place()
+        place.amenity_ids = []
+        self.storage.save()
+        place.amenity_ids.append("wifi")
+        self.users[0].first_name = "Betty"
+        with self.count_to_dict() as to_dict:
+            self.storage.save()
+            self.assertEqual(to_dict.call_count, 2)
+        saved = self.reopen().all()[f"Place.{place.id}"]
+        self.assertEqual(saved.amenity_ids, ["wifi"])
+
+    def test_unstored_objects_are_not_marked(self):
+        """This method tests that only stored objects become dirty"""
+        user = User(**self.users[0].to_dict())
+        user.first_name = "Copy"
+        with self.count_to_dict() as to_dict:
+            self.storage.save()
+            self.assertEqual(to_dict.call_count, 0)
+
+    def test_journal_gets_changed_records(self):
+        """This method tests the journal after attribute changes"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = FileStorage()
+        with patch.object(models, "storage", storage):
+            users = [User() for _ in range(3)]
+            storage.save()
+            users[2].last_name = "Holberton"
+            users[1].email = "a@b.c"
+            storage.save()
+        with open(self.path + ".log", "r") as file:
+            entries = [json.loads(line) for line in file][3:]
+        self.assertEqual(sorted(entry["key"] for entry in entries),
+                         sorted([f"User.{users[1].id}",
+                                 f"User.{users[2].id}"]))
+        reloaded = self.reopen().all()
+        self.assertEqual(reloaded[f"User.{users[2].id}"].last_name,
+                         "Holberton")
+
+
+class TestFileStorageBatch(TestFileStorageBase):
+    """This class is for testing batched saves"""
+
+    def setUp(self) -> None:
+        """This method makes the models report to a fresh storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        self.storage_patch = patch.object(models, "storage", self.storage)
+        self.storage_patch.start()
+        self.user = User()
+        self.user.first_name = "Betty"
+        self.storage.save()
+
+    def tearDown(self) -> None:
+        """This method restores the models storage"""
+        self.storage_patch.stop()
+        super().tearDown()
+
+    def test_saves_once(self):
+        """This method tests that the saves are merged into one"""
+        with patch.object(FileStorage, "_FileStorage__save",
+                          autospec=True) as write:
+            with self.storage.batch():
+                for _ in range(10):
+                    User().save()
+                with self.storage.batch():
+                    self.user.save()
+                self.assertEqual(write.call_count, 0)
+            self.assertEqual(write.call_count, 1)
+        with self.storage.batch():
+            created = [User() for _ in range(3)]
+            self.storage.save()
+        self.assertEqual(self.reopen().count(User), 14)
+        self.assertIn(f"User.{created[0].id}", self.reopen().all())
+
+    def test_no_save_without_save_call(self):
+        """This method tests that a batch without save() writes nothing"""
+        with patch.object(FileStorage, "_FileStorage__save",
+                          autospec=True) as write:
+            with self.storage.batch():
+                User()
+            self.assertEqual(write.call_count, 0)
+
+    def test_rollback(self):
+        """This method tests that an escaping exception undoes the batch"""
+        other = User()
+        self.storage.save()
+        with self.assertRaises(ZeroDivisionError):
+            with self.storage.batch():
+                created = User()
+                self.user.first_name = "Holberton"
+                self.user.last_name = "School"
+                self.storage.delete(other)
+                self.storage.save()
+                1 / 0
+        self.assertEqual(self.user.first_name, "Betty")
+        self.assertNotIn("last_name", self.user.__dict__)
+        self.assertNotIn(f"User.{created.id}", self.storage.all())
+        self.assertIs(self.storage.all()[f"User.{other.id}"], other)
+        self.assertEqual(self.storage.count(User), 2)
+        self.storage.save()
+        with open(self.path, "r") as file:
+            saved = json.load(file)
+        self.assertEqual(saved[f"User.{self.user.id}"]["first_name"],
+                         "Betty")
+        self.assertEqual(len(saved), 2)
+
+    def test_rollback_in_journal_mode(self):
+        """This method tests that undone changes are not journaled"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+        with patch.object(models, "storage", storage):
+            user = storage.all()[f"User.{self.user.id}"]
+            with self.assertRaises(KeyError):
+                with storage.batch():
+                    user.first_name = "Holberton"
+                    storage.save()
+                    raise KeyError()
+            storage.save()
+        self.assertFalse(os.path.exists(self.path + ".log"))
+
+    def test_batch_of_one_thread(self):
+        """This method tests that a batch neither defers nor undoes the
+        changes and saves of the other threads"""
+        began, saved = threading.Event(), threading.Event()
+        created = []
+
+        def other_thread():
+            began.wait()
+            created.append(User())
+            self.storage.save()
+            saved.set()
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        with self.assertRaises(ZeroDivisionError):
+            with self.storage.batch():
+                self.user.first_name = "Holberton"
+                began.set()
+                saved.wait()
+                with open(self.path, "r") as file:
+                    self.assertIn(f"User.{created[0].id}", json.load(file))
+                1 / 0
+        thread.join()
+        self.assertEqual(self.user.first_name, "Betty")
+        self.assertIs(self.storage.all()[f"User.{created[0].id}"],
+                      created[0])
+        self.storage.save()
+        reloaded = self.reopen().all()
+        self.assertIn(f"User.{created[0].id}", reloaded)
+        self.assertEqual(reloaded[f"User.{self.user.id}"].first_name,
+                         "Betty")
+
+
+class TestFileStorageWriteBehind(TestFileStorageBase):
+    """This class is for testing the write-behind mode"""
+
+    env = {"HBNB_FILE_WRITE_BEHIND": "50",
+           "HBNB_FILE_WRITE_BEHIND_CHANGES": "5"}
+
+    def setUp(self) -> None:
+        """This method makes the models report to a fresh storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        self.storage_patch = patch.object(models, "storage", self.storage)
+        self.storage_patch.start()
+
+    def tearDown(self) -> None:
+        """This method stops the flusher and restores the storage"""
+        self.storage.close()
+        self.storage_patch.stop()
+        super().tearDown()
+
+    def wait_for_file(self, timeout=2):
+        """This method waits for the flusher to write the store"""
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(self.path):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_save_returns_before_writing(self):
+        """This method tests that close() writes the scheduled save"""
+        with patch.dict(os.environ, {"HBNB_FILE_WRITE_BEHIND": "60000"}):
+            storage = FileStorage()
+        with patch.object(models, "storage", storage):
+            User().save()
+            self.assertFalse(os.path.exists(self.path))
+            storage.close()
+        self.assertEqual(self.reopen().count(User), 1)
+
+    def test_debounce(self):
+        """This method tests that the flusher writes after the delay, on
+        a clock of the test so that a slow run can not reach it early"""
+        now = [1000.0]
+        with patch.object(file_storage, "monotonic", lambda: now[0]):
+            User().save()
+            time.sleep(0.2)
+            self.assertFalse(os.path.exists(self.path))
+            now[0] += 0.05
+            self.wait_for_file()
+        self.assertEqual(self.reopen().count(User), 1)
+
+    def test_flush_after_changes(self):
+        """This method tests that enough changes are written at once"""
+        with patch.dict(os.environ, {"HBNB_FILE_WRITE_BEHIND": "60000"}):
+            storage = FileStorage()
+        with patch.object(models, "storage", storage):
+            for _ in range(5):
+                User().save()
+            try:
+                self.wait_for_file()
+            finally:
+                storage.close()
+
+    def test_flush(self):
+        """This method tests flush(wait=True)"""
+        user = User()
+        user.save()
+        self.storage.flush()
+        self.assertTrue(os.path.exists(self.path))
+        user.first_name = "Betty"
+        self.storage.save()
+        self.storage.flush(wait=False)
+        deadline = time.monotonic() + 2
+        while self.reopen().all()[f"User.{user.id}"].__dict__.get(
+                "first_name") != "Betty":
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_flush_raises_flusher_errors(self):
+        """This method tests that write errors reach flush()"""
+        with patch.object(FileStorage, "_FileStorage__save",
+                          side_effect=OSError("disk full")):
+            User().save()
+            self.storage.flush(wait=False)
+            time.sleep(0.2)
+        with self.assertRaises(OSError):
+            self.storage.flush()
+
+
+class TestFileStorageSharded(TestFileStorageBase):
+    """This class is for testing the class-sharded layout"""
+
+    env = {"HBNB_FILE_SHARDED": "1"}
+
+    def setUp(self) -> None:
+        """This method makes the models report to a fresh storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        self.storage_patch = patch.object(models, "storage", self.storage)
+        self.storage_patch.start()
+        self.shard_dir = self.path + ".d"
+
+    def tearDown(self) -> None:
+        """This method restores the models storage"""
+        self.storage_patch.stop()
+        super().tearDown()
+
+    def shard(self, cls_name):
+        """This method returns the decoded shard of cls_name"""
+        with open(os.path.join(self.shard_dir, cls_name + ".json")) as file:
+            return json.load(file)
+
+    def test_one_file_per_class(self):
+        """This method tests the shard files and a reload"""
+        users = [User() for _ in range(2)]
+        model = BaseModel()
+        self.storage.save()
+        self.assertEqual(sorted(os.listdir(self.shard_dir)),
+                         ["BaseModel.json", "User.json"])
+        self.assertEqual(self.shard("User"),
+                         {f"User.{user.id}": user.to_dict()
+                          for user in users})
+        self.assertFalse(os.path.exists(self.path))
+        reloaded = self.reopen()
+        self.assertEqual(reloaded.count(User), 2)
+        self.assertEqual(reloaded.all()[f"BaseModel.{model.id}"].to_dict(),
+                         model.to_dict())
+
+    def test_save_rewrites_changed_classes_only(self):
+        """This method tests that clean shards are left alone"""
+        user = User()
+        model = BaseModel()
+        self.storage.save()
+        base_shard = os.path.join(self.shard_dir, "BaseModel.json")
+        os.utime(base_shard, ns=(0, 0))
+        user.first_name = "Betty"
+        self.storage.save()
+        self.assertEqual(os.stat(base_shard).st_mtime_ns, 0)
+        self.assertEqual(self.shard("User")[f"User.{user.id}"]["first_name"],
+                         "Betty")
+        self.storage.delete(model)
+        self.storage.save()
+        self.assertFalse(os.path.exists(base_shard))
+
+    def test_migrates_from_single_file(self):
+        """This method tests loading file.json into a sharded storage"""
+        with patch.dict(os.environ, {"HBNB_FILE_SHARDED": ""}):
+            storage = FileStorage()
+            user = User()
+            storage.new(user)
+            storage.save()
+        reloaded = self.reopen()
+        reloaded.save()
+        self.assertIn(f"User.{user.id}", self.shard("User"))
+        self.assertFalse(os.path.exists(self.path))
+        with patch.dict(os.environ, {"HBNB_FILE_SHARDED": ""}):
+            storage = self.reopen()
+            self.assertIn(f"User.{user.id}", storage.all())
+            user.first_name = "Betty"
+            storage.new(user)
+            storage.save()
+        self.assertFalse(os.path.exists(self.shard_dir))
+        self.assertEqual(self.reopen().all()[f"User.{user.id}"].first_name,
+                         "Betty")
+
+    def test_convert_layout(self):
+        """This method tests switching the layout of a running storage"""
+        user = User()
+        self.storage.save()
+        self.storage.convert(sharded=False)
+        self.assertFalse(os.path.exists(self.shard_dir))
+        with open(self.path) as file:
+            self.assertIn(f"User.{user.id}", json.load(file))
+        user.first_name = "Betty"
+        self.storage.save()
+        self.assertFalse(os.path.exists(self.shard_dir))
+        self.storage.convert(sharded=True)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.shard("User")[f"User.{user.id}"]["first_name"],
+                         "Betty")
+        self.assertEqual(self.reopen().count(User), 1)
+
+    def test_snapshot_after_journal_writes_journaled_classes(self):
+        """This method tests a snapshot written after a journal replay"""
+        user = User()
+        self.storage.save()
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+            city = User()
+            storage.new(city)
+            storage.save()
+            self.assertTrue(os.path.exists(self.path + ".log"))
+        self.reopen().save()
+        self.assertFalse(os.path.exists(self.path + ".log"))
+        self.assertEqual(sorted(self.shard("User")),
+                         sorted([f"User.{user.id}", f"User.{city.id}"]))
+
+
+class TestFileStorageLazy(TestFileStorageBase):
+    """This class is for testing the lazy mode"""
+
+    env = {"HBNB_FILE_LAZY": "1"}
+
+    def setUp(self) -> None:
+        """This method saves a few users to load lazily"""
+        super().setUp()
+        storage = FileStorage()
+        self.users = [User() for _ in range(3)]
+        for user in self.users:
+            storage.new(user)
+        storage.new(BaseModel())
+        storage.save()
+        self.keys = [f"User.{user.id}" for user in self.users]
+
+    def built(self, storage):
+        """This method returns the keys whose objects were built"""
+        return set(storage.all()) - storage.all().pending
+
+    def test_lookup_builds_one_object(self):
+        """This method tests that a lookup only builds its object"""
+        storage = self.reopen()
+        self.assertEqual(self.built(storage), set())
+        self.assertIn(self.keys[0], storage.all())
+        self.assertEqual(storage.count(User), 3)
+        self.assertEqual(self.built(storage), set())
+        user = storage.all()[self.keys[0]]
+        self.assertIsInstance(user, User)
+        self.assertEqual(user.to_dict(), self.users[0].to_dict())
+        self.assertIs(storage.all().get(self.keys[0]), user)
+        self.assertEqual(self.built(storage), {self.keys[0]})
+
+    def test_iteration_builds_objects(self):
+        """This method tests that iterating the values builds them"""
+        storage = self.reopen()
+        users = storage.all(User)
+        self.assertEqual(self.built(storage), set(self.keys))
+        self.assertTrue(all(isinstance(user, User)
+                            for user in users.values()))
+        self.assertEqual(len(list(storage.all().values())), 4)
+        self.assertEqual(len(self.built(storage)), 4)
+
+    def test_save_keeps_unbuilt_records(self):
+        """This method tests saving and deleting without building"""
+        storage = self.reopen()
+        storage.delete(storage.all()[self.keys[0]])
+        storage.save()
+        self.assertEqual(self.built(storage), set())
+        reloaded = self.reopen()
+        self.assertEqual(reloaded.count(User), 2)
+        self.assertEqual(reloaded.all()[self.keys[1]].to_dict(),
+                         self.users[1].to_dict())
+
+
+class TestFileStorageJournal(TestFileStorageBase):
+    """This class is for testing the journal mode"""
+
+    env = {"HBNB_FILE_JOURNAL": "1"}
+
+    def test_save_appends_changes_only(self):
+        """This method tests that a save only writes the changed keys"""
+        storage = FileStorage()
+        models = [BaseModel() for _ in range(3)]
+        for model in models:
+            storage.new(model)
+        storage.save()
+        models[0].name = "changed"
+        storage.new(models[0])
+        storage.delete(models[1])
+        storage.save()
+        with open(self.path + ".log", "r") as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual(len(entries), 5)
+        self.assertEqual(sorted(e["op"] for e in entries[3:]),
+                         ["del", "put"])
+        self.assertFalse(os.path.exists(self.path))
+
+        reloaded = self.reopen().all()
+        self.assertEqual(reloaded[f"BaseModel.{models[0].id}"].name,
+                         "changed")
+        self.assertNotIn(f"BaseModel.{models[1].id}", reloaded)
+        self.assertIn(f"BaseModel.{models[2].id}", reloaded)
+
+    def test_replay_on_top_of_snapshot(self):
+        """This method tests that the journal overrides the snapshot"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": ""}):
+            storage = FileStorage()
+            model = BaseModel()
+            storage.new(model)
+            storage.save()
+        storage = self.reopen()
+        model = storage.all()[f"BaseModel.{model.id}"]
+        model.name = "journaled"
+        storage.new(model)
+        storage.save()
+        self.assertTrue(os.path.exists(self.path + ".log"))
+        self.assertEqual(
+            self.reopen().all()[f"BaseModel.{model.id}"].name, "journaled")
+
+    def test_torn_last_line_is_ignored(self):
+        """This method tests recovery from a crash during an append"""
+        storage = FileStorage()
+        model = BaseModel()
+        storage.new(model)
+        storage.save()
+        with open(self.path + ".log", "a") as file:
+            file.write('{"op": "put", "key": "BaseModel.x", "val')
+        reloaded = self.reopen().all()
+        self.assertIn(f"BaseModel.{model.id}", reloaded)
+        self.assertNotIn("BaseModel.x", reloaded)
+
+    @patch.object(FileStorage, "_FileStorage__compact_min", 2)
+    def test_compaction(self):
+        """This method tests that a long journal becomes a snapshot"""
+        storage = FileStorage()
+        model = BaseModel()
+        storage.new(model)
+        for _ in range(4):
+            storage.new(model)
+            storage.save()
+        self.assertTrue(os.path.exists(self.path))
+        self.assertIn(f"BaseModel.{model.id}", self.reopen().all())
+
+
+class TestFileStorageBinary(TestFileStorageBase):
+    """This class is for testing the binary format"""
+
+    env = {"HBNB_FILE_FORMAT": "binary"}
+
+    def test_save_reload(self):
+        """This method tests a binary snapshot and journal"""
+        storage = FileStorage()
+        users = [User() for _ in range(3)]
+        for user in users:
+            storage.new(user)
+        storage.save()
+        with open(self.path, "rb") as file:
+            self.assertEqual(file.read(4), b"HBNB")
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+            storage.delete(storage.all()[f"User.{users[0].id}"])
+            storage.save()
+        with open(self.path + ".log", "rb") as file:
+            self.assertEqual(file.read(4), b"HBNB")
+        reloaded = self.reopen().all()
+        self.assertNotIn(f"User.{users[0].id}", reloaded)
+        for user in users[1:]:
+            self.assertEqual(reloaded[f"User.{user.id}"].to_dict(),
+                             user.to_dict())
+
+    def test_detected_on_load(self):
+        """This method tests that saves keep the detected format"""
+        storage = FileStorage()
+        user = User()
+        storage.new(user)
+        storage.save()
+        with patch.dict(os.environ, {"HBNB_FILE_FORMAT": ""}):
+            storage = self.reopen()
+            storage.new(User())
+            storage.save()
+        with open(self.path, "rb") as file:
+            self.assertEqual(file.read(4), b"HBNB")
+
+    def test_convert(self):
+        """This method tests converting to JSON and back"""
+        storage = FileStorage()
+        user = User()
+        storage.new(user)
+        storage.save()
+        storage = self.reopen()
+        storage.convert("json")
+        with open(self.path, "r") as file:
+            self.assertEqual(json.load(file)[f"User.{user.id}"],
+                             user.to_dict())
+        with self.assertRaises(ValueError):
+            storage.convert("xml")
+        storage.convert("binary")
+        self.assertEqual(self.reopen().all()[f"User.{user.id}"].to_dict(),
+                         user.to_dict())
+
+    def test_sharded_convert(self):
+        """This method tests that converting replaces the shards"""
+        with patch.dict(os.environ, {"HBNB_FILE_SHARDED": "1"}):
+            storage = FileStorage()
+            storage.new(User())
+            storage.save()
+            self.assertEqual(os.listdir(self.path + ".d"), ["User.bin"])
+            storage.convert("json")
+            self.assertEqual(os.listdir(self.path + ".d"), ["User.json"])
+            self.assertEqual(self.reopen().count(User), 1)
+
+
+class TestFileStorageSnapshot(TestFileStorageBase):
+    """This class is for testing the read-only indexed snapshots"""
+
+    def setUp(self) -> None:
+        """This method dumps a few users to an indexed snapshot"""
+        super().setUp()
+        storage = FileStorage()
+        self.users = [User() for _ in range(3)]
+        self.users[0].first_name = "Betty"
+        for user in self.users:
+            storage.new(user)
+        storage.new(BaseModel())
+        self.snap_path = os.path.join(self.tmp_dir, "file.snap")
+        storage.dump_snapshot(self.snap_path)
+
+    def open_snapshot(self):
+        """This method returns a storage mapping the snapshot"""
+        with patch.dict(os.environ, {"HBNB_FILE_SNAPSHOT": self.snap_path}):
+            return self.reopen()
+
+    def test_lookup_decodes_one_record(self):
+        """This method tests that a lookup only decodes its record"""
+        storage = self.open_snapshot()
+        self.assertEqual(storage.count(), 4)
+        self.assertEqual(storage.count(User), 3)
+        key = f"User.{self.users[0].id}"
+        user = storage.all()[key]
+        self.assertEqual(user.to_dict(), self.users[0].to_dict())
+        self.assertEqual(set(storage.all()) - storage.all().pending, {key})
+        self.assertEqual([obj.id for obj in storage.all(User).values()],
+                         [user.id for user in self.users])
+        storage.close()
+        self.assertEqual(storage.count(), 0)
+
+    def test_read_only(self):
+        """This method tests that a snapshot storage can not be saved"""
+        storage = self.open_snapshot()
+        with self.assertRaises(PermissionError):
+            storage.save()
+        self.assertFalse(os.path.exists(self.path))
+        storage.close()
+
+    def test_dump_from_binary_and_lazy_storage(self):
+        """This method tests dumping records that were never built"""
+        with patch.dict(os.environ, {"HBNB_FILE_FORMAT": "binary"}):
+            storage = FileStorage()
+            for user in self.users:
+                storage.new(user)
+            storage.save()
+        with patch.dict(os.environ, {"HBNB_FILE_LAZY": "1"}):
+            self.reopen().dump_snapshot(self.snap_path)
+        storage = self.open_snapshot()
+        self.assertEqual(storage.count(), 3)
+        for user in self.users:
+            self.assertEqual(storage.all()[f"User.{user.id}"].to_dict(),
+                             user.to_dict())
+        storage.close()
+
+    def test_not_a_snapshot(self):
+        """This method tests opening a file that is not a snapshot"""
+        with open(self.snap_path, "w") as file:
+            file.write("{}")
+        with self.assertRaises(ValueError):
+            self.open_snapshot()
+
+
+class TestFileStorageDurability(TestFileStorageBase):
+    """This class is for testing the atomic saves and the fsync policies"""
+
+    def saved_storage(self, **env):
+        """This method returns a storage with one saved user, os.fsync
+        being mocked while it is created and saved"""
+        with patch.dict(os.environ, env):
+            storage = FileStorage()
+        storage.new(User())
+        storage.save()
+        return storage
+
+    def test_save_replaces_the_file(self):
+        """This method tests that a save leaves no temporary file and
+        keeps the mode of the file"""
+        self.saved_storage()
+        os.chmod(self.path, 0o600)
+        storage = self.reopen()
+        storage.new(User())
+        storage.save()
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["file.json", "file.json.lock"])
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual(self.reopen().count(), 2)
+
+    def test_failed_save_keeps_the_file(self):
+        """This method tests that a failing save leaves the old file"""
+        self.saved_storage()
+        storage = self.reopen()
+        storage.new(User())
+        with patch.object(serializers["json"], "write_snapshot",
+                          side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                storage.save()
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["file.json", "file.json.lock"])
+        self.assertEqual(self.reopen().count(), 1)
+
+    def test_unknown_policy(self):
+        """This method tests an unknown fsync policy"""
+        with patch.dict(os.environ, {"HBNB_FILE_FSYNC": "sometimes"}):
+            with self.assertRaises(ValueError):
+                FileStorage()
+
+    @patch("os.fsync")
+    def test_never(self, fsync):
+        """This method tests that the default policy never syncs"""
+        self.saved_storage().close()
+        fsync.assert_not_called()
+
+    @patch("os.fsync")
+    def test_every_save(self, fsync):
+        """This method tests that every save syncs the file and its
+        directory"""
+        storage = self.saved_storage(HBNB_FILE_FSYNC="every_save")
+        self.assertEqual(fsync.call_count, 2)
+        storage.new(User())
+        storage.save()
+        self.assertEqual(fsync.call_count, 4)
+
+    @patch("os.fsync")
+    def test_every_save_journal(self, fsync):
+        """This method tests that journal appends are synced too"""
+        env = {"HBNB_FILE_FSYNC": "every_save", "HBNB_FILE_JOURNAL": "1"}
+        storage = self.saved_storage(**env)
+        fsync.reset_mock()
+        storage.new(User())
+        storage.save()
+        self.assertTrue(os.path.exists(self.path + ".log"))
+        self.assertEqual(fsync.call_count, 2)
+
+    @patch("os.fsync")
+    def test_on_close(self, fsync):
+        """This method tests that on_close syncs when closing only"""
+        storage = self.saved_storage(HBNB_FILE_FSYNC="on_close")
+        storage.new(User())
+        storage.save()
+        fsync.assert_not_called()
+        storage.close()
+        self.assertEqual(fsync.call_count, 2)
+        storage.close()
+        self.assertEqual(fsync.call_count, 2)
+
+    @patch("os.fsync")
+    def test_interval(self, fsync):
+        """This method tests that interval syncs once the interval is
+        over"""
+        storage = self.saved_storage(HBNB_FILE_FSYNC="interval",
+                                     HBNB_FILE_FSYNC_INTERVAL="3600")
+        fsync.assert_not_called()
+        storage.close()
+        self.assertEqual(fsync.call_count, 2)
+        fsync.reset_mock()
+        self.saved_storage(HBNB_FILE_FSYNC="interval",
+                           HBNB_FILE_FSYNC_INTERVAL="0")
+        self.assertEqual(fsync.call_count, 2)
+
+
+class TestFileStorageFingerprint(TestFileStorageBase):
+    """This class is for testing the skipped reloads and refresh()"""
+
+    def setUp(self) -> None:
+        """This method saves a store of two users"""
+        super().setUp()
+        storage = FileStorage()
+        self.users = [User() for _ in range(2)]
+        for user in self.users:
+            storage.new(user)
+        storage.save()
+
+    def reads(self):
+        """This method returns a patch counting the snapshot reads"""
+        json = serializers["json"]
+        return patch.object(json, "read_snapshot", wraps=json.read_snapshot)
+
+    def test_reload_unchanged(self):
+        """This method tests that reloading unchanged files reads nothing"""
+        storage = self.reopen()
+        with self.reads() as read:
+            storage.reload()
+            self.assertFalse(storage.refresh())
+            storage.new(User())
+            storage.save()
+            storage.reload()
+        read.assert_not_called()
+
+    def test_reload_same_content(self):
+        """This method tests that a file rewritten with the same content
+        is only hashed by reload() and read again by refresh()"""
+        storage = self.reopen()
+        with open(self.path, "rb") as file:
+            data = file.read()
+        os.remove(self.path)
+        with open(self.path, "wb") as file:
+            file.write(data)
+        os.utime(self.path, ns=(1, 1))
+        with self.reads() as read:
+            storage.reload()
+            read.assert_not_called()
+            os.utime(self.path, ns=(2, 2))
+            self.assertTrue(storage.refresh())
+            self.assertEqual(read.call_count, 1)
+
+    def test_changes_of_other_process(self):
+        """This method tests picking up the changes of another storage"""
+        storage = self.reopen()
+        other = self.reopen()
+        other.delete(other.all()[f"User.{self.users[0].id}"])
+        other.new(User())
+        other.save()
+        self.assertTrue(storage.refresh())
+        self.assertEqual(set(storage.all()), set(other.all()))
+        self.assertFalse(storage.refresh())
+
+    def test_refresh_keeps_unsaved_objects(self):
+        """This method tests that refresh() keeps the unsaved objects"""
+        storage = self.reopen()
+        user = User()
+        storage.new(user)
+        other = self.reopen()
+        other.new(User())
+        other.save()
+        self.assertTrue(storage.refresh())
+        self.assertIn(f"User.{user.id}", storage.all())
+        self.assertEqual(storage.count(), 4)
+
+    def test_refresh_keeps_unsaved_changes(self):
+        """This method tests that refresh() keeps the unsaved changes and
+        updates the other objects in place"""
+        storage = self.reopen()
+        changed, clean = (storage.all()[f"User.{user.id}"]
+                          for user in self.users)
+        with patch.object(models, "storage", storage):
+            changed.first_name = "unsaved"
+        other = self.reopen()
+        with patch.object(models, "storage", other):
+            other.all()[f"User.{self.users[1].id}"].last_name = "theirs"
+        other.new(User())
+        other.save()
+        self.assertTrue(storage.refresh())
+        self.assertIs(storage.all()[f"User.{self.users[0].id}"], changed)
+        self.assertIs(storage.all()[f"User.{self.users[1].id}"], clean)
+        self.assertEqual(changed.first_name, "unsaved")
+        self.assertEqual(clean.last_name, "theirs")
+        with patch.object(models, "storage", storage):
+            clean.first_name = "later"
+            storage.save()
+        saved = self.reopen().all()
+        self.assertEqual(saved[f"User.{self.users[0].id}"].first_name,
+                         "unsaved")
+        self.assertEqual(saved[f"User.{self.users[1].id}"].first_name,
+                         "later")
+
+    def test_journal_appended_by_other_process(self):
+        """This method tests that an append to the journal by another
+        process is picked up by refresh(), or by the next save of ours"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+            other = self.reopen()
+        other.new(User())
+        other.save()
+        storage.new(User())
+        storage.save()
+        self.assertEqual(storage.count(), 4)
+        self.assertFalse(storage.refresh())
+        other.new(User())
+        other.save()
+        self.assertTrue(storage.refresh())
+        self.assertEqual(storage.count(), 5)
+        self.assertFalse(storage.refresh())
+
+
+class TestFileStorageFind(TestFileStorageBase):
+    """This class is for testing the lookups by attribute"""
+
+    def setUp(self) -> None:
+        """This method stores two states and their cities"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.states = [State(), State()]
+        self.cities = [City() for _ in range(6)]
+        for i, city in enumerate(self.cities):
+            city.state_id = self.states[i % 2].id
+            city.name = str(i)
+        for obj in self.states + self.cities:
+            self.storage.new(obj)
+
+    def test_find_indexed(self):
+        """This method tests a lookup answered from an index"""
+        found = self.storage.find(City, state_id=self.states[0].id)
+        self.assertEqual(found, self.cities[0::2])
+        self.assertEqual(self.storage.find("City", state_id="none"), [])
+        self.assertEqual(
+            self.storage.find(City, state_id=self.states[1].id, name="3"),
+            [self.cities[3]])
+
+    def test_find_not_indexed(self):
+        """This method tests a lookup scanning the class"""
+        self.assertEqual(self.storage.find(City, name="4"), [self.cities[4]])
+        self.assertEqual(self.storage.find(State), self.states)
+
+    def test_index_follows_changes(self):
+        """This method tests updates, deletes and additions"""
+        state_id = self.states[0].id
+        self.assertEqual(len(self.storage.find(City, state_id=state_id)), 3)
+        self.cities[1].state_id = state_id
+        self.storage.delete(self.cities[0])
+        city = City()
+        city.state_id = state_id
+        self.storage.new(city)
+        self.assertEqual(self.storage.find(City, state_id=state_id),
+                         [self.cities[2], self.cities[4], self.cities[1],
+                          city])
+        self.assertEqual(
+            len(self.storage.find(City, state_id=self.states[1].id)), 2)
+
+    def test_batch_rollback(self):
+        """This method tests that a rolled back change is unindexed"""
+        state_id = self.states[0].id
+        self.storage.find(City, state_id=state_id)
+        with self.assertRaises(RuntimeError):
+            with self.storage.batch():
+                self.cities[1].state_id = state_id
+                self.assertEqual(
+                    len(self.storage.find(City, state_id=state_id)), 4)
+                raise RuntimeError
+        self.assertEqual(len(self.storage.find(City, state_id=state_id)), 3)
+
+    def test_create_index_and_lazy_records(self):
+        """This method tests a new index over records not built yet"""
+        self.storage.save()
+        with patch.dict(os.environ, {"HBNB_FILE_LAZY": "1"}):
+            storage = self.reopen()
+        storage.create_index(City, "name")
+        found = storage.find(City, name="5")
+        self.assertEqual([city.id for city in found], [self.cities[5].id])
+        self.assertEqual(len(storage.find(City, state_id=self.states[0].id)),
+                         3)
+
+
+class TestFileStorageRange(TestFileStorageBase):
+    """This class is for testing the lookups by numeric range"""
+
+    def setUp(self) -> None:
+        """This method stores places of various prices"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.places = [Place() for _ in range(5)]
+        for place, price in zip(self.places, [40, 10, 30, 20, 50]):
+            place.price_by_night = price
+            place.number_rooms = price // 20
+
+    def test_range(self):
+        """This method tests ranges, limits and ordering"""
+        places = self.places
+        self.assertEqual(
+            self.storage.range(Place, "price_by_night", 20, 40),
+            [places[3], places[2], places[0]])
+        self.assertEqual(
+            self.storage.range("Place", "price_by_night", low=25, limit=2,
+                               reverse=True), [places[4], places[0]])
+        self.assertEqual(self.storage.range(Place, "number_rooms", high=0),
+                         [places[1]])
+
+    def test_range_not_indexed(self):
+        """This method tests a range over an attribute without index"""
+        self.assertEqual(self.storage.range(Place, "latitude", 0, 0),
+                         sorted(self.places, key=lambda place: place.id))
+
+    def test_range_follows_updates(self):
+        """This method tests that updated values are ordered again"""
+        self.storage.range(Place, "price_by_night")
+        self.places[4].price_by_night = 5
+        self.places[1].price_by_night = "ten"
+        self.storage.delete(self.places[2])
+        self.assertEqual(self.storage.range(Place, "price_by_night"),
+                         [self.places[4], self.places[3], self.places[0]])
+
+
+class TestFileStorageGeo(TestFileStorageBase):
+    """This class is for testing the lookups by position"""
+
+    def setUp(self) -> None:
+        """This method stores places around Paris"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.places = [Place() for _ in range(4)]
+        for i, place in enumerate(self.places):
+            place.latitude = 48.85 + i * 0.1
+            place.longitude = 2.35
+
+    def test_nearest_and_within(self):
+        """This method tests the nearest places and a box"""
+        places = self.places
+        self.assertEqual(self.storage.nearest(49.2, 2.35, 2),
+                         [places[3], places[2]])
+        self.assertEqual(self.storage.nearest(48.85, 2.35, None, radius=12),
+                         [places[0], places[1]])
+        self.assertEqual(sorted(self.storage.within((48.9, 2, 49.1, 3)),
+                                key=places.index), places[1:3])
+
+    def test_follows_moves(self):
+        """This method tests that moved places are indexed again"""
+        self.storage.nearest(0, 0)
+        self.places[3].latitude = 0.01
+        self.places[3].longitude = 0.01
+        self.storage.delete(self.places[0])
+        self.assertEqual(self.storage.nearest(0, 0, 2),
+                         [self.places[3], self.places[1]])
+
+    def test_class_without_index(self):
+        """This method tests a class indexed on the fly"""
+        user = User()
+        user.latitude = 1.0
+        user.longitude = 1.0
+        User()
+        self.assertEqual(self.storage.nearest(0, 0, 5, cls=User), [user])
+
+
+class TestFileStorageQuery(TestFileStorageBase):
+    """This class is for testing the planned queries"""
+
+    def setUp(self) -> None:
+        """This method stores places in two cities"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        self.places = [Place() for _ in range(20)]
+        for i, place in enumerate(self.places):
+            place.city_id = "small" if i < 2 else "big"
+            place.price_by_night = (i * 7) % 20
+            place.name = f"place {i % 3}"
+        self.places[5].price_by_night = "free"
+
+    def expected(self, test, key=None, reverse=False):
+        """This method returns the places passing test, sorted by key"""
+        places = [place for place in self.places if test(place)]
+        if key is not None:
+            places.sort(key=key, reverse=reverse)
+        return places
+
+    def test_hash_index(self):
+        """This method tests a query starting from a hash index"""
+        query = self.storage.query(Place).filter(city_id="small",
+                                                 name__ne="place 9")
+        self.assertTrue(query.explain().startswith(
+            "hash index Place.city_id (2 keys)"))
+        self.assertEqual(list(query), self.places[:2])
+
+    def test_sorted_index(self):
+        """This method tests ranges and index ordering"""
+        query = self.storage.query("Place").filter(
+            price_by_night__ge=5, price_by_night__lt=9)
+        self.assertIn("sorted index Place.price_by_night", query.explain())
+        self.assertEqual(
+            sorted(query, key=self.places.index),
+            self.expected(lambda place: place.price_by_night in (5, 6, 7, 8)
+                          and place is not self.places[5]))
+        query = self.storage.query(Place).order_by("-price_by_night")
+        self.assertIn("sorted index", query.explain())
+        results = list(query.limit(3))
+        self.assertEqual(results[0], self.places[5])
+        self.assertEqual([place.price_by_night for place in results[1:]],
+                         [19, 18])
+        self.assertEqual(len(list(query)), 20)
+
+    def test_scan_and_sort(self):
+        """This method tests a query without usable index"""
+        query = self.storage.query(Place).filter(name="place 1").order_by(
+            "id")
+        self.assertEqual(query.explain(),
+                         "scan Place (20 objects), then sort by id, then "
+                         "check name == 'place 1'")
+        self.assertEqual(list(query), self.expected(
+            lambda place: place.name == "place 1", lambda place: place.id))
+        self.assertEqual(query.count(), 7)
+        self.assertEqual(self.storage.query(Place).limit(0).all(), [])
+        self.assertIsNone(self.storage.query(User).first())
+
+    def test_lazy(self):
+        """This method tests that results are built as they are used"""
+        self.storage.save()
+        with patch.dict(os.environ, {"HBNB_FILE_LAZY": "1"}):
+            storage = self.reopen()
+        results = iter(storage.query(Place).order_by("price_by_night"))
+        first = next(results)
+        self.assertEqual(first.price_by_night, 0)
+        self.assertEqual(len(storage.all().pending), 19)
+
+    def test_lazy_dates(self):
+        """This method tests that the dates of records not built yet are
+        compared as the ones of built objects"""
+        for i, place in enumerate(self.places):
+            place.created_at = datetime(2020, 1, i + 1, 9 + i % 2)
+        self.storage.save()
+        with patch.dict(os.environ, {"HBNB_FILE_LAZY": "1"}):
+            storage = self.reopen()
+        storage.all()[f"Place.{self.places[12].id}"]
+        storage.all()[f"Place.{self.places[3].id}"]
+        ids = [place.id for place in self.places]
+        query = storage.query(Place).filter(
+            created_at__gt=datetime(2020, 1, 10))
+        self.assertEqual(sorted(place.id for place in query),
+                         sorted(ids[9:]))
+        self.assertEqual(
+            [place.id for place in storage.query(Place).order_by(
+                "created_at")], ids)
+        self.assertEqual(
+            [place.id for place in storage.query(Place).order_by(
+                "-created_at").limit(2)], ids[:-3:-1])
+        self.assertEqual(
+            storage.find(Place, created_at=self.places[4].created_at)[0].id,
+            ids[4])
+
+
+class TestFileStorageThreads(TestFileStorageBase):
+    """This class is for testing the storage shared by threads"""
+
+    def setUp(self) -> None:
+        """This method makes a fresh storage the models storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def test_concurrent_changes_and_lookups(self):
+        """This method tests threads creating, saving and iterating the
+        objects at once"""
+        errors = []
+        done = threading.Event()
+
+        def create():
+            """This function creates and saves users"""
+            try:
+                for i in range(200):
+                    User().first_name = "Betty"
+                    if i % 50 == 0:
+                        self.storage.save()
+            except Exception as error:
+                errors.append(error)
+
+        def look():
+            """This function iterates the objects until the end"""
+            try:
+                while not done.is_set():
+                    for obj in self.storage.all().values():
+                        obj.id
+                    self.storage.all(User)
+                    self.storage.find(User, first_name="Betty")
+            except Exception as error:
+                errors.append(error)
+        writers = [threading.Thread(target=create) for _ in range(4)]
+        reader = threading.Thread(target=look)
+        reader.start()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        reader.join()
+        self.storage.save()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.reopen().count(User), 800)
+
+    def test_touch_marked(self):
+        """This method tests that changing an object to write already
+        does not wait for the lock, and that a change made after a
+        lookup is indexed again"""
+        self.storage.create_index(User, "first_name")
+        user = User()
+        changer = threading.Thread(target=setattr,
+                                   args=(user, "first_name", "Betty"))
+        with self.storage._FileStorage__lock.writing():
+            changer.start()
+            changer.join(2)
+            self.assertFalse(changer.is_alive())
+        self.assertEqual(self.storage.find(User, first_name="Betty"), [user])
+        user.first_name = "Holberton"
+        self.assertEqual(self.storage.find(User, first_name="Betty"), [])
+        self.assertEqual(self.storage.find(User, first_name="Holberton"),
+                         [user])
+        self.storage.save()
+        self.assertEqual(
+            self.reopen().all()[f"User.{user.id}"].first_name, "Holberton")
+
+    def test_lookups_and_changes_during_save(self):
+        """This method tests that a save writes the state it started from
+        without holding the lock during the write"""
+        user = User()
+        writing, release = threading.Event(), threading.Event()
+        write_snapshot = serializers["json"].write_snapshot
+
+        def blocked(file, items):
+            """This function waits for the test before writing"""
+            writing.set()
+            release.wait(2)
+            write_snapshot(file, items)
+        with patch.object(serializers["json"], "write_snapshot",
+                          side_effect=blocked):
+            saver = threading.Thread(target=self.storage.save)
+            saver.start()
+            self.assertTrue(writing.wait(2))
+            self.assertIn(f"User.{user.id}", self.storage.all(User))
+            late = User()
+            user.first_name = "Betty"
+            release.set()
+            saver.join()
+        saved = self.reopen()
+        self.assertNotIn(f"User.{late.id}", saved.all())
+        self.assertNotIn("first_name", saved.all()[f"User.{user.id}"].__dict__)
+        self.storage.save()
+        saved = self.reopen()
+        self.assertIn(f"User.{late.id}", saved.all())
+        self.assertEqual(saved.all()[f"User.{user.id}"].first_name, "Betty")
+
+    def test_failed_save_keeps_changes(self):
+        """This method tests that the changes of a failed write are
+        written by the next save"""
+        user = User()
+        with patch.object(serializers["json"], "write_snapshot",
+                          side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.storage.save()
+        self.storage.save()
+        self.assertIn(f"User.{user.id}", self.reopen().all())
+
+
+def create_users(count):
+    """This function creates and saves users from a new storage, in a
+    process of its own"""
+    storage = FileStorage()
+    storage.reload()
+    models.storage = storage
+    for i in range(count):
+        User()
+        if i % 10 == 9:
+            storage.save()
+    storage.save()
+
+
+class TestFileStorageProcesses(TestFileStorageBase):
+    """This class is for testing storages of several processes sharing
+    the files"""
+
+    def setUp(self) -> None:
+        """This method saves a store of two users"""
+        super().setUp()
+        storage = FileStorage()
+        self.users = [User() for _ in range(2)]
+        for user in self.users:
+            storage.new(user)
+        storage.save()
+
+    def change(self, storage, index, **attrs):
+        """This method sets attributes of a user of storage and saves it"""
+        user = storage.all()[f"User.{self.users[index].id}"]
+        with patch.object(models, "storage", storage):
+            for name, value in attrs.items():
+                setattr(user, name, value)
+            user.save()
+
+    def test_new_objects_are_merged(self):
+        """This method tests that the saves keep the objects created by
+        the other storage"""
+        first, second = self.reopen(), self.reopen()
+        first.new(User())
+        first.save()
+        second.new(User())
+        second.save()
+        self.assertEqual(second.count(), 4)
+        self.assertEqual(self.reopen().count(), 4)
+
+    def test_changes_are_merged(self):
+        """This method tests saves of other objects changed elsewhere"""
+        first, second = self.reopen(), self.reopen()
+        self.change(first, 0, first_name="Betty")
+        self.change(second, 1, first_name="Holberton")
+        saved = self.reopen().all()
+        self.assertEqual(saved[f"User.{self.users[0].id}"].first_name,
+                         "Betty")
+        self.assertEqual(saved[f"User.{self.users[1].id}"].first_name,
+                         "Holberton")
+        self.assertEqual(second.all()[f"User.{self.users[0].id}"].first_name,
+                         "Betty")
+
+    def test_merged_object_stays_live(self):
+        """This method tests that an object changed elsewhere is updated
+        in place, so later changes through it are still saved"""
+        first, second = self.reopen(), self.reopen()
+        user = first.all()[f"User.{self.users[0].id}"]
+        self.change(second, 0, last_name="Theirs")
+        first.new(User())
+        first.save()
+        self.assertIs(first.all()[f"User.{self.users[0].id}"], user)
+        self.assertEqual(user.last_name, "Theirs")
+        with patch.object(models, "storage", first):
+            user.first_name = "Mine"
+            user.save()
+        saved = self.reopen().all()[f"User.{self.users[0].id}"]
+        self.assertEqual((saved.first_name, saved.last_name),
+                         ("Mine", "Theirs"))
+
+    def test_read_only_directory(self):
+        """This method tests that a process which can not write next to
+        the files still loads them"""
+        real_open = os.open
+
+        def read_only(path, flags, *args):
+            """This function refuses to open files for writing"""
+            if flags & (os.O_WRONLY | os.O_RDWR | os.O_CREAT):
+                raise PermissionError(13, "Permission denied", path)
+            return real_open(path, flags, *args)
+
+        with patch("os.open", side_effect=read_only):
+            self.assertEqual(self.reopen().count(User), 2)
+        os.remove(self.path + ".lock")
+        with patch("os.open", side_effect=read_only):
+            self.assertEqual(self.reopen().count(User), 2)
+
+    def test_storage_save_after_setattr(self):
+        """This method tests changes saved by storage.save() alone, as
+        the console saves them, against the other storage"""
+        first, second = self.reopen(), self.reopen()
+        key = f"User.{self.users[0].id}"
+        with patch.object(models, "storage", first):
+            first.all()[key].first_name = "Betty"
+        first.save()
+        second.new(User())
+        second.save()
+        self.assertEqual(self.reopen().all()[key].first_name, "Betty")
+        third = self.reopen()
+        with patch.object(models, "storage", second):
+            second.all()[key].first_name = "Holberton"
+        with patch.object(models, "storage", third):
+            third.all()[key].first_name = "School"
+        second.save()
+        with self.assertRaises(ConflictError):
+            third.save()
+
+    def test_deletes_are_merged(self):
+        """This method tests that a save drops the objects deleted by
+        another storage"""
+        first, second = self.reopen(), self.reopen()
+        first.delete(first.all()[f"User.{self.users[0].id}"])
+        first.save()
+        second.new(User())
+        second.save()
+        self.assertNotIn(f"User.{self.users[0].id}", second.all())
+        self.assertEqual(self.reopen().count(), 2)
+
+    def test_conflict(self):
+        """This method tests that a save of an object changed elsewhere
+        fails, and that saving again keeps its version"""
+        first, second = self.reopen(), self.reopen()
+        self.change(first, 0, first_name="Betty")
+        with self.assertRaises(ConflictError) as error:
+            self.change(second, 0, first_name="Holberton")
+        self.assertEqual(error.exception.keys, [f"User.{self.users[0].id}"])
+        saved = self.reopen().all()[f"User.{self.users[0].id}"]
+        self.assertEqual(saved.first_name, "Betty")
+        second.save()
+        saved = self.reopen().all()[f"User.{self.users[0].id}"]
+        self.assertEqual(saved.first_name, "Holberton")
+
+    def test_journal_end_only(self):
+        """This method tests that a save only reads the entries other
+        storages appended to the journal"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            first, second = self.reopen(), self.reopen()
+        self.change(first, 0, first_name="Betty")
+        json = serializers["json"]
+        with patch.object(json, "read_snapshot") as read, \
+                patch.object(json, "read_entries",
+                             wraps=json.read_entries) as entries:
+            second.new(User())
+            second.save()
+        read.assert_not_called()
+        self.assertEqual(entries.call_count, 1)
+        self.assertEqual(second.all()[f"User.{self.users[0].id}"].first_name,
+                         "Betty")
+        self.assertEqual(self.reopen().count(), 3)
+
+    def test_writer_processes(self):
+        """This method tests processes creating objects at once"""
+        context = multiprocessing.get_context("fork")
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            processes = [context.Process(target=create_users, args=(50,))
+                         for _ in range(4)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join(30)
+        self.assertEqual([process.exitcode for process in processes],
+                         [0] * 4)
+        self.assertEqual(self.reopen().count(User), 202)
+
+
+class TestFileStorageParallel(TestFileStorageBase):
+    """This class is for testing the saves encoded by forked workers"""
+
+    env = {"HBNB_FILE_WORKERS": "2", "HBNB_FILE_PARALLEL_MIN": "20"}
+
+    def setUp(self) -> None:
+        """This method stores users and places in a fresh storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        for i in range(30):
+            User().first_name = f"user {i}"
+            Place().price_by_night = i
+        self.parallel = patch.object(
+            file_storage, "_encode_parallel",
+            wraps=file_storage._encode_parallel)
+
+    def test_same_file(self):
+        """This method tests that a parallel save writes the file a save
+        in this process writes"""
+        with self.parallel as parallel:
+            self.storage.save()
+        self.assertEqual(parallel.call_count, 1)
+        with open(self.path) as file:
+            written = file.read()
+        with patch.dict(os.environ, {"HBNB_FILE_WORKERS": "1"}):
+            storage = FileStorage()
+        for obj in self.storage.all().values():
+            storage.new(obj)
+        storage.save()
+        with open(self.path) as file:
+            self.assertEqual(file.read(), written)
+
+    def test_only_big_saves(self):
+        """This method tests that the records encoded by a save are reused
+        by the next ones, which encode the few changes here"""
+        self.storage.save()
+        with self.parallel as parallel:
+            User()
+            self.storage.save()
+        parallel.assert_not_called()
+        self.assertEqual(self.reopen().count(), 61)
+
+    def test_journal(self):
+        """This method tests a big append to the journal"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+        with patch.object(models, "storage", storage):
+            for i in range(30):
+                User().first_name = f"late {i}"
+        with self.parallel as parallel:
+            storage.save()
+        self.assertEqual(parallel.call_count, 1)
+        self.assertTrue(os.path.exists(self.path + ".log"))
+        self.assertEqual(self.reopen().count(User), 30)
+
+
+class TestFileStorageParallelLoad(TestFileStorageBase):
+    """This class is for testing the sharded reloads decoded by forked
+    workers"""
+
+    env = {"HBNB_FILE_WORKERS": "2", "HBNB_FILE_PARALLEL_LOAD_MIN": "1",
+           "HBNB_FILE_SHARDED": "1"}
+
+    def setUp(self) -> None:
+        """This method saves users, places and states in shards"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        for i in range(30):
+            User().first_name = f"user {i}"
+            Place().amenity_ids = [str(i)]
+        State().name = "California"
+        self.storage.save()
+        self.pool = patch.object(file_storage, "_fork_pool",
+                                 wraps=file_storage._fork_pool)
+
+    def assertSameLoad(self):
+        """This method checks that a parallel reload loads what a reload
+        in this process loads, and returns the records"""
+        with self.pool as pool:
+            records = {key: obj.to_dict()
+                       for key, obj in self.reopen().all().items()}
+        self.assertEqual(pool.call_count, 1)
+        with patch.dict(os.environ, {"HBNB_FILE_WORKERS": "1"}):
+            serial = {key: obj.to_dict()
+                      for key, obj in self.reopen().all().items()}
+        self.assertEqual(records, serial)
+        return records
+
+    def test_shards(self):
+        """This method tests a reload of a shard per worker, in both
+        formats"""
+        self.assertEqual(len(self.assertSameLoad()), 61)
+        self.storage.convert("binary")
+        self.assertEqual(len(self.assertSameLoad()), 61)
+
+    def test_dates(self):
+        """This method tests that the workers parse the dates"""
+        pairs = file_storage._read_shard(
+            ("json", os.path.join(self.path + ".d", "State.json")))
+        self.assertEqual(len(pairs), 1)
+        self.assertIsInstance(pairs[0][1]["updated_at"], datetime)
+
+    def test_journal(self):
+        """This method tests the journal replayed after the shards"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+        with patch.object(models, "storage", storage):
+            users = list(storage.all(User).values())
+            users[0].first_name = "changed"
+            storage.delete(users[1])
+            storage.save()
+        self.assertTrue(os.path.exists(self.path + ".log"))
+        records = self.assertSameLoad()
+        self.assertEqual(len(records), 60)
+        self.assertEqual(records[f"User.{users[0].id}"]["first_name"],
+                         "changed")
+
+    def test_small_or_single_file(self):
+        """This method tests that small stores and file.json are read in
+        this process"""
+        with self.pool as pool:
+            with patch.dict(os.environ,
+                            {"HBNB_FILE_PARALLEL_LOAD_MIN": "100000000"}):
+                self.reopen()
+            with patch.dict(os.environ, {"HBNB_FILE_SHARDED": ""}):
+                self.storage.convert(sharded=False)
+                self.assertEqual(self.reopen().count(), 61)
+        pool.assert_not_called()
+
+
+class TestFileStorageCache(TestFileStorageBase):
+    """This class is for testing the fast-load cache"""
+
+    env = {"HBNB_FILE_CACHE": "1"}
+
+    def setUp(self) -> None:
+        """This method saves users in a fresh storage"""
+        super().setUp()
+        self.storage = FileStorage()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+        for i in range(10):
+            User().first_name = f"user {i}"
+        self.storage.save()
+        self.cache_path = self.path + ".cache"
+        self.read_snapshot = patch.object(
+            serializers["json"], "read_snapshot",
+            wraps=serializers["json"].read_snapshot)
+
+    def reopen(self):
+        """This method returns a new storage reloaded from the files, once
+        it wrote the cache"""
+        storage = super().reopen()
+        storage.close()
+        return storage
+
+    def dicts(self, storage):
+        """This method returns the to_dict() of the objects of storage"""
+        return {key: obj.to_dict() for key, obj in storage.all().items()}
+
+    def test_cache_used(self):
+        """This method tests that a reload of the files the cache was
+        written from loads the cache"""
+        self.assertFalse(os.path.exists(self.cache_path))
+        with self.read_snapshot as read_snapshot:
+            first = self.reopen()
+            self.assertTrue(os.path.exists(self.cache_path))
+            second = self.reopen()
+        self.assertEqual(read_snapshot.call_count, 1)
+        self.assertEqual(self.dicts(second), self.dicts(self.storage))
+        self.assertEqual(self.dicts(first), self.dicts(second))
+
+    def test_stale_cache(self):
+        """This method tests that a cache of other files is not used, and
+        is written again"""
+        self.reopen()
+        User().first_name = "late"
+        self.storage.save()
+        with self.read_snapshot as read_snapshot:
+            storage = self.reopen()
+            self.reopen()
+        self.assertEqual(read_snapshot.call_count, 1)
+        self.assertEqual(storage.count(User), 11)
+
+    def test_journal(self):
+        """This method tests a cache of a journal putting and deleting
+        objects"""
+        with patch.dict(os.environ, {"HBNB_FILE_JOURNAL": "1"}):
+            storage = self.reopen()
+            with patch.object(models, "storage", storage):
+                users = list(storage.all(User).values())
+                users[0].first_name = "changed"
+                storage.save()
+                storage.delete(users[1])
+                storage.save()
+            decoded = self.reopen()
+            with self.read_snapshot as read_snapshot:
+                cached = self.reopen()
+        read_snapshot.assert_not_called()
+        self.assertEqual(self.dicts(cached), self.dicts(decoded))
+        self.assertEqual(self.dicts(cached), self.dicts(storage))
+
+    def test_unreadable_cache(self):
+        """This method tests that a broken cache is ignored"""
+        with open(self.cache_path, "wb") as file:
+            file.write(b"not a pickle")
+        self.assertEqual(self.dicts(self.reopen()), self.dicts(self.storage))
+
+
+class TestFileStorageDeferred(TestFileStorageBase):
+    """This class is for testing the reload deferred to the first use"""
+
+    def setUp(self) -> None:
+        """This method saves users in a fresh storage"""
+        super().setUp()
+        storage = FileStorage()
+        with patch.object(models, "storage", storage):
+            for i in range(5):
+                User().first_name = f"user {i}"
+        storage.save()
+        self.read_snapshot = patch.object(
+            serializers["json"], "read_snapshot",
+            wraps=serializers["json"].read_snapshot)
+
+    def deferred(self):
+        """This method returns a new storage whose reload is deferred"""
+        storage = FileStorage()
+        storage.defer_reload()
+        self.addCleanup(storage.close)
+        return storage
+
+    def test_first_use(self):
+        """This method tests that the files are read by the first use of
+        the objects only"""
+        with self.read_snapshot as read_snapshot:
+            storage = self.deferred()
+            read_snapshot.assert_not_called()
+            self.assertEqual(storage.count(User), 5)
+            self.assertEqual(len(storage.all()), 5)
+        self.assertEqual(read_snapshot.call_count, 1)
+
+    def test_new_and_save_first(self):
+        """This method tests that creating an object and saving before
+        any lookup keep the saved objects"""
+        storage = self.deferred()
+        with patch.object(models, "storage", storage):
+            User()
+        storage.save()
+        self.assertEqual(self.reopen().count(User), 6)
+        storage = self.deferred()
+        storage.save()
+        self.assertEqual(self.reopen().count(User), 6)
+
+    def test_preload(self):
+        """This method tests that the preload thread loads the objects
+        before their first use"""
+        with self.read_snapshot as read_snapshot, \
+                patch.dict(os.environ, {"HBNB_FILE_PRELOAD": "1"}):
+            storage = self.deferred()
+            deadline = time.monotonic() + 5
+            while not read_snapshot.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(storage.count(User), 5)
+        self.assertEqual(read_snapshot.call_count, 1)
+
+    def test_preload_error(self):
+        """This method tests that a preload failing fails the first use"""
+        with open(self.path, "w") as file:
+            file.write("{not json")
+        with patch.dict(os.environ, {"HBNB_FILE_PRELOAD": "1"}):
+            storage = FileStorage()
+            storage.defer_reload()
+        for thread in threading.enumerate():
+            if thread.name == "hbnb-preload":
+                thread.join(5)
+        with self.assertRaises(ValueError):
+            storage.all()
+
+
+if __name__ == "__main__":
+    unittest.main()
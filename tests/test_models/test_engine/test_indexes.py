@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""This module is for testing the file storage indexes"""
+import random
+import unittest
+from models.engine.indexes import (GeoIndex, HashIndex, SortedIndex,
+                                   bbox_around, haversine, in_bbox)
+
+
+class TestHashIndex(unittest.TestCase):
+    """This class is for testing the equality index"""
+
+    def test_add_lookup_discard(self):
+        """This method tests indexing, looking up and removing keys"""
+        index = HashIndex("state_id")
+        index.add("City.1", "s1")
+        index.add("City.2", "s1")
+        index.add("City.3", "s2")
+        self.assertEqual(list(index.lookup("s1")), ["City.1", "City.2"])
+        index.discard("City.1")
+        index.discard("City.1")
+        self.assertEqual(list(index.lookup("s1")), ["City.2"])
+        index.discard("City.3")
+        self.assertEqual(list(index.lookup("s2")), [])
+        index.clear()
+        self.assertEqual(list(index.lookup("s1")), [])
+
+    def test_unhashable(self):
+        """This method tests that unhashable values are left out"""
+        index = HashIndex("amenity_ids")
+        index.add("Place.1", ["a"])
+        index.discard("Place.1")
+        self.assertEqual(list(index.lookup(["a"])), [])
+
+
+class TestSortedIndex(unittest.TestCase):
+    """This class is for testing the ordered index"""
+
+    def setUp(self) -> None:
+        """This method indexes a few prices"""
+        self.index = SortedIndex("price_by_night")
+        for i, price in enumerate([50, 10, 30, 30, 20.5, "40", None, True]):
+            self.index.add(f"Place.{i}", price)
+
+    def test_range(self):
+        """This method tests bounded and unbounded ranges"""
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(list(self.index.range()),
+                         ["Place.1", "Place.4", "Place.2", "Place.3",
+                          "Place.0"])
+        self.assertEqual(list(self.index.range(20, 30)),
+                         ["Place.4", "Place.2", "Place.3"])
+        self.assertEqual(list(self.index.range(30, 30, reverse=True)),
+                         ["Place.3", "Place.2"])
+        self.assertEqual(list(self.index.range(high=10)), ["Place.1"])
+        self.assertEqual(list(self.index.range(low=51)), [])
+
+    def test_discard(self):
+        """This method tests removing keys"""
+        self.index.discard("Place.2")
+        self.index.discard("Place.5")
+        self.assertEqual(list(self.index.range(30, 30)), ["Place.3"])
+        self.index.clear()
+        self.assertEqual(list(self.index.range()), [])
+
+
+class TestGeoIndex(unittest.TestCase):
+    """This class is for testing the position index"""
+
+    def setUp(self) -> None:
+        """This method indexes random points, clustered and spread"""
+        rand = random.Random(4)
+        self.points = {}
+        for i in range(300):
+            if i % 2:
+                point = (rand.uniform(48, 49), rand.uniform(2, 3))
+            else:
+                point = (rand.uniform(-90, 90), rand.uniform(-180, 180))
+            self.points[f"Place.{i}"] = point
+        self.points["Place.pole"] = (90, 0)
+        self.points["Place.east"] = (0, 180)
+        self.index = GeoIndex(cell=1)
+        for key, point in self.points.items():
+            self.index.add(key, *point)
+        self.index.add("Place.none", None, 2)
+        self.index.add("Place.far", 91, 2)
+
+    def brute_force(self, lat, lon):
+        """This method returns the (distance, key) pairs sorted by
+        distance to (lat, lon)"""
+        return sorted((haversine(lat, lon, *point), key)
+                      for key, point in self.points.items())
+
+    def test_haversine(self):
+        """This method tests the distance from Paris to London"""
+        self.assertAlmostEqual(haversine(48.8566, 2.3522, 51.5074, -0.1278),
+                               343.5, delta=0.5)
+
+    def test_nearest(self):
+        """This method tests nearest lookups against a full scan"""
+        self.assertEqual(len(self.index), len(self.points))
+        for lat, lon in [(48.5, 2.5), (-89.9, -179.9), (0, -179.99),
+                         (89.5, 100), (10, 10)]:
+            expected = self.brute_force(lat, lon)
+            self.assertEqual(self.index.nearest(lat, lon, 5), expected[:5])
+            self.assertEqual(self.index.nearest(lat, lon, None, 1000),
+                             [pair for pair in expected if pair[0] <= 1000])
+        self.assertEqual(len(self.index.nearest(0, 0, None)),
+                         len(self.points))
+
+    def test_within(self):
+        """This method tests box lookups, across the antimeridian too"""
+        for bbox in [(48.2, 2.2, 48.8, 2.8), (-10, 170, 10, -170),
+                     bbox_around(48.5, 2.5, 30), (-90, -180, 90, 180)]:
+            self.assertEqual(
+                sorted(self.index.within(bbox)),
+                sorted(key for key, point in self.points.items()
+                       if in_bbox(*point, bbox)))
+
+    def test_discard(self):
+        """This method tests removing keys"""
+        self.index.discard("Place.pole")
+        self.index.discard("Place.none")
+        self.assertNotIn("Place.pole", [key for _, key in
+                                        self.index.nearest(90, 0, 3)])
+        self.index.clear()
+        self.assertEqual(self.index.nearest(0, 0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
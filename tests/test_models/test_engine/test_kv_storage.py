@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+"""This module is for testing the key-value storage class"""
+import dbm.dumb
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import models
+from models.engine import kv_storage
+from models.engine.kv_storage import KVStorage, _SQLiteDB, _bucket, _open_db
+from models.city import City
+from models.user import User
+
+
+class TestKVStorage(unittest.TestCase):
+    """This class is for testing the key-value storage engine"""
+
+    def setUp(self) -> None:
+        """This method opens a storage on a temporary database, kept in
+        SQLite as where dbm only has dbm.dumb"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, "file.kv")
+        env_patch = patch.dict(os.environ, {"HBNB_KV_PATH": self.path})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        dbm_patch = patch.object(kv_storage, "_fast_dbm", return_value=False)
+        dbm_patch.start()
+        self.addCleanup(dbm_patch.stop)
+        self.storage = self.reopen()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def reopen(self):
+        """This method returns a new storage on the database"""
+        storage = KVStorage()
+        storage.reload()
+        self.addCleanup(storage.close)
+        return storage
+
+    def setitem(self):
+        """This method returns a patch recording the keys written"""
+        return patch.object(_SQLiteDB, "__setitem__", autospec=True,
+                            side_effect=_SQLiteDB.__setitem__)
+
+    def keys(self):
+        """This method returns the keys saved in the database"""
+        self.storage.close()
+        with _open_db(self.path) as db:
+            keys = sorted(key.decode() for key in db.keys())
+        self.storage.reload()
+        return keys
+
+    def test_save_reload_delete(self):
+        """This method tests the storage contract"""
+        user = User()
+        user.email = "a@b.c"
+        city = City()
+        self.storage.save()
+        self.assertEqual(self.keys(), sorted([
+            f"User.{user.id}", f"City.{city.id}",
+            f"index:User:{_bucket(user.id)}",
+            f"index:City:{_bucket(city.id)}"]))
+        other = self.reopen()
+        self.assertEqual(other.count(), 2)
+        self.assertEqual(other.all(User)[f"User.{user.id}"].to_dict(),
+                         user.to_dict())
+        self.storage.delete(city)
+        self.storage.delete(None)
+        self.storage.save()
+        self.assertNotIn(f"City.{city.id}", self.keys())
+        self.assertEqual(self.storage.count(City), 0)
+        self.assertEqual(list(self.storage.all()), [f"User.{user.id}"])
+
+    def test_use_after_close(self):
+        """This method tests that the database is opened again by the
+        first use after close()"""
+        user = User()
+        self.storage.save()
+        self.storage.close()
+        city = City()
+        self.storage.save()
+        self.storage.close()
+        storage = KVStorage()
+        self.addCleanup(storage.close)
+        self.assertEqual(list(storage.all(User)), [f"User.{user.id}"])
+        self.assertEqual(list(storage.all(City)), [f"City.{city.id}"])
+
+    def test_one_key_per_change(self):
+        """This method tests that a save writes the changed keys only"""
+        users = [User() for _ in range(3)]
+        self.storage.save()
+        self.storage.close()
+        storage = self.reopen()
+        with patch.object(models, "storage", storage):
+            user = storage.all(User)[f"User.{users[1].id}"]
+            user.first_name = "Betty"
+        with self.setitem() as setitem:
+            storage.save()
+        self.assertEqual([call.args[1] for call in setitem.call_args_list],
+                         [f"User.{users[1].id}"])
+
+    def test_create_writes_one_bucket(self):
+        """This method tests that a create rewrites the index bucket of
+        its id only"""
+        for _ in range(300):
+            User()
+        self.storage.save()
+        user = User()
+        with self.setitem() as setitem:
+            self.storage.save()
+        bucket = f"index:User:{_bucket(user.id)}"
+        self.assertEqual(sorted(call.args[1] for call in
+                                setitem.call_args_list),
+                         sorted([f"User.{user.id}", bucket]))
+        self.assertLess(len(setitem.call_args_list[-1].args[2]), 300)
+        self.assertEqual(self.reopen().count(User), 301)
+
+    def test_save_cost_flat(self):
+        """This method tests that saving one object in a big store runs
+        the statements of its keys alone, as many as in a small one"""
+        def statements():
+            """This function returns the SQL of saving a new, an updated
+            and a deleted user"""
+            statements = []
+            connection = self.storage._KVStorage__db._SQLiteDB__connection
+            connection.set_trace_callback(statements.append)
+            users = self.storage.all(User).values()
+            updated, deleted = sorted(users, key=lambda user: user.id)[:2]
+            User()
+            updated.first_name = "Betty"
+            self.storage.delete(deleted)
+            self.storage.save()
+            connection.set_trace_callback(None)
+            return statements
+        for _ in range(10):
+            User()
+        self.storage.save()
+        small = statements()
+        for _ in range(500):
+            User()
+        self.storage.save()
+        big = statements()
+        # a statement or two for each of the 3 users and 3 buckets at most
+        self.assertLessEqual(len(small), 14)
+        self.assertLessEqual(len(big), 14)
+        self.assertFalse([sql for sql in big if "WHERE" not in sql
+                          and sql.startswith(("SELECT", "DELETE"))])
+        self.assertEqual(self.reopen().count(User), 510)
+
+    def test_dbm_dumb(self):
+        """This method tests that only new databases are kept in SQLite
+        when dbm only has dbm.dumb, the ones of dbm being opened by dbm"""
+        self.assertIsInstance(self.storage._KVStorage__db, _SQLiteDB)
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")
+                .fetchall(), [("Dict",)])
+        path = os.path.join(self.tmp_dir, "dumb.kv")
+        with dbm.dumb.open(path, "c") as db:
+            db["index:User:0"] = "1"
+        with _open_db(path) as db:
+            self.assertNotIsInstance(db, _SQLiteDB)
+            self.assertEqual(db["index:User:0"], b"1")
+
+    def test_legacy_index(self):
+        """This method tests that the single index key of an older
+        database is split into buckets"""
+        users = [User() for _ in range(3)]
+        self.storage.save()
+        self.storage.close()
+        with _open_db(self.path) as db:
+            for key in list(db.keys()):
+                if key.startswith(b"index:"):
+                    del db[key]
+            db["index:User"] = "\n".join(user.id for user in users)
+        storage = self.reopen()
+        self.assertEqual(storage.count(User), 3)
+        storage.save()
+        storage.close()
+        self.assertNotIn("index:User", self.keys())
+        self.assertEqual(sorted(self.reopen().all(User)),
+                         sorted(f"User.{user.id}" for user in users))
+
+    def test_reads_one_class(self):
+        """This method tests that the other classes are not read"""
+        user = User()
+        City()
+        self.storage.save()
+        storage = self.reopen()
+        self.assertEqual(storage.count(City), 1)
+        self.assertEqual(list(storage.all(User)), [f"User.{user.id}"])
+        self.assertEqual(len(storage.all(City)), 1)
+
+    def test_query(self):
+        """This method tests finding objects"""
+        cities = [City() for _ in range(3)]
+        for i, city in enumerate(cities):
+            city.state_id = "s1" if i else "s2"
+            city.name = str(i)
+        self.assertEqual(self.storage.find(City, state_id="s1"), cities[1:])
+        query = self.storage.query(City).order_by("-name").limit(2)
+        self.assertEqual(query.explain(),
+                         "scan index:City (3 keys), then sort by name")
+        self.assertEqual(list(query), [cities[2], cities[1]])
+
+    def test_no_file_storage(self):
+        """This method tests that the key-value mode does not load the
+        file storage"""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ, PYTHONPATH=root, HBNB_TYPE_STORAGE="kv")
+        output = subprocess.run(
+            [sys.executable, "-c", "import sys, models; print("
+             "'models.engine.file_storage' in sys.modules)"],
+            cwd=self.tmp_dir, env=env, capture_output=True, text=True,
+            check=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+
+if __name__ == "__main__":
+    unittest.main()
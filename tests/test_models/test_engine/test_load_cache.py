@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""This module is for testing the fast-load cache of the file storage"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from models.engine.load_cache import LoadCache, LoadState
+
+
+class TestLoadState(unittest.TestCase):
+    """This class is for testing the decoded state of the files"""
+
+    def test_collect_replay(self):
+        """This method tests that the state keeps the last record of every
+        key in the order of the reload"""
+        state = LoadState()
+        triples = [("User.1", {"n": 1}, False), ("User.2", {"n": 2}, False),
+                   ("User.1", None, True), ("Place.3", {"n": 3}, True),
+                   ("User.1", {"n": 4}, True), ("User.2", None, True)]
+        self.assertEqual(list(state.collect(triples)), triples)
+        self.assertEqual(state.records, {"Place.3": {"n": 3},
+                                         "User.1": {"n": 4}})
+        self.assertEqual(state.deleted, {"User.2"})
+        self.assertEqual(state.log_entries, 4)
+        self.assertEqual(state.journaled, {"User", "Place"})
+        self.assertEqual(list(state.replay()), [
+            ("User.2", None, True), ("Place.3", {"n": 3}, False),
+            ("User.1", {"n": 4}, False)])
+
+
+class TestLoadCache(unittest.TestCase):
+    """This class is for testing the cache file"""
+
+    def setUp(self) -> None:
+        """This method creates a state to cache in a temporary directory"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = LoadCache(os.path.join(self.tmp_dir, "file.json.cache"))
+        self.key = {"file.json": (10, 20, b"hash")}
+        self.state = LoadState()
+        triples = [(f"User.{i}", {"n": i}, False) for i in range(5)]
+        triples.append(("User.0", None, True))
+        list(self.state.collect(triples))
+
+    def tearDown(self) -> None:
+        """This method removes the temporary directory"""
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_read(self):
+        """This method tests reading back a state written in chunks"""
+        with patch.object(LoadCache, "chunk", 2):
+            self.cache.write(self.key, self.state)
+        state = self.cache.read(self.key)
+        self.assertEqual(list(state.records.items()),
+                         list(self.state.records.items()))
+        self.assertEqual(state.deleted, {"User.0"})
+        self.assertEqual(state.log_entries, 1)
+        self.assertEqual(state.journaled, {"User"})
+        self.assertEqual(os.listdir(self.tmp_dir), ["file.json.cache"])
+
+    def test_stale(self):
+        """This method tests that a cache of other files is not read"""
+        self.assertIsNone(self.cache.read(self.key))
+        self.cache.write(self.key, self.state)
+        self.assertIsNone(self.cache.read({"file.json": (10, 21, b"hash")}))
+        with patch.object(LoadCache, "version", 2):
+            self.assertIsNone(self.cache.read(self.key))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""This module is for testing the file storage locks"""
+import threading
+import time
+import unittest
+from models.engine.locks import RWLock, Sequencer
+
+
+class TestRWLock(unittest.TestCase):
+    """This class is for testing the readers-writer lock"""
+
+    def test_readers_share(self):
+        """This method tests that readers hold the lock together"""
+        lock = RWLock()
+        barrier = threading.Barrier(3, timeout=2)
+
+        def read():
+            """This function waits for the other readers inside the lock"""
+            with lock.reading():
+                barrier.wait()
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        with lock.reading():
+            barrier.wait()
+        for thread in threads:
+            thread.join()
+
+    def test_writer_excludes(self):
+        """This method tests that a writer waits for the readers and keeps
+        new readers out"""
+        lock = RWLock()
+        events = []
+        writing = threading.Event()
+
+        def write():
+            """This function records when it holds the write side"""
+            writing.set()
+            with lock.writing():
+                events.append("write")
+
+        def read():
+            """This function records when it holds the read side"""
+            with lock.reading():
+                events.append("late read")
+        with lock.reading():
+            writer = threading.Thread(target=write)
+            writer.start()
+            writing.wait()
+            time.sleep(0.05)
+            reader = threading.Thread(target=read)
+            reader.start()
+            time.sleep(0.05)
+            events.append("read")
+        writer.join()
+        reader.join()
+        self.assertEqual(events, ["read", "write", "late read"])
+
+    def test_reentrant(self):
+        """This method tests taking the lock again in the same thread"""
+        lock = RWLock()
+        with lock.writing():
+            with lock.writing():
+                with lock.reading():
+                    pass
+        with lock.reading():
+            with lock.reading():
+                pass
+        with lock.writing():
+            pass
+
+    def test_errors(self):
+        """This method tests upgrading and releasing a lock not held"""
+        lock = RWLock()
+        with lock.reading():
+            with self.assertRaises(RuntimeError):
+                lock.acquire_write()
+        with self.assertRaises(RuntimeError):
+            lock.release_read()
+        with self.assertRaises(RuntimeError):
+            lock.release_write()
+
+
+class TestSequencer(unittest.TestCase):
+    """This class is for testing the ordered sections"""
+
+    def test_ticket_order(self):
+        """This method tests that turns follow the tickets, even when a
+        failing section ends its turn"""
+        sequencer = Sequencer()
+        tickets = [sequencer.ticket() for _ in range(5)]
+        order = []
+
+        def run(ticket):
+            """This function records its turn and fails on the second"""
+            try:
+                with sequencer.turn(ticket):
+                    order.append(ticket)
+                    if ticket == 1:
+                        raise ValueError(ticket)
+            except ValueError:
+                pass
+        threads = [threading.Thread(target=run, args=(ticket,))
+                   for ticket in reversed(tickets)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(order, tickets)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""This module is for testing the declarative queries"""
+import unittest
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+from models.engine.query import Query, sort_key, to_sql
+
+
+Base = declarative_base()
+
+
+class Room(Base):
+    """This class is a table to compile queries against"""
+    __tablename__ = "rooms"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(16))
+    price = Column(Integer)
+
+
+class TestQuery(unittest.TestCase):
+    """This class is for testing the query building"""
+
+    def test_chaining(self):
+        """This method tests that each call returns a new query"""
+        query = Query("Place", None)
+        refined = query.filter(price__ge=10, city_id="c").order_by("-price")
+        refined = refined.limit(3)
+        self.assertEqual(query.filters, ())
+        self.assertIsNone(query.ordering)
+        self.assertEqual(refined.filters,
+                         (("price", "ge", 10), ("city_id", "eq", "c")))
+        self.assertEqual(refined.ordering, ("price", True))
+        self.assertEqual(refined.max_results, 3)
+        with self.assertRaises(ValueError):
+            query.filter(price__between=(1, 2))
+
+    def test_matches(self):
+        """This method tests the operators"""
+        values = {"price": 10, "name": "loft", "tags": ["a", "b"]}
+        query = Query("Place", None)
+        for criteria, expected in [
+                ({"price": 10}, True), ({"price__ne": 10}, False),
+                ({"price__lt": 11, "price__gt": 9}, True),
+                ({"price__le": 9}, False), ({"price__ge": "10"}, False),
+                ({"name__in": ["loft", "flat"]}, True),
+                ({"tags__contains": "b"}, True), ({"missing": None}, True)]:
+            self.assertEqual(query.filter(**criteria).matches(values.get),
+                             expected, criteria)
+
+    def test_sort_key(self):
+        """This method tests ordering values of mixed types"""
+        values = ["b", None, 2, 1.5, "a", float("nan")]
+        self.assertEqual(sorted(values, key=sort_key)[:4], [1.5, 2, "a", "b"])
+
+    def test_to_sql(self):
+        """This method tests the compiled query against SQLite"""
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add_all([Room(name=name, price=price) for name, price in
+                             [("a", 10), ("b", 30), ("c", 20), ("d", 40)]])
+            session.commit()
+            query = Query(Room, None).filter(
+                price__ge=20, name__in=["b", "c", "d"]).order_by("-price")
+            sql = to_sql(session.query(Room), query.limit(2))
+            self.assertIn("ORDER BY rooms.price DESC", str(sql))
+            self.assertEqual([room.name for room in sql], ["d", "b"])
+            sql = to_sql(session.query(Room),
+                         Query(Room, None).filter(name__contains="c"))
+            self.assertEqual([room.name for room in sql], ["c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""This module is for testing the file storage serializers"""
+import json
+import marshal
+import tempfile
+import unittest
+from datetime import datetime
+from io import BytesIO, StringIO
+from models.engine.serializers import (BinarySerializer, JSONSerializer,
+                                       _iter_json_object, detect)
+
+
+class TestIterJsonObject(unittest.TestCase):
+    """This class is for testing the streaming JSON object parser"""
+
+    def test_matches_json_load(self):
+        """This method tests the parser against json.loads"""
+        data = {f"User.{i}": {"id": str(i), "text": "x" * (i * 37 % 300),
+                              "list": [i, 1.5, None, {"k": "}\\\""}]}
+                for i in range(200)}
+        for text in (json.dumps(data), json.dumps(data, indent=4)):
+            for chunk_size in (1, 7, 4096):
+                self.assertEqual(
+                    dict(_iter_json_object(StringIO(text), chunk_size)),
+                    data)
+
+    def test_empty(self):
+        """This method tests empty files and empty objects"""
+        self.assertEqual(list(_iter_json_object(StringIO(""))), [])
+        self.assertEqual(list(_iter_json_object(StringIO(" {} "))), [])
+
+    def test_invalid(self):
+        """This method tests that broken files raise ValueError"""
+        for text in ("[]", '{"a": {}', '{"a" {}}', '{"a": {} "b": {}}'):
+            with self.assertRaises(ValueError):
+                list(_iter_json_object(StringIO(text), 2))
+
+
+class TestSerializers(unittest.TestCase):
+    """This class is for testing the snapshot and journal encodings"""
+
+    record = {"id": "1", "__class__": "Place",
+              "created_at": datetime(2024, 3, 11, 12, 0, 0, 5),
+              "updated_at": datetime(1960, 1, 1), "name": "Loft",
+              "price_by_night": 2 ** 40, "latitude": 37.5,
+              "amenity_ids": ["a", "b"], "extra": None}
+
+    def round_trip(self, serializer, stream):
+        """This method writes a snapshot and a journal and reads them"""
+        snapshot = stream()
+        serializer.write_snapshot(
+            snapshot, [("Place.1", serializer.encode(self.record))])
+        journal = stream()
+        serializer.begin(journal)
+        serializer.write_entry(journal, "Place.1",
+                               serializer.encode(self.record))
+        serializer.write_entry(journal, "Place.1")
+        snapshot.seek(0)
+        journal.seek(0)
+        return (list(serializer.read_snapshot(snapshot)),
+                list(serializer.read_entries(journal)), journal)
+
+    def test_binary(self):
+        """This method tests the binary round trip keeps datetimes"""
+        records, entries, journal = self.round_trip(BinarySerializer(),
+                                                    BytesIO)
+        self.assertEqual(records, [("Place.1", self.record)])
+        self.assertEqual(entries, [("Place.1", self.record),
+                                   ("Place.1", None)])
+        torn = BytesIO(journal.getvalue()[:-3])
+        self.assertEqual(list(BinarySerializer().read_entries(torn)),
+                         [("Place.1", self.record)])
+
+    def test_binary_tuples_become_lists(self):
+        """This method tests that only datetimes come back as such"""
+        serializer = BinarySerializer()
+        record = serializer.decode(serializer.encode({"pair": (1, 2)}))
+        self.assertEqual(record, {"pair": [1, 2]})
+
+    def test_json(self):
+        """This method tests the JSON round trip"""
+        records, entries, journal = self.round_trip(JSONSerializer(),
+                                                    StringIO)
+        expected = dict(self.record,
+                        created_at=self.record["created_at"].isoformat(),
+                        updated_at=self.record["updated_at"].isoformat())
+        self.assertEqual(records, [("Place.1", expected)])
+        self.assertEqual(entries, [("Place.1", expected),
+                                   ("Place.1", None)])
+
+    def test_binary_marshal_versions(self):
+        """This method tests that the files of the older marshal versions
+        are read and the ones of newer versions refused"""
+        serializer = BinarySerializer()
+        entry = BytesIO()
+        serializer.write_entry(entry, "Place.1",
+                               marshal.dumps({"name": "Home"}, 2))
+        for version, readable in ((2, True), (marshal.version, True),
+                                  (marshal.version + 1, False)):
+            file = BytesIO(BinarySerializer.magic + bytes([1, version]) +
+                           entry.getvalue())
+            if readable:
+                self.assertEqual(list(serializer.read_entries(file)),
+                                 [("Place.1", {"name": "Home"})])
+            else:
+                with self.assertRaises(ValueError):
+                    list(serializer.read_entries(file))
+        self.assertEqual(BinarySerializer.header[-1], 4)
+
+    def test_detect(self):
+        """This method tests the format detection"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = tmp_dir + "/file"
+            self.assertIsNone(detect(path))
+            with open(path, "wb") as file:
+                file.write(BinarySerializer.header)
+            self.assertIsInstance(detect(path), BinarySerializer)
+            with open(path, "w") as file:
+                file.write("{}")
+            self.assertIsInstance(detect(path), JSONSerializer)
+
+
+if __name__ == "__main__":
+    unittest.main()
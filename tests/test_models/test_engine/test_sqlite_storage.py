@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+"""This module is for testing the SQLite storage class"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import models
+from models.engine.sqlite_storage import SQLiteStorage
+from models.city import City
+from models.place import Place
+from models.user import User
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """This class is for testing the SQLite storage engine"""
+
+    def setUp(self) -> None:
+        """This method opens a storage on a temporary database"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "file.db")
+        env_patch = patch.dict(os.environ, {"HBNB_SQLITE_PATH": self.path})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        self.storage = self.reopen()
+        storage_patch = patch.object(models, "storage", self.storage)
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+    def tearDown(self) -> None:
+        """This method closes the storages and removes the database"""
+        self.storage.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def reopen(self):
+        """This method returns a new storage loaded from the database"""
+        storage = SQLiteStorage()
+        storage.reload()
+        self.addCleanup(storage.close)
+        return storage
+
+    def rows(self):
+        """This method returns the committed rows by key"""
+        with sqlite3.connect(self.path) as connection:
+            return dict(connection.execute("SELECT key, data FROM objects"))
+
+    def test_wal(self):
+        """This method tests that the database is in WAL mode"""
+        with sqlite3.connect(self.path) as connection:
+            mode, = connection.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode, "wal")
+
+    def test_save_reload_delete(self):
+        """This method tests the storage contract"""
+        user = User()
+        user.email = "a@b.c"
+        city = City()
+        self.assertEqual(self.rows(), {})
+        self.storage.save()
+        self.assertEqual(set(self.rows()), {f"User.{user.id}",
+                                            f"City.{city.id}"})
+        reloaded = self.reopen()
+        self.assertEqual(reloaded.count(), 2)
+        self.assertEqual(reloaded.all(User)[f"User.{user.id}"].to_dict(),
+                         user.to_dict())
+        self.storage.delete(city)
+        self.storage.delete(None)
+        self.storage.save()
+        self.assertEqual(list(self.rows()), [f"User.{user.id}"])
+        self.assertEqual(self.storage.count(City), 0)
+
+    def test_read_keeps_changes_pending(self):
+        """This method tests that a query sees the pending changes without
+        holding the write lock or taking them from the next save"""
+        city = City()
+        city.name = "Tulsa"
+        self.assertEqual(self.storage.find(City, name="Tulsa"), [city])
+        self.assertFalse(self.storage._SQLiteStorage__connection
+                         .in_transaction)
+        with sqlite3.connect(self.path, timeout=0) as connection:
+            connection.execute("INSERT INTO objects VALUES (?, ?, ?)",
+                               ("User.other", "User", "{}"))
+        self.assertEqual(self.rows().keys(), {"User.other"})
+        self.storage.close()
+        self.storage.save()
+        self.assertEqual(set(self.rows()), {"User.other",
+                                            f"City.{city.id}"})
+
+    def test_use_after_close(self):
+        """This method tests that the database is opened again by the
+        first use after close()"""
+        user = User()
+        self.storage.save()
+        self.storage.close()
+        city = City()
+        city.name = "Tulsa"
+        self.storage.save()
+        self.assertEqual(set(self.rows()), {f"User.{user.id}",
+                                            f"City.{city.id}"})
+        self.storage.close()
+        self.assertEqual(self.storage.find(City, name="Tulsa"), [city])
+        self.storage.close()
+        self.assertEqual(len(list(self.storage.query(User))), 1)
+
+    def test_incremental_save(self):
+        """This method tests that a save only writes the changed rows"""
+        users = [User() for _ in range(3)]
+        self.storage.save()
+        users[1].first_name = "Betty"
+        statements = []
+        self.storage._SQLiteStorage__connection.set_trace_callback(
+            statements.append)
+        self.storage.save()
+        writes = [sql for sql in statements if sql.startswith("INSERT")]
+        self.assertEqual(len(writes), 1)
+        self.assertIn(users[1].id, writes[0])
+
+    def test_unsaved_changes_are_dropped(self):
+        """This method tests that closing drops the changes not saved"""
+        City()
+        self.storage.find(City)
+        self.storage.close()
+        self.assertEqual(self.rows(), {})
+
+    def test_find_and_query(self):
+        """This method tests the indexed lookups"""
+        places = [Place() for _ in range(6)]
+        for i, place in enumerate(places):
+            place.city_id = "c1" if i < 2 else "c2"
+            place.price_by_night = i * 10
+        places[5].price_by_night = "free"
+        self.assertCountEqual(self.storage.find(Place, city_id="c1"),
+                              places[:2])
+        query = self.storage.query(Place).filter(city_id="c2")
+        self.assertIn("USING INDEX objects_city_id", query.explain())
+        query = self.storage.query("Place").filter(
+            price_by_night__ge=20).order_by("-price_by_night").limit(2)
+        self.assertIn("objects_price_by_night", query.explain())
+        self.assertEqual(list(query), [places[4], places[3]])
+        self.assertCountEqual(
+            self.storage.query(Place).filter(price_by_night__in=[0, 10],
+                                             name__ne="x").all(),
+            places[:2])
+        self.assertEqual(
+            self.storage.query(Place).filter(city_id__contains="1").count(),
+            2)
+
+    def test_rows_of_other_storages(self):
+        """This method tests that queries return rows saved elsewhere"""
+        other = self.reopen()
+        with patch.object(models, "storage", other):
+            city = City()
+            city.state_id = "s"
+        other.save()
+        found = self.storage.find(City, state_id="s")
+        self.assertEqual([obj.id for obj in found], [city.id])
+        self.assertIs(self.storage.find(City)[0], found[0])
+
+    def test_no_file_storage(self):
+        """This method tests that the SQLite mode does not load the file
+        storage"""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ, PYTHONPATH=root, HBNB_TYPE_STORAGE="sqlite")
+        output = subprocess.run(
+            [sys.executable, "-c", "import sys, models; print("
+             "'models.engine.file_storage' in sys.modules)"],
+            cwd=self.tmp_dir, env=env, capture_output=True, text=True,
+            check=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+
+if __name__ == "__main__":
+    unittest.main()